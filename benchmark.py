@@ -0,0 +1,30 @@
+"""Run the benchmarks."""
+import importlib
+import os
+import sys
+
+
+def main():
+    """Run the benchmarks included in the scripts.
+
+    Only the benchmarks containing one of the arguments given to the script in
+    their name are run. If no arguments are given every benchmark is run.
+
+    Note:
+        The scripts for benchmarks should end with ``_benchmark.py`` and have a
+        ``main`` function.
+    """
+    for directory, dirnames, filenames in sorted(os.walk('webarchiver')):
+        for filename in sorted(filenames):
+            if not filename.endswith('_benchmark.py'):
+                continue
+            name = os.path.join(directory, filename)[:-3] \
+                .replace(os.sep, '.')
+            if len(sys.argv) > 1 \
+                    and not any(a in name for a in sys.argv[1:]):
+                continue
+            print('Running {}.'.format(name))
+            importlib.import_module(name).main()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Bloom filter for memory-bounded membership checks."""
+import hashlib
+import math
+import os
+import struct
+
+from webarchiver.config import *
+
+HEADER = struct.Struct('!4sQQQ')
+"""The header of a saved filter: magic, number of bits, number of hashes and
+number of items."""
+
+MAGIC = b'WABF'
+
+
+class BloomFilter:
+    """A Bloom filter.
+
+    A Bloom filter tells if an item was possibly added or definitely not
+    added, using a fixed amount of memory. The chance an item that was not
+    added is reported as added is the false positive rate the filter was
+    sized for, as long as no more items than the capacity are added.
+
+    Attributes:
+        size (int): The number of bits in the filter.
+        hashes (int): The number of bits set for an item.
+        count (int): The number of items added to the filter.
+    """
+
+    def __init__(self, capacity=URL_FILTER_CAPACITY,
+                 error_rate=URL_FILTER_ERROR_RATE):
+        """Inits an empty filter.
+
+        The number of bits and hashes are calculated from the expected number
+        of items and the false positive rate.
+
+        Args:
+            capacity (int, optional): The expected number of items. Default is
+                ``URL_FILTER_CAPACITY``.
+            error_rate (float, optional): The false positive rate. Default is
+                ``URL_FILTER_ERROR_RATE``.
+        """
+        size = math.ceil(-capacity * math.log(error_rate) / math.log(2)**2)
+        self.size = max(size, 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        """Gets the positions of the bits for an item.
+
+        Two 64-bit hashes are taken from a single BLAKE2 digest and combined
+        for every position.
+
+        Args:
+            item (str): The item.
+
+        Returns:
+            generator of int: The positions of the bits.
+        """
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        size = self.size
+        return ((h1 + i * h2) % size for i in range(self.hashes))
+
+    def add(self, item):
+        """Adds an item to the filter.
+
+        Args:
+            item (str): The item to add.
+        """
+        bits = self._bits
+        for position in self._positions(item):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        """Checks if an item was possibly added to the filter.
+
+        Args:
+            item (str): The item to check.
+
+        Returns:
+            bool: True if the item was possibly added, False if it definitely
+                was not added.
+        """
+        bits = self._bits
+        for position in self._positions(item):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def save(self, path):
+        """Saves the filter to a file.
+
+        The file is written to a temporary file first and then moved, so an
+        interrupted save does not leave a broken file.
+
+        Args:
+            path (str): The path to save the filter to.
+        """
+        with open(path + '.tmp', 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.size, self.hashes, self.count))
+            f.write(self._bits)
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path):
+        """Loads a filter from a file.
+
+        Args:
+            path (str): The path to load the filter from.
+
+        Returns:
+            :obj:`BloomFilter`: The loaded filter, or None if the file does
+                not exist or is not a valid filter.
+        """
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return None
+            magic, size, hashes, count = HEADER.unpack(header)
+            bits = bytearray(f.read())
+        if magic != MAGIC or len(bits) != (size + 7) // 8:
+            return None
+        bloom_filter = cls.__new__(cls)
+        bloom_filter.size = size
+        bloom_filter.hashes = hashes
+        bloom_filter.count = count
+        bloom_filter._bits = bits
+        return bloom_filter
+
+    def __repr__(self):
+        return '<{} at 0x{:x} size={} hashes={} count={}>' \
+            .format(__name__, id(self), self.size, self.hashes, self.count)
@@ -0,0 +1,42 @@
+"""Tests for bloom.py."""
+import os
+import tempfile
+import unittest
+
+from webarchiver.bloom import BloomFilter
+
+
+class TestBloomFilter(unittest.TestCase):
+    """Tests for the Bloom filter."""
+
+    def test_added(self):
+        f = BloomFilter(1000, 0.01)
+        for i in range(1000):
+            f.add('https://example.com/{}'.format(i))
+        for i in range(1000):
+            self.assertIn('https://example.com/{}'.format(i), f)
+        self.assertEqual(len(f), 1000)
+
+    def test_false_positive_rate(self):
+        f = BloomFilter(10000, 0.01)
+        for i in range(10000):
+            f.add('https://example.com/{}'.format(i))
+        false_positives = sum('https://example.org/{}'.format(i) in f
+                              for i in range(10000))
+        self.assertLess(false_positives, 200)
+
+    def test_save_load(self):
+        f = BloomFilter(1000, 0.01)
+        f.add('https://example.com/')
+        path = os.path.join(tempfile.mkdtemp(), 'test.bloom')
+        f.save(path)
+        loaded = BloomFilter.load(path)
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+        self.assertIn('https://example.com/', loaded)
+        self.assertNotIn('https://example.org/', loaded)
+        self.assertEqual((loaded.size, loaded.hashes, loaded.count),
+                         (f.size, f.hashes, f.count))
+
+    def test_load_missing(self):
+        self.assertIsNone(BloomFilter.load('does_not_exist.bloom'))
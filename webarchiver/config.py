@@ -7,6 +7,8 @@ REQUEST_STAGER_TIME = 120
 REQUEST_UPLOAD_TIME = 5
 PING_TIME = 60
 MAX_BACKUPS = 3
+HASH_RING_REPLICAS = 64
+HASH_RING_BY_HOST = True
 MAX_STAGER = 5
 MAX_SPACE = 1000000000
 
@@ -16,18 +18,43 @@ LOG_PATH = os.path.join(LOGS_DIRECTORY, '{}.log'
                                     .strftime('%Y%m%d%H%M%S')))
 
 URL_QUOTA_TIME = 2
+QUOTA_LEASE_TIME = 10
+QUOTA_LEASE_WAIT = 5
+QUOTA_BURST_TIME = 20
 
 LISTEN_QUEUE = 300
+SOCKET_READ_SIZE = 65536
+SOCKET_WRITE_BATCH = 1024
+FILE_CHUNK_SIZE = 1048576
+WIRE_CODECS = [1]
+BATCH_MAX_ITEMS = 500
+BATCH_MAX_WAIT = 1
 
 NEW_JOBS_DIR = 'jobs'
 JOB_MAX_URLS = 1000
 JOB_MAX_WAIT = 300
 JOB_MAX_WAIT_URLS = 30
+JOB_RETRY_WAIT = 1
+FRONTIER_HOST_CRAWLS = 2
+FRONTIER_HOST_BATCH = JOB_MAX_URLS
+FRONTIER_HOST_DELAY = 1
 JOBS_CHECK_TIME = 5
+JOBS_START_TIME = 1
 FINISH_CHECK_TIME = 60
 
 CRAWLER_MIN_URL_QUOTA = 100
+CRAWLER_INITIAL_RATE = 1
+CRAWLER_MIN_RATE = 0.01
+CRAWLER_RATE_WINDOW = 5
+CRAWLER_RATE_ALPHA = 0.3
+CRAWLER_HEAP_MAX_OUTDATED = 1000
 CRAWL_SCRIPTS = 'crawl'
+CRAWL_WORKERS = 4
+CRAWL_QUEUE_SIZE = 8
+HANDOFF_QUEUE_SIZE = 100000
+CRAWL_PROCESSES = os.cpu_count() or 1
+CRAWL_REPORT_TIME = 300
+CRAWL_ENGINE = 'wget'
 CRAWLS_NEW_URLS_FILE = 'new_urls.txt'
 CRAWLS_DIRECTORY = 'data'
 WGET_EXIT_CODES = [0, 4, 6, 8]
@@ -38,8 +65,27 @@ WGET_TEMP = 'wget.tmp'
 WGET_TIMEOUT = '30'
 WGET_WAITRETRY = '30'
 WGET_TRIES = '5'
+FETCH_CONNECTIONS = 16
+FETCH_CONNECTIONS_PER_HOST = 2
+FETCH_TIMEOUT = 30
+FETCH_TRIES = 3
+FETCH_READ_SIZE = 65536
+FETCH_SPOOL_SIZE = 1048576
+WARC_SPOOL_SIZE = 1048576
+SCAN_CHUNK_SIZE = 1048576
+SCAN_CACHE_SIZE = 4096
 VERSION = '0.0.1'
 DEDUPLICATION_SERVER = None
+DEDUPLICATION_DATABASE = os.path.join(CRAWLS_DIRECTORY, 'payloads')
+DEDUPLICATION_CACHE_SIZE = 65536
+DEDUPLICATION_BATCH_SIZE = 100
+DEDUPLICATION_REMOTE_CONNECTIONS = 8
+DATABASE_COMMIT_CHANGES = 10000
+DATABASE_COMMIT_TIME = 10
+DATABASE_LOOKUP_CHUNK = 500
+DATABASE_TIMEOUT = 60
+URL_FILTER_CAPACITY = 5000000
+URL_FILTER_ERROR_RATE = 0.001
 FILES = []
 
 DEFAULT_CRAWLER_SERVER_CONFIG = {
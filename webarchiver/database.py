@@ -1,7 +1,14 @@
 """Databases used in webarchiver."""
+import hashlib
+import itertools
 import logging
 import os
 import sqlite3
+import time
+
+from webarchiver.config import *
+from webarchiver.dicts import LruDict
+from webarchiver.utils import strip_url_scheme
 
 logger = logging.getLogger(__name__)
 
@@ -16,23 +23,49 @@ class BaseDatabase:
         yet appended. Synchronous mode can be ``OFF`` or ``ON``. Journal mode
         can be ``OFF``, ``WAL`` or ``MEMORY``. See
         `SQLite PRAGMA statements <https://www.sqlite.org/pragma.html>`_ for
-        information about these options.
+        information about these options. A connection waits up to
+        ``DATABASE_TIMEOUT`` seconds for the database to be unlocked by
+        another connection.
         """
         assert synchronous in ('OFF', 'ON')
         assert journal_mode in ('OFF', 'WAL', 'MEMORY')
         self._path = '{}.db'.format(path)
         logger.debug('Database %s; connecting.', path)
-        self._con = sqlite3.connect(self._path)
+        self._con = sqlite3.connect(self._path, timeout=DATABASE_TIMEOUT)
         logger.debug('Database %s; getting cursor.', path)
         self._cur = self._con.cursor()
         logger.debug('Database %s; synchronous=%s.', path, synchronous)
         logger.debug('Database %s; journal mode=%s.', path, journal_mode)
         self._cur.execute('PRAGMA synchronous={}'.format(synchronous))
         self._cur.execute('PRAGMA journal_mode={}'.format(journal_mode))
+        self._changes = 0
+        self._last_commit = time.time()
 
     def insert(self):
         pass
 
+    def _changed(self, count):
+        """Commits the changes periodically.
+
+        The changes are committed after ``DATABASE_COMMIT_CHANGES`` changes or
+        ``DATABASE_COMMIT_TIME`` seconds after the last commit.
+
+        Args:
+            count (int): The number of changes made.
+        """
+        self._changes += count
+        if self._changes >= DATABASE_COMMIT_CHANGES \
+                or time.time() - self._last_commit >= DATABASE_COMMIT_TIME:
+            self.commit()
+
+    def commit(self):
+        """Commits the changes."""
+        logger.debug('Database %s; committing %d changes.', self._path,
+                     self._changes)
+        self._con.commit()
+        self._changes = 0
+        self._last_commit = time.time()
+
     def stop(self):
         """Stops the running database.
 
@@ -52,6 +85,19 @@ class BaseDatabase:
         os.remove(self._path)
 
 
+def url_hash(url):
+    """Hashes an URL to a signed 64-bit integer.
+
+    Args:
+        url (str): The URL to hash.
+
+    Returns:
+        int: The hash of the URL.
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode('utf-8'), digest_size=8)
+                          .digest(), 'big', signed=True)
+
+
 class UrlDeduplicationDatabase(BaseDatabase):
     """The database for URL deduplication."""
 
@@ -61,7 +107,10 @@ class UrlDeduplicationDatabase(BaseDatabase):
         Uses ``OFF`` for synchronous and ``WAL`` for journal mode. A table is
         used with values::
 
-            (url TEXT, depth INTEGER, parent TEXT)
+            (hash INTEGER PRIMARY KEY, url TEXT, depth INTEGER, parent TEXT)
+
+        The hash of the URL is the key of the table, so an URL is found
+        without scanning the table.
 
         Args:
             path (str): The path of the database file.
@@ -71,9 +120,9 @@ class UrlDeduplicationDatabase(BaseDatabase):
         self._name = name
         logger.debug('Database %s; table %s; creating.', self._path,
                      self._name)
-        self._cur.execute('CREATE TABLE {} ' \
-                          '(url TEXT, depth INTEGER, parent TEXT)' \
-                          .format(self._name))
+        self._cur.execute('CREATE TABLE IF NOT EXISTS {} '
+                          '(hash INTEGER PRIMARY KEY, url TEXT, '
+                          'depth INTEGER, parent TEXT)'.format(self._name))
 
     def insert(self, urlconfig):
         """Insert an URL into the database.
@@ -84,13 +133,27 @@ class UrlDeduplicationDatabase(BaseDatabase):
         Args:
             urlconfig (:obj:`webarchiver.url.UrlConfig`): The configuration for
                 the URL to be added.
+        """
+        self.insert_many((urlconfig,))
+
+    def insert_many(self, urlconfigs):
+        """Inserts URLs into the database in a single transaction.
+
+        URLs that are already in the database are ignored.
+
+        Args:
+            urlconfigs (iterable of :obj:`webarchiver.url.UrlConfig`): The
+                configurations for the URLs to be added.
         """# TODO assertions
-        logger.debug('Database %s; table %s; adding %s.', self._path,
-                     self._name, urlconfig)
-        self._cur.execute('INSERT INTO {} VALUES (?,?,?)'.format(self._name), 
-                          (urlconfig.url, urlconfig.depth,
-                           urlconfig.parent_url \
-                           if urlconfig.parent_url is not None else ''))
+        rows = [(url_hash(urlconfig.url), urlconfig.url, urlconfig.depth,
+                 urlconfig.parent_url
+                 if urlconfig.parent_url is not None else '')
+                for urlconfig in urlconfigs]
+        logger.debug('Database %s; table %s; adding %d URLs.', self._path,
+                     self._name, len(rows))
+        self._cur.executemany('INSERT OR IGNORE INTO {} VALUES (?,?,?,?)'
+                              .format(self._name), rows)
+        self._changed(len(rows))
 
     def has_url(self, url):
         """Checks if the database holds an URL.
@@ -106,22 +169,208 @@ class UrlDeduplicationDatabase(BaseDatabase):
         """
         logger.debug('Database %s; table %s; checking URL %s.', self._path,
                      self._name, url)
-        self._cur.execute('SELECT 1 FROM {} WHERE url=? LIMIT 1'
-                          .format(self._name), (url,))
+        self._cur.execute('SELECT 1 FROM {} WHERE hash=? AND url=?'
+                          .format(self._name), (url_hash(url), url))
         return self._cur.fetchone() is not None
 
+    def count(self):
+        """Counts the URLs in the database.
+
+        Returns:
+            int: The number of URLs.
+        """
+        self._cur.execute('SELECT COUNT(*) FROM {}'.format(self._name))
+        return self._cur.fetchone()[0]
+
+    def urls(self):
+        """Iterates over the URLs in the database.
+
+        Yields:
+            str: An URL in the database.
+        """
+        cur = self._con.cursor()
+        try:
+            for row in cur.execute('SELECT url FROM {}'.format(self._name)):
+                yield row[0]
+        finally:
+            cur.close()
+
+    def has_urls(self, urls):
+        """Checks which URLs the database holds.
+
+        The URLs are looked up by their hashes in chunks of
+        ``DATABASE_LOOKUP_CHUNK`` URLs per query.
+
+        Args:
+            urls (iterable of str): The URLs to check the database for.
+
+        Returns:
+            set of str: The URLs that are in the database.
+        """
+        urls = set(urls)
+        logger.debug('Database %s; table %s; checking %d URLs.', self._path,
+                     self._name, len(urls))
+        found = set()
+        hashes = iter([url_hash(url) for url in urls])
+        while True:
+            chunk = list(itertools.islice(hashes, DATABASE_LOOKUP_CHUNK))
+            if len(chunk) == 0:
+                break
+            self._cur.execute('SELECT url FROM {} WHERE hash IN ({})'
+                              .format(self._name, ','.join('?'*len(chunk))),
+                              chunk)
+            found.update(row[0] for row in self._cur.fetchall())
+        return found & urls
+
+
+def payload_key(digest, url):
+    """Gets the key of a payload.
+
+    Args:
+        digest (str): The digest of the payload, like ``sha1:...``.
+        url (str): The URL of the payload.
+
+    Returns:
+        tuple of (str, str): The digest and the URL stripped from its scheme.
+    """
+    return digest, strip_url_scheme(url)
+
+
+class PayloadDeduplicationDatabase(BaseDatabase):
+    """The database for payload deduplication.
+
+    Payloads are identified by their digest and their URL stripped from its
+    scheme, see :func:`payload_key`. The most recently used payloads are kept
+    in memory, so repeated lookups do not query the database.
+    """
+
+    def __init__(self, path, name, cache_size=DEDUPLICATION_CACHE_SIZE):
+        """Inits the database.
+
+        Uses ``OFF`` for synchronous and ``WAL`` for journal mode. A table is
+        used with values::
+
+            (hash INTEGER PRIMARY KEY, digest TEXT, url TEXT, target TEXT,
+             date TEXT)
+
+        The hash of the key of the payload is the key of the table. The target
+        is the full URL of the record with the payload and the date the date
+        of the record.
+
+        Args:
+            path (str): The path of the database file.
+            name (str): The name of the table in the database.
+            cache_size (int, optional): The number of payloads kept in memory.
+                Default is ``DEDUPLICATION_CACHE_SIZE``.
+        """
+        super().__init__(path, 'OFF', 'WAL')
+        self._name = name
+        self._cache = LruDict(cache_size)
+        logger.debug('Database %s; table %s; creating.', self._path,
+                     self._name)
+        self._cur.execute('CREATE TABLE IF NOT EXISTS {} '
+                          '(hash INTEGER PRIMARY KEY, digest TEXT, url TEXT, '
+                          'target TEXT, date TEXT)'.format(self._name))
+
+    def insert(self, digest, url, date):
+        """Inserts a payload into the database.
+
+        Args:
+            digest (str): The digest of the payload.
+            url (str): The URL of the record with the payload.
+            date (str): The date of the record with the payload, as in the
+                ``WARC-Date`` header.
+        """
+        self.insert_many(((digest, url, date),))
+
+    def insert_many(self, payloads):
+        """Inserts payloads into the database in a single transaction.
+
+        The transaction is committed right away. The database is shared by
+        the processes processing WARC files, so a transaction left open would
+        lock out the other processes. Payloads that are already in the
+        database are ignored.
+
+        Args:
+            payloads (iterable of tuples): The digest, URL and date of each
+                payload, see :func:`insert`.
+        """
+        rows = []
+        for digest, url, date in payloads:
+            key = payload_key(digest, url)
+            self._cache.pop(key, None)
+            rows.append((url_hash(';'.join(key)), key[0], key[1], url, date))
+        logger.debug('Database %s; table %s; adding %d payloads.', self._path,
+                     self._name, len(rows))
+        self._cur.executemany('INSERT OR IGNORE INTO {} VALUES (?,?,?,?,?)'
+                              .format(self._name), rows)
+        self._changes += len(rows)
+        self.commit()
+
+    def lookup(self, digest, url):
+        """Looks up a payload.
+
+        Args:
+            digest (str): The digest of the payload.
+            url (str): The URL of the payload.
+
+        Returns:
+            tuple of (str, str): The date and the URL of the record the
+                payload was first found in, or None if the payload is not in
+                the database.
+        """
+        return self.lookup_many(((digest, url),)).get(payload_key(digest, url))
+
+    def lookup_many(self, payloads):
+        """Looks up payloads.
+
+        Payloads not kept in memory are looked up by their hashes in chunks of
+        ``DATABASE_LOOKUP_CHUNK`` payloads per query.
+
+        Args:
+            payloads (iterable of tuples): The digest and URL of each payload.
+
+        Returns:
+            dict of tuple and tuple: The date and URL of the record each
+                payload was first found in by the key of the payload, see
+                :func:`payload_key`. Payloads that are not in the database are
+                left out.
+        """
+        found = {}
+        missing = {}
+        for digest, url in payloads:
+            key = payload_key(digest, url)
+            cached = self._cache.get(key, False)
+            if cached is False:
+                missing[url_hash(';'.join(key))] = key
+            elif cached is not None:
+                found[key] = cached
+        logger.debug('Database %s; table %s; checking %d payloads.',
+                     self._path, self._name, len(missing))
+        hashes = iter(list(missing))
+        while True:
+            chunk = list(itertools.islice(hashes, DATABASE_LOOKUP_CHUNK))
+            if len(chunk) == 0:
+                break
+            self._cur.execute('SELECT digest, url, date, target FROM {} '
+                              'WHERE hash IN ({})'
+                              .format(self._name, ','.join('?'*len(chunk))),
+                              chunk)
+            for digest, url, date, target in self._cur.fetchall():
+                found[(digest, url)] = date, target
+        for key in missing.values():
+            self._cache[key] = found.get(key)
+        return found
+
+    @property
+    def hits(self):
+        """int: The number of lookups of payloads kept in memory."""
+        return self._cache.hits
 
-#class PayloadDeduplicationDatabase(BaseDatabase):
-#    def __init__(self, path, name):
-#        super().__init__(path, 'OFF', 'WAL')
-#        self._name = name
-#        self._cur.execute('CREATE TABLE {} (url TEXT, payload TEXT)'
-#                          .format(self._name))
-#
-#    def insert(self, url, payload):
-#        # TODO assertions
-#        self._cur.execute('INSERT INTO {} VALUES (?, ?)' .format(self._name),
-#                          (url, payload))
+    @property
+    def misses(self):
+        """int: The number of lookups of payloads not kept in memory."""
+        return self._cache.misses
 
-__all__ = ('UrlDeduplicationDatabase',)
 
+__all__ = ('UrlDeduplicationDatabase', 'PayloadDeduplicationDatabase')
@@ -0,0 +1,141 @@
+"""Benchmark for database.py.
+
+Fills an URL deduplication database step by step and measures the time of
+looking up URLs at every size. The original table without a key is measured
+for the smaller sizes. The largest size is set with the environment variable
+``DATABASE_BENCHMARK_ROWS``, the default is ten million rows.
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+from webarchiver.database import UrlDeduplicationDatabase
+from webarchiver.url import UrlConfig
+
+LOOKUPS = 10000
+UNINDEXED_MAX_ROWS = 100000
+
+
+def url(i):
+    """Creates the URL for a number.
+
+    Args:
+        i (int): The number.
+
+    Returns:
+        str: The URL.
+    """
+    return 'https://example{}.com/page/{}'.format(i % 1000, i)
+
+
+def urlconfigs(start, end):
+    """Creates URL configurations for a range of numbers.
+
+    Args:
+        start (int): The first number.
+        end (int): The number after the last number.
+
+    Returns:
+        list of :obj:`webarchiver.url.UrlConfig`: The URL configurations.
+    """
+    return [UrlConfig('job', url(i), 1, 'https://example.com/')
+            for i in range(start, end)]
+
+
+def sizes(max_rows):
+    """Yields the sizes to measure at, in steps of a factor ten.
+
+    Args:
+        max_rows (int): The largest size.
+
+    Yields:
+        int: The next size.
+    """
+    size = 10000
+    while size < max_rows:
+        yield size
+        size *= 10
+    yield max_rows
+
+
+def measure(function, urls):
+    """Measures the average time of a lookup function.
+
+    Args:
+        function (function): The function looking up a single URL.
+        urls (list of str): The URLs to look up.
+
+    Returns:
+        float: The average time per lookup in microseconds.
+    """
+    start = time.perf_counter()
+    for url in urls:
+        function(url)
+    return (time.perf_counter() - start) / len(urls) * 1e6
+
+
+def measure_unindexed(path, max_rows):
+    """Measures lookups in the original table without a key.
+
+    Args:
+        path (str): The path of the database.
+        max_rows (int): The largest size.
+    """
+    con = sqlite3.connect(path + '_unindexed.db')
+    cur = con.cursor()
+    cur.execute('CREATE TABLE urls (url TEXT, depth INTEGER, parent TEXT)')
+
+    def has_url(url):
+        cur.execute('SELECT 1 FROM urls WHERE url=? LIMIT 1', (url,))
+        return cur.fetchone() is not None
+
+    rows = 0
+    for size in sizes(min(max_rows, UNINDEXED_MAX_ROWS)):
+        cur.executemany('INSERT INTO urls VALUES (?,?,?)',
+                        [(u.url, u.depth, u.parent_url)
+                         for u in urlconfigs(rows, size)])
+        con.commit()
+        rows = size
+        misses = ['https://example.org/{}'.format(i) for i in range(100)]
+        print('{:<12}{:>12}{:>14.2f}us'.format('unindexed', size,
+                                                measure(has_url, misses)))
+    con.close()
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    max_rows = int(os.environ.get('DATABASE_BENCHMARK_ROWS', 10000000))
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'benchmark')
+    try:
+        print('{:<12}{:>12}{:>16}{:>16}{:>16}'.format(
+            'table', 'rows', 'has_url hit', 'has_url miss', 'has_urls'))
+        database = UrlDeduplicationDatabase(path, 'urls')
+        rows = 0
+        for size in sizes(max_rows):
+            for start in range(rows, size, 100000):
+                database.insert_many(urlconfigs(start,
+                                                min(start + 100000, size)))
+            database.commit()
+            rows = size
+            step = max(size // LOOKUPS, 1)
+            hits = [url(i) for i in range(0, size, step)][:LOOKUPS]
+            misses = ['https://example.org/{}'.format(i)
+                      for i in range(LOOKUPS)]
+            start = time.perf_counter()
+            database.has_urls(hits + misses)
+            batched = (time.perf_counter() - start) / (len(hits)
+                                                       + len(misses)) * 1e6
+            print('{:<12}{:>12}{:>14.2f}us{:>14.2f}us{:>14.2f}us'.format(
+                'hashed', size, measure(database.has_url, hits),
+                measure(database.has_url, misses), batched))
+        database.stop()
+        measure_unindexed(path, max_rows)
+    finally:
+        for filename in os.listdir(directory):
+            os.remove(os.path.join(directory, filename))
+        os.rmdir(directory)
+
+if __name__ == '__main__':
+    main()
@@ -2,7 +2,9 @@
 import os
 import unittest
 
-from webarchiver.database import UrlDeduplicationDatabase
+from webarchiver.config import *
+from webarchiver.database import PayloadDeduplicationDatabase, \
+    UrlDeduplicationDatabase
 from webarchiver.url import UrlConfig
 
 
@@ -34,8 +36,89 @@ class TestUrlDeduplicationDatabase(unittest.TestCase):
         d.stop()
         d.clean()
 
+    def test_many_urls(self):
+        d = UrlDeduplicationDatabase('test', 'test')
+        d.insert_many([UrlConfig('', 'https://example.org/{}'.format(i), 0,
+                                 None) for i in range(1000)])
+        d.insert_many([UrlConfig('', 'https://example.org/0', 1, '')])
+        self.assertSetEqual(d.has_urls(['https://example.org/1',
+                                        'https://example.org/999',
+                                        'https://example.com/1']),
+                            {'https://example.org/1',
+                             'https://example.org/999'})
+        self.assertSetEqual(d.has_urls('https://example.org/{}'.format(i)
+                                       for i in range(2000)),
+                            {'https://example.org/{}'.format(i)
+                             for i in range(1000)})
+        d.stop()
+        d.clean()
+
+    def test_periodic_commit(self):
+        d = UrlDeduplicationDatabase('test', 'test')
+        d.insert_many([UrlConfig('', 'https://example.org/{}'.format(i), 0,
+                                 None) for i in range(10)])
+        self.assertTrue(d._con.in_transaction)
+        d.insert_many([UrlConfig('', 'https://example.com/{}'.format(i), 0,
+                                 None)
+                       for i in range(DATABASE_COMMIT_CHANGES)])
+        self.assertFalse(d._con.in_transaction)
+        d.stop()
+        d.clean()
 
-#class TestPayloadDeduplicationDatabase(unittest.TestCase):
-#    def test_record(self):
-#        pass #TODO
+    def test_reopen(self):
+        d = UrlDeduplicationDatabase('test', 'test')
+        d.insert(UrlConfig('', 'https://example.org/', 0, ''))
+        d.stop()
+        d = UrlDeduplicationDatabase('test', 'test')
+        self.assertTrue(d.has_url('https://example.org/'))
+        d.stop()
+        d.clean()
+
+
+class TestPayloadDeduplicationDatabase(unittest.TestCase):
+    """Tests for the payload deduplication database."""
+
+    def test_lookup(self):
+        d = PayloadDeduplicationDatabase('test_payload', 'test')
+        d.insert('sha1:A', 'http://example.org/', '2018-01-01T00:00:00Z')
+        self.assertTupleEqual(d.lookup('sha1:A', 'https://example.org/'),
+                              ('2018-01-01T00:00:00Z', 'http://example.org/'))
+        self.assertIsNone(d.lookup('sha1:B', 'http://example.org/'))
+        self.assertIsNone(d.lookup('sha1:A', 'http://example.com/'))
+        d.stop()
+        d.clean()
+
+    def test_lookup_many(self):
+        d = PayloadDeduplicationDatabase('test_payload', 'test')
+        d.insert_many(('sha1:{}'.format(i), 'http://example.org/{}'.format(i),
+                       '2018-01-01T00:00:00Z') for i in range(1000))
+        found = d.lookup_many(('sha1:{}'.format(i),
+                               'http://example.org/{}'.format(i % 1000))
+                              for i in range(2000))
+        self.assertEqual(len(found), 1000)
+        self.assertEqual(found[('sha1:999', 'example.org/999')][1],
+                         'http://example.org/999')
+        d.stop()
+        d.clean()
+
+    def test_cache(self):
+        d = PayloadDeduplicationDatabase('test_payload', 'test', 2)
+        self.assertIsNone(d.lookup('sha1:A', 'http://example.org/'))
+        d.insert('sha1:A', 'http://example.org/', '2018-01-01T00:00:00Z')
+        self.assertIsNotNone(d.lookup('sha1:A', 'http://example.org/'))
+        self.assertIsNotNone(d.lookup('sha1:A', 'http://example.org/'))
+        self.assertEqual((d.hits, d.misses), (1, 2))
+        d.stop()
+        d.clean()
 
+    def test_shared(self):
+        d1 = PayloadDeduplicationDatabase('test_payload', 'test')
+        d2 = PayloadDeduplicationDatabase('test_payload', 'test')
+        d1.insert('sha1:A', 'http://example.org/', '2018-01-01T00:00:00Z')
+        d2.insert('sha1:B', 'http://example.org/', '2018-01-01T00:00:00Z')
+        self.assertIsNotNone(d1.lookup('sha1:B', 'http://example.org/'))
+        self.assertIsNotNone(d2.lookup('sha1:A', 'http://example.org/'))
+        self.assertFalse(d1._con.in_transaction)
+        d2.stop()
+        d1.stop()
+        d1.clean()
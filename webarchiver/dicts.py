@@ -1,4 +1,5 @@
 """Customized dict."""
+import collections
 
 
 class MultiDict(dict):
@@ -8,3 +9,51 @@ class MultiDict(dict):
         else:
             super().__setitem__(key, value)
 
+
+class LruDict(collections.OrderedDict):
+    """A dict keeping only the most recently used items.
+
+    Only lookups with :func:`get` count as use of an item.
+
+    Attributes:
+        maxsize (int): The maximum number of items.
+        hits (int): The number of lookups finding an item.
+        misses (int): The number of lookups not finding an item.
+    """
+
+    def __init__(self, maxsize):
+        """Inits the dict.
+
+        Args:
+            maxsize (int): The maximum number of items.
+        """
+        super().__init__()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """Gets an item and marks it as most recently used.
+
+        Args:
+            key: The key of the item.
+            default (optional): The value returned if the item is not found.
+                Default is None.
+
+        Returns:
+            The value of the item, or `default` if the item is not found.
+        """
+        try:
+            value = self[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
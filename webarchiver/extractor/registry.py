@@ -0,0 +1,444 @@
+"""Choosing an extractor for a payload by its type.
+
+The type of a payload is taken from its ``Content-Type`` header and from the
+magic bytes at its start. Each type of text payload has its own extractor, and
+binary payloads are skipped. Every extractor counts the payloads it scanned
+and the time it took. The registry also counts the payloads looked up for
+deduplication, so all work on the payloads of a crawl is reported together.
+"""
+import logging
+import re
+import threading
+import time
+
+from webarchiver.config import *
+from webarchiver.extractor import scan
+
+logger = logging.getLogger(__name__)
+
+SNIFF_SIZE = 512
+"""The number of bytes at the start of a payload used to find its type."""
+
+BINARY_SIGNATURES = (
+    b'\x89PNG', b'\xff\xd8\xff', b'GIF87a', b'GIF89a', b'RIFF',
+    b'\x00\x00\x01\x00', b'II*\x00', b'MM\x00*', b'\x1f\x8b', b'PK\x03\x04',
+    b'7z\xbc\xaf', b'Rar!', b'\xfd7zXZ', b'%PDF', b'wOFF', b'wOF2',
+    b'\x00\x01\x00\x00', b'OggS', b'fLaC', b'\x1aE\xdf\xa3', b'\x00asm',
+    b'\x7fELF',
+)
+"""The magic bytes at the start of binary payloads."""
+
+TEXT_SIGNATURES = (
+    (re.compile(br'<!doctype\s+html|<html|<head|<body', re.IGNORECASE),
+     'html'),
+    (re.compile(br'<\?xml|<urlset|<sitemapindex|<rss|<feed'), 'xml'),
+    (re.compile(br'[{\[]'), 'json'),
+)
+"""The regular expressions matching the start of text payloads, after white
+space and a byte order mark, and the names of their extractors."""
+
+GENERIC_CONTENT_TYPES = frozenset([
+    '', 'application/octet-stream', 'binary/octet-stream', 'text/plain',
+    'application/unknown', 'unknown/unknown',
+])
+"""The content types that do not reliably describe the payload."""
+
+PAYLOAD_COUNTERS = ('records', 'duplicates', 'hits', 'misses', 'remote')
+"""The counters of the payloads looked up for deduplication."""
+
+
+class Extractor:
+    """An extractor for one type of payload.
+
+    Attributes:
+        name (str): The name of the extractor.
+        pattern (:obj:`re.Pattern`): The regular expression for URLs, see
+            :mod:`webarchiver.extractor.scan`.
+        records (int): The number of payloads scanned.
+        size (int): The number of bytes scanned.
+        seconds (float): The time spend scanning.
+        urls (int): The number of URLs found.
+        hits (int): The number of candidate URLs resolved from the cache of
+            :class:`webarchiver.extractor.scan.BaseUrl`.
+        misses (int): The number of candidate URLs not in that cache.
+    """
+
+    def __init__(self, name, pattern):
+        """Inits the extractor.
+
+        Args:
+            name (str): The name of the extractor.
+            pattern (:obj:`re.Pattern`): The regular expression for URLs.
+        """
+        self.name = name
+        self.pattern = pattern
+        self.records = 0
+        self.size = 0
+        self.seconds = 0
+        self.urls = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def scanner(self, parenturl):
+        """Creates a scanner for a payload received in parts.
+
+        The caller should add the work with :func:`count`.
+
+        Args:
+            parenturl (str): The URL of the payload.
+
+        Returns:
+            :obj:`webarchiver.extractor.scan.Scanner`: The scanner.
+        """
+        return scan.Scanner(parenturl, self.pattern)
+
+    def extract(self, parenturl, chunks):
+        """Extracts URLs from a payload.
+
+        Args:
+            parenturl (str): The URL of the payload.
+            chunks (iterable of bytes): The payload.
+
+        Returns:
+            set of str: The discovered URLs.
+        """
+        start = time.perf_counter()
+        scanner = self.scanner(parenturl)
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            scanner.feed(chunk)
+        urls = scanner.close()
+        self.count(size, time.perf_counter() - start, len(urls),
+                   scanner.base.hits, scanner.base.misses)
+        return urls
+
+    def count(self, size, seconds, urls, hits=0, misses=0):
+        """Adds the work for a payload to the counters.
+
+        Args:
+            size (int): The number of bytes scanned.
+            seconds (float): The time spend scanning.
+            urls (int): The number of URLs found.
+            hits (int, optional): The number of candidate URLs resolved from
+                the cache. Default is 0.
+            misses (int, optional): The number of candidate URLs not in the
+                cache. Default is 0.
+        """
+        with self._lock:
+            self.records += 1
+            self.size += size
+            self.seconds += seconds
+            self.urls += urls
+            self.hits += hits
+            self.misses += misses
+
+    def add(self, stats):
+        """Adds the counters of another extractor, see :attr:`stats`.
+
+        Args:
+            stats (dict): The counters.
+        """
+        with self._lock:
+            self.records += stats['records']
+            self.size += stats['size']
+            self.seconds += stats['seconds']
+            self.urls += stats['urls']
+            self.hits += stats['hits']
+            self.misses += stats['misses']
+
+    @property
+    def stats(self):
+        """dict: The counters of the extractor."""
+        return {'records': self.records, 'size': self.size,
+                'seconds': self.seconds, 'urls': self.urls,
+                'hits': self.hits, 'misses': self.misses}
+
+    def __repr__(self):
+        return '<{} at 0x{:x} name={}>'.format(__name__, id(self), self.name)
+
+
+class ExtractorRegistry:
+    """Chooses the extractor for a payload.
+
+    Extractors are registered for content types, for prefixes of content types
+    and for suffixes of structured syntax like ``+json``. Payloads starting
+    with the magic bytes of a binary format or with a skipped content type
+    that has no extractor registered are not scanned. If the content type is
+    missing or generic, the type is sniffed from the start of the payload.
+
+    Attributes:
+        extractors (dict of str and :obj:`Extractor`): The extractors by
+            name.
+        skipped (int): The number of payloads skipped.
+        payloads (dict): The counters of the payloads looked up for
+            deduplication, see :func:`count_payloads`.
+    """
+
+    def __init__(self):
+        """Inits the registry without extractors."""
+        self.extractors = {}
+        self.skipped = 0
+        self.payloads = dict.fromkeys(PAYLOAD_COUNTERS, 0)
+        self._content_types = {}
+        self._prefixes = []
+        self._suffixes = {}
+        self._skip = set()
+        self._skip_prefixes = []
+        self._lock = threading.Lock()
+
+    def register(self, extractor, content_types=(), prefixes=(),
+                 suffixes=()):
+        """Registers an extractor.
+
+        Args:
+            extractor (:obj:`Extractor`): The extractor.
+            content_types (iterable of str, optional): The content types to
+                use the extractor for.
+            prefixes (iterable of str, optional): The prefixes of content types
+                to use the extractor for, like ``text/``.
+            suffixes (iterable of str, optional): The structured syntax
+                suffixes to use the extractor for, like ``+json``.
+        """
+        self.extractors[extractor.name] = extractor
+        for content_type in content_types:
+            self._content_types[content_type] = extractor
+        for prefix in prefixes:
+            self._prefixes.append((prefix, extractor))
+        for suffix in suffixes:
+            self._suffixes[suffix] = extractor
+
+    def skip(self, content_types=(), prefixes=()):
+        """Skips payloads with content types.
+
+        Args:
+            content_types (iterable of str, optional): The content types to
+                skip.
+            prefixes (iterable of str, optional): The prefixes of content types
+                to skip, like ``image/``.
+        """
+        self._skip.update(content_types)
+        self._skip_prefixes.extend(prefixes)
+
+    def extractor_for(self, content_type, head):
+        """Chooses the extractor for a payload.
+
+        Args:
+            content_type (str): The ``Content-Type`` header, or None.
+            head (bytes): The start of the payload, at least ``SNIFF_SIZE``
+                bytes if available.
+
+        Returns:
+            :obj:`Extractor`: The extractor, or None if the payload should be
+                skipped.
+        """
+        content_type = (content_type or '').split(';', 1)[0].strip().lower()
+        if head.startswith(BINARY_SIGNATURES):
+            return None
+        extractor = self._content_types.get(content_type)
+        if extractor is None:
+            if content_type in self._skip \
+                    or content_type.startswith(tuple(self._skip_prefixes)):
+                return None
+            if '+' in content_type:
+                extractor = self._suffixes.get(
+                    '+' + content_type.rsplit('+', 1)[1]
+                )
+        if extractor is None:
+            for prefix, prefix_extractor in self._prefixes:
+                if content_type.startswith(prefix):
+                    extractor = prefix_extractor
+                    break
+        if extractor is None or content_type in GENERIC_CONTENT_TYPES:
+            sniffed = self.sniff(head)
+            if sniffed is not None:
+                return sniffed
+            if extractor is None and b'\x00' in head[:SNIFF_SIZE]:
+                return None
+        return extractor or self.extractors.get('text')
+
+    def sniff(self, head):
+        """Finds the extractor for a text payload by its start.
+
+        Args:
+            head (bytes): The start of the payload.
+
+        Returns:
+            :obj:`Extractor`: The extractor, or None if the type is not
+                recognized.
+        """
+        head = head[:SNIFF_SIZE].lstrip(b'\xef\xbb\xbf').lstrip()
+        for regex, name in TEXT_SIGNATURES:
+            if regex.match(head) and name in self.extractors:
+                return self.extractors[name]
+        return None
+
+    def extract_urls(self, parenturl, record, chunk_size=SCAN_CHUNK_SIZE):
+        """Extracts URLs from the payload of a WARC record.
+
+        Args:
+            parenturl (str): The URL of the record.
+            record (:obj:`warcio.recordloader.ArcWarcRecord`): The WARC record.
+            chunk_size (int, optional): The number of bytes to scan at once.
+                Default is ``SCAN_CHUNK_SIZE``.
+
+        Returns:
+            set of str: The discovered URLs.
+        """
+        content_type = None
+        if record.http_headers is not None:
+            content_type = record.http_headers.get_header('Content-Type')
+        stream = record.content_stream()
+        head = stream.read(max(chunk_size, SNIFF_SIZE))
+        extractor = self.extractor_for(content_type, head)
+        if extractor is None:
+            logger.debug('Skipping payload of %s with content type %s.',
+                         parenturl, content_type)
+            with self._lock:
+                self.skipped += 1
+            return set()
+        chunks = iter(lambda: stream.read(chunk_size), b'')
+        return extractor.extract(parenturl, _prepend(head, chunks))
+
+    def stats(self):
+        """Gets the counters of every extractor.
+
+        Returns:
+            dict of str and dict: The counters by name of the extractor, see
+                :attr:`Extractor.stats`.
+        """
+        return {name: extractor.stats
+                for name, extractor in self.extractors.items()}
+
+    def count_payloads(self, counts):
+        """Adds to the counters of the payloads looked up for deduplication.
+
+        Args:
+            counts (dict): The number of payloads looked up by ``records``,
+                the duplicates found by ``duplicates``, the lookups found and
+                not found in the cache of the local database by ``hits`` and
+                ``misses`` and the lookups with ``DEDUPLICATION_SERVER`` by
+                ``remote``. Missing counters are not changed.
+        """
+        with self._lock:
+            for key, value in counts.items():
+                self.payloads[key] += value
+
+    def counters(self):
+        """Gets all counters.
+
+        Returns:
+            dict: The number of payloads skipped by ``skipped``, the counters
+                of every extractor by ``extractors``, see :func:`stats`, and
+                the counters of the payloads looked up for deduplication by
+                ``payloads``.
+        """
+        with self._lock:
+            skipped = self.skipped
+            payloads = dict(self.payloads)
+        return {'skipped': skipped, 'extractors': self.stats(),
+                'payloads': payloads}
+
+    def counters_since(self, before):
+        """Gets the work done since counters were taken.
+
+        Args:
+            before (dict): The counters taken before, see :func:`counters`.
+
+        Returns:
+            dict: The counters of the work done since, see :func:`counters`.
+        """
+        after = self.counters()
+        return {
+            'skipped': after['skipped'] - before['skipped'],
+            'payloads': {key: value - before['payloads'][key]
+                         for key, value in after['payloads'].items()},
+            'extractors': {
+                name: {key: value - before['extractors'][name][key]
+                       for key, value in stats.items()}
+                for name, stats in after['extractors'].items()
+            }
+        }
+
+    def merge(self, counters):
+        """Adds the counters of another registry.
+
+        Extraction running in another process counts in the registry of that
+        process. The counters of its work are added to this registry with
+        this function.
+
+        Args:
+            counters (dict): The counters, see :func:`counters`.
+        """
+        with self._lock:
+            self.skipped += counters['skipped']
+        self.count_payloads(counters['payloads'])
+        for name, stats in counters['extractors'].items():
+            self.extractors[name].add(stats)
+
+    def report(self):
+        """Logs all counters, see :func:`counters`."""
+        logger.info('Skipped %d payloads; %s.', self.skipped, ', '.join(
+            '{} scanned {} payloads of {} bytes in {:.2f}s finding {} URLs '
+            'with {} resolution cache hits and {} misses'
+            .format(name, stats['records'], stats['size'], stats['seconds'],
+                    stats['urls'], stats['hits'], stats['misses'])
+            for name, stats in self.stats().items()
+        ))
+        logger.info('Looked up %(records)d payloads finding %(duplicates)d '
+                    'duplicates with %(hits)d cache hits, %(misses)d cache '
+                    'misses and %(remote)d remote lookups.',
+                    self.counters()['payloads'])
+
+
+def _prepend(head, chunks):
+    """Yields the start of a payload followed by the rest.
+
+    Args:
+        head (bytes): The start of the payload.
+        chunks (iterable of bytes): The rest of the payload.
+
+    Yields:
+        bytes: The parts of the payload.
+    """
+    yield head
+    yield from chunks
+
+
+registry = ExtractorRegistry()
+"""The registry with the default extractors."""
+
+registry.register(Extractor('html', scan.HTML_PATTERN),
+                  ['text/html', 'application/xhtml+xml'])
+registry.register(Extractor('css', scan.CSS_PATTERN), ['text/css'])
+registry.register(Extractor('javascript', scan.SCRIPT_PATTERN),
+                  ['application/javascript', 'text/javascript',
+                   'application/x-javascript', 'application/ecmascript',
+                   'text/ecmascript'])
+registry.register(Extractor('json', scan.SCRIPT_PATTERN),
+                  ['application/json', 'text/json'], suffixes=['+json'])
+registry.register(Extractor('xml', scan.XML_PATTERN),
+                  ['application/xml', 'text/xml', 'image/svg+xml'],
+                  suffixes=['+xml'])
+registry.register(Extractor('text', scan.TEXT_PATTERN), ['text/plain'],
+                  prefixes=['text/'])
+registry.skip(['application/pdf', 'application/zip', 'application/gzip',
+               'application/x-gzip', 'application/x-tar',
+               'application/x-shockwave-flash', 'application/wasm',
+               'application/vnd.ms-fontobject'],
+              ['image/', 'video/', 'audio/', 'font/', 'application/font-',
+               'application/x-font-'])
+
+
+def extract_urls(parenturl, record):
+    """Extracts URLs from a WARC record with the default extractors.
+
+    Args:
+        parenturl (str): The URL of the record.
+        record (:obj:`warcio.recordloader.ArcWarcRecord`): The WARC record.
+
+    Returns:
+        set of str: The discovered URLs.
+    """
+    return registry.extract_urls(parenturl, record)
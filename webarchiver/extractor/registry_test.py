@@ -0,0 +1,114 @@
+"""Tests for registry.py."""
+import io
+import unittest
+
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from webarchiver.extractor import scan
+from webarchiver.extractor.registry import (Extractor, ExtractorRegistry,
+                                            registry)
+
+PARENT = 'https://example.com/'
+HTML = b'<!DOCTYPE html><a href="/page">page</a>'
+
+
+def record(content_type, payload):
+    """Creates a response record.
+
+    Args:
+        content_type (str): The ``Content-Type`` header, or None.
+        payload (bytes): The payload.
+
+    Returns:
+        :obj:`warcio.recordloader.ArcWarcRecord`: The record.
+    """
+    headers = []
+    if content_type is not None:
+        headers.append(('Content-Type', content_type))
+    f = io.BytesIO()
+    writer = WARCWriter(filebuf=f, gzip=False)
+    writer.write_record(writer.create_warc_record(
+        PARENT, 'response', payload=io.BytesIO(payload), length=len(payload),
+        http_headers=StatusAndHeaders('200 OK', headers, protocol='HTTP/1.1')
+    ))
+    f.seek(0)
+    return next(iter(ArchiveIterator(f)))
+
+
+class TestExtractorRegistry(unittest.TestCase):
+    """Tests for choosing extractors."""
+
+    def assertExtractor(self, name, content_type, head):
+        extractor = registry.extractor_for(content_type, head)
+        self.assertEqual(extractor and extractor.name, name,
+                         (content_type, head))
+
+    def test_content_type(self):
+        self.assertExtractor('html', 'text/html; charset=utf-8', b'<p>')
+        self.assertExtractor('css', 'text/css', b'body {}')
+        self.assertExtractor('javascript', 'application/javascript', b'var')
+        self.assertExtractor('json', 'application/ld+json', b'{}')
+        self.assertExtractor('xml', 'application/rss+xml', b'<?xml')
+        self.assertExtractor('xml', 'image/svg+xml', b'<svg>')
+        self.assertExtractor('text', 'text/csv', b'a,b')
+
+    def test_skip(self):
+        self.assertExtractor(None, 'image/jpeg', b'')
+        self.assertExtractor(None, 'font/woff2', b'wOF2')
+        self.assertExtractor(None, 'text/html', b'\x89PNG\r\n')
+        self.assertExtractor(None, 'application/x-unknown', b'a\x00b')
+
+    def test_sniff(self):
+        self.assertExtractor('html', None, b'\xef\xbb\xbf\n <!doctype html>')
+        self.assertExtractor('html', 'application/octet-stream', HTML)
+        self.assertExtractor('xml', 'text/plain', b'<?xml version="1.0"?>')
+        self.assertExtractor('json', '', b'[1, 2]')
+        self.assertExtractor('text', 'text/plain', b'plain text')
+        self.assertExtractor(None, None, b'\x1f\x8b\x08')
+
+    def test_stats(self):
+        r = ExtractorRegistry()
+        r.register(Extractor('html', scan.HTML_PATTERN), ['text/html'])
+        r.skip(prefixes=['image/'])
+        self.assertSetEqual(r.extract_urls(PARENT, record('text/html', HTML)),
+                            {'https://example.com/page'})
+        self.assertSetEqual(r.extract_urls(PARENT, record('image/png', HTML)),
+                            set())
+        stats = r.stats()['html']
+        self.assertEqual(stats['records'], 1)
+        self.assertEqual(stats['size'], len(HTML))
+        self.assertEqual(stats['urls'], 1)
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(r.skipped, 1)
+
+    def test_merge(self):
+        r = ExtractorRegistry()
+        r.register(Extractor('html', scan.HTML_PATTERN), ['text/html'])
+        r.skip(prefixes=['image/'])
+        r.extract_urls(PARENT, record('text/html', HTML))
+        before = r.counters()
+        r.extract_urls(PARENT, record('text/html', HTML))
+        r.extract_urls(PARENT, record('image/png', HTML))
+        counters = r.counters_since(before)
+        self.assertEqual(counters['skipped'], 1)
+        self.assertEqual(counters['extractors']['html']['records'], 1)
+        self.assertEqual(counters['extractors']['html']['urls'], 1)
+        other = ExtractorRegistry()
+        other.register(Extractor('html', scan.HTML_PATTERN), ['text/html'])
+        other.merge(counters)
+        other.merge(counters)
+        self.assertEqual(other.skipped, 2)
+        self.assertEqual(other.stats()['html']['records'], 2)
+        self.assertEqual(other.stats()['html']['size'], 2 * len(HTML))
+        self.assertEqual(other.stats()['html']['misses'], 2)
+
+    def test_report(self):
+        r = ExtractorRegistry()
+        r.register(Extractor('html', scan.HTML_PATTERN), ['text/html'])
+        r.extract_urls(PARENT, record('text/html', HTML))
+        with self.assertLogs('webarchiver.extractor.registry') as logs:
+            r.report()
+        self.assertEqual(len(logs.output), 2)
+        self.assertIn('html scanned 1 payloads', logs.output[0])
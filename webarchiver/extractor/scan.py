@@ -0,0 +1,380 @@
+"""Single pass extraction of URLs.
+
+The payload is scanned in large chunks with a single regular expression that
+recognizes the places URLs are found in HTML, CSS, JavaScript and JSON. This
+replaces the many passes per line of :mod:`webarchiver.extractor.simple`.
+Smaller regular expressions are available for other types of payloads.
+"""
+import html
+import re
+import urllib.parse
+
+from webarchiver.config import *
+from webarchiver.dicts import LruDict
+
+MAX_URL_LENGTH = 2048
+"""The maximum length of an extracted URL in bytes."""
+
+_ATTRIBUTE = br'''
+    # An HTML attribute containing an URL.
+    \b(?P<attribute>href|src|action|data|poster|background|cite|longdesc
+        |formaction|manifest|data-src|data-href|content)
+    \s*=\s*
+    (?:"(?P<a1>[^"<>]{1,%(max)d})"
+      |'(?P<a2>[^'<>]{1,%(max)d})'
+      |(?P<a3>[^\s"'<>`=]{1,%(max)d}))
+'''
+_SRCSET = br'''
+    # An HTML srcset attribute with a list of URLs.
+    \bsrcset\s*=\s*(?:"(?P<s1>[^"<>]{1,%(max)d})"|'(?P<s2>[^'<>]{1,%(max)d})')
+'''
+_CSS = br'''
+    # A CSS url() or @import.
+    \burl\(\s*(?:"(?P<c1>[^"\s]{1,%(max)d})"|'(?P<c2>[^'\s]{1,%(max)d})'
+              |(?P<c3>[^)"'\s]{1,%(max)d}))\s*\)
+  | @import\s+(?:"(?P<c4>[^"\s]{1,%(max)d})"|'(?P<c5>[^'\s]{1,%(max)d})')
+'''
+_ABSOLUTE = br'''
+    # An absolute URL anywhere, possibly with JSON escaped slashes.
+    (?P<absolute>https?:(?:\\?/){2}(?:[^\s"'<>()\\`{}|^]|\\/){1,%(max)d})
+'''
+_PATH = br'''
+    # A quoted path in JavaScript or JSON.
+    ["'](?P<path>/(?:[^/"'\s<>\\]|\\?/)[^"'\s<>]{0,%(max)d})["']
+'''
+_LOC = br'''
+    # The location in a sitemap.
+    <loc>\s*(?P<loc>[^<\s]{1,%(max)d})\s*</loc>
+'''
+
+
+def _pattern(*parts):
+    """Compiles a regular expression matching one of the parts.
+
+    Args:
+        *parts (bytes): The regular expressions for the places URLs are found.
+
+    Returns:
+        :obj:`re.Pattern`: The compiled regular expression.
+    """
+    return re.compile(b'|'.join(parts) % {b'max': MAX_URL_LENGTH},
+                      re.IGNORECASE | re.VERBOSE)
+
+
+HTML_PATTERN = _pattern(_ATTRIBUTE, _SRCSET, _CSS, _ABSOLUTE, _PATH)
+"""The regular expression for URLs in HTML, including styles and scripts."""
+
+CSS_PATTERN = _pattern(_CSS, _ABSOLUTE)
+"""The regular expression for URLs in CSS."""
+
+SCRIPT_PATTERN = _pattern(_ABSOLUTE, _PATH)
+"""The regular expression for URLs in JavaScript and JSON."""
+
+XML_PATTERN = _pattern(_LOC, _ATTRIBUTE, _ABSOLUTE)
+"""The regular expression for URLs in XML, including sitemaps and feeds."""
+
+TEXT_PATTERN = _pattern(_ABSOLUTE)
+"""The regular expression for URLs in plain text."""
+
+_ATTRIBUTE_GROUPS = frozenset(['a1', 'a2', 'a3'])
+_SRCSET_GROUPS = frozenset(['s1', 's2'])
+_ESCAPED_GROUPS = frozenset(['absolute', 'path'])
+_SKIP_SCHEMES = (b'javascript:', b'mailto:', b'data:', b'tel:', b'about:',
+                 b'#')
+_MAX_MATCH_LENGTH = MAX_URL_LENGTH + 64
+_CONTENT_URL = re.compile(br'https?://[^\s"\'<>]+', re.IGNORECASE)
+_ORIGIN = re.compile(r'^[^:/?#]+://[^/?#]*')
+_PATH_END = re.compile(r'[?#]')
+_RELATIVE = re.compile(r'[^:/?#;\\]+(?:[/?]|$)|\?')
+_CONTROL = re.compile(r'^[\x00-\x20]|[\t\r\n]')
+_SAFE = re.compile(r"[A-Za-z0-9!$&'()*+,/:;=?@\[\]\-._~%]*")
+_MISSING = object()
+
+
+def extract_urls(parenturl, record, chunk_size=SCAN_CHUNK_SIZE,
+                 pattern=HTML_PATTERN):
+    """Extracts the URLs from the payload of a WARC record.
+
+    Args:
+        parenturl (str): The URL of the record.
+        record (:obj:`warcio.recordloader.ArcWarcRecord`): The WARC record.
+        chunk_size (int, optional): The number of bytes to scan at once.
+            Default is ``SCAN_CHUNK_SIZE``.
+        pattern (:obj:`re.Pattern`, optional): The regular expression for the
+            URLs. Default is ``HTML_PATTERN``.
+
+    Returns:
+        set of str: The discovered URLs.
+    """
+    stream = record.content_stream()
+    return scan(parenturl, iter(lambda: stream.read(chunk_size), b''),
+                pattern)
+
+
+def scan(parenturl, chunks, pattern=HTML_PATTERN):
+    """Extracts the URLs from chunks of data.
+
+    Args:
+        parenturl (str): The URL the data was found at.
+        chunks (iterable of bytes): The data.
+        pattern (:obj:`re.Pattern`, optional): The regular expression for the
+            URLs. Default is ``HTML_PATTERN``.
+
+    Returns:
+        set of str: The discovered URLs.
+    """
+    scanner = Scanner(parenturl, pattern)
+    for chunk in chunks:
+        scanner.feed(chunk)
+    return scanner.close()
+
+
+class Scanner:
+    """Extracts URLs from data while it is received.
+
+    A candidate URL at the end of a chunk is carried over to the next chunk,
+    so the result does not depend on the size of the chunks.
+
+    Attributes:
+        parenturl (str): The URL the data was found at.
+        base (:obj:`BaseUrl`): The parts of the parent URL used to resolve
+            the candidate URLs, counting the resolutions found in its cache.
+    """
+
+    def __init__(self, parenturl, pattern=HTML_PATTERN):
+        """Inits the scanner.
+
+        Args:
+            parenturl (str): The URL the data was found at.
+            pattern (:obj:`re.Pattern`, optional): The regular expression for
+                the URLs. Default is ``HTML_PATTERN``.
+        """
+        self.parenturl = parenturl
+        self.base = BaseUrl(parenturl)
+        self._pattern = pattern
+        self._candidates = set()
+        self._rest = b''
+
+    def feed(self, chunk):
+        """Scans the next chunk of data.
+
+        Args:
+            chunk (bytes): The data.
+        """
+        data = self._rest + chunk
+        limit = len(data) - _MAX_MATCH_LENGTH
+        end = 0
+        for match in self._pattern.finditer(data):
+            if match.start() >= limit:
+                break
+            _add_candidates(self._candidates, match)
+            end = match.end()
+        self._rest = data[max(limit, end):]
+
+    def close(self):
+        """Scans the rest of the data and resolves the candidate URLs.
+
+        Returns:
+            set of str: The discovered URLs.
+        """
+        for match in self._pattern.finditer(self._rest):
+            _add_candidates(self._candidates, match)
+        self._rest = b''
+        urls = set()
+        for candidate in self._candidates:
+            url = resolve(self.parenturl, candidate, self.base)
+            if url is not None:
+                urls.add(url)
+        return urls
+
+
+def _add_candidates(candidates, match):
+    """Adds the candidate URLs found by a match.
+
+    The group containing the candidate is the last group of the match.
+
+    Args:
+        candidates (set of bytes): The candidate URLs.
+        match (:obj:`re.Match`): The match.
+    """
+    name = match.lastgroup
+    value = match.group(name)
+    if name in _ESCAPED_GROUPS:
+        candidates.add(value.replace(b'\\/', b'/'))
+    elif name in _SRCSET_GROUPS:
+        for part in value.split(b','):
+            part = part.split(None, 1)
+            if len(part) > 0:
+                candidates.add(part[0])
+    elif name in _ATTRIBUTE_GROUPS \
+            and match.group('attribute').lower() == b'content':
+        url = _CONTENT_URL.search(value)
+        if url is not None:
+            candidates.add(url.group())
+    else:
+        candidates.add(value)
+
+
+def resolve(parenturl, candidate, base=None):
+    """Resolves a candidate URL against the URL it was found at.
+
+    HTML entities are unescaped and the fragment is removed before the
+    candidate is resolved with :func:`BaseUrl.resolve`.
+
+    Args:
+        parenturl (str): The URL the candidate was found at.
+        candidate (bytes): The candidate URL.
+        base (:obj:`BaseUrl`, optional): The parts of the parent URL, to be
+            shared by all candidates of a record. Default is None, which gets
+            them from `parenturl`.
+
+    Returns:
+        str: The resolved URL, or None if the candidate is not a HTTP or HTTPS
+            URL.
+    """
+    candidate = candidate.strip()
+    if len(candidate) == 0 or candidate.lower().startswith(_SKIP_SCHEMES):
+        return None
+    try:
+        candidate = str(candidate, 'utf-8')
+    except UnicodeDecodeError:
+        return None
+    if '&' in candidate:
+        candidate = html.unescape(candidate)
+    candidate = candidate.split('#', 1)[0]
+    if base is None:
+        base = BaseUrl(parenturl)
+    return base.resolve(candidate)
+
+
+class BaseUrl:
+    """The parts of the URL a record was found at, used to resolve the
+    relative URLs found in the record.
+
+    The parts are found once per record instead of once per candidate URL.
+    Candidates that only differ in their fragment or in HTML entities are
+    the same after :func:`resolve`, so the resolved URLs are kept in a cache
+    of ``SCAN_CACHE_SIZE`` candidates.
+
+    Attributes:
+        url (str): The parent URL.
+    """
+
+    def __init__(self, url, cache_size=SCAN_CACHE_SIZE):
+        """Inits the parts of the parent URL.
+
+        Args:
+            url (str): The parent URL.
+            cache_size (int, optional): The maximum number of resolved URLs
+                kept. Default is ``SCAN_CACHE_SIZE``.
+        """
+        self.url = url
+        self._scheme = url.split(':', 1)[0].lower()
+        self._origin = _origin(url)
+        if self._origin is not None:
+            self._origin = self._scheme + self._origin[len(self._scheme):]
+        self._path = None
+        self._directory = None
+        if url.startswith(('http://', 'https://')) \
+                and _CONTROL.search(url) is None:
+            path = _PATH_END.split(url[len(self._origin):], 1)[0]
+            if ';' not in path:
+                self._path = self._origin + path
+                self._directory = (self._path if path else self._path + '/') \
+                    .rsplit('/', 1)[0] + '/'
+        self._cache = LruDict(cache_size)
+
+    @property
+    def hits(self):
+        """int: The number of candidates found in the cache."""
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        """int: The number of candidates not found in the cache."""
+        return self._cache.misses
+
+    def resolve(self, candidate):
+        """Resolves a candidate URL against the parent URL.
+
+        Characters that are not allowed in an URL are quoted. Absolute URLs,
+        and relative URLs without dot segments or a scheme, are resolved with
+        the parts of the parent URL instead of :func:`urllib.parse.urljoin`.
+
+        Args:
+            candidate (str): The candidate URL, without fragment.
+
+        Returns:
+            str: The resolved URL, or None if the candidate is not a HTTP or
+                HTTPS URL.
+        """
+        url = self._cache.get(candidate, _MISSING)
+        if url is _MISSING:
+            url = self._resolve(candidate)
+            self._cache[candidate] = url
+        return url
+
+    def _resolve(self, candidate):
+        """Resolves a candidate URL without the cache, see :func:`resolve`.
+
+        Args:
+            candidate (str): The candidate URL, without fragment.
+
+        Returns:
+            str: The resolved URL, or None if the candidate is not a HTTP or
+                HTTPS URL.
+        """
+        if '/.' in candidate or candidate.startswith('.'):
+            url = None
+        elif candidate.startswith(('http://', 'https://')):
+            url = candidate
+        else:
+            url = self.join(candidate)
+        if url is None:
+            try:
+                url = urllib.parse.urljoin(self.url, candidate)
+            except ValueError:
+                return None
+        if not url.startswith(('http://', 'https://')) or len(url) <= 8:
+            return None
+        if _SAFE.fullmatch(url) is None:
+            url = urllib.parse.quote(url, "!$&'()*+,/:;=?@[]-._~%")
+        return url
+
+    def join(self, candidate):
+        """Resolves a relative URL without dot segments.
+
+        Args:
+            candidate (str): The relative URL, without fragment.
+
+        Returns:
+            str: The resolved URL, or None if the URL should be resolved with
+                :func:`urllib.parse.urljoin`.
+        """
+        if candidate.startswith('//'):
+            return self._scheme + ':' + candidate
+        if candidate.startswith('/'):
+            return None if self._origin is None else self._origin + candidate
+        if self._path is None or _RELATIVE.match(candidate) is None \
+                or '//' in candidate or candidate.endswith('?') \
+                or _CONTROL.search(candidate) is not None:
+            return None
+        if candidate.startswith('?'):
+            return self._path + candidate
+        return self._directory + candidate
+
+    def __repr__(self):
+        return '<{} at 0x{:x} url={}>'.format(__name__, id(self), self.url)
+
+
+def _origin(url):
+    """Gets the scheme and host of an URL.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The scheme and host, or None if the URL has no host.
+    """
+    match = _ORIGIN.match(url)
+    return match.group() if match else None
@@ -0,0 +1,159 @@
+"""Benchmark for scan.py.
+
+Extracts URLs from a generated corpus of HTML pages, stylesheets and JSON
+documents with :mod:`webarchiver.extractor.simple` and
+:mod:`webarchiver.extractor.scan`, and prints the throughput and the number
+of unique URLs found. The HTML pages are measured both with line breaks and
+minified to a single line.
+"""
+import io
+import random
+import time
+
+from webarchiver.extractor import scan, simple
+
+PARENT = 'https://example.com/section/index.html'
+DOCUMENTS = 40
+
+
+class Record:
+    """A WARC record with only a payload."""
+
+    def __init__(self, payload):
+        """Inits the record.
+
+        Args:
+            payload (bytes): The payload.
+        """
+        self.payload = payload
+
+    def content_stream(self):
+        """Gets the payload as stream.
+
+        Returns:
+            :obj:`io.BytesIO`: The payload.
+        """
+        return io.BytesIO(self.payload)
+
+
+def html_page(r):
+    """Generates a HTML page with links, images, styles and a script.
+
+    Args:
+        r (:obj:`random.Random`): The random number generator.
+
+    Returns:
+        bytes: The page.
+    """
+    lines = ['<!DOCTYPE html><html><head><title>Page</title>',
+             '<link rel="stylesheet" href="/static/site.css">',
+             '<style>.logo{background:url("/img/logo.png")}</style>',
+             '</head><body><div class="content">']
+    for i in range(300):
+        n = r.randrange(10000)
+        kind = r.randrange(6)
+        if kind == 0:
+            lines.append('<p>Some text about item {0} with <a href="/item/{0}'
+                         '?ref=list&amp;page=2">a link</a>.</p>'.format(n))
+        elif kind == 1:
+            lines.append('<img src="https://cdn.example.com/{0}.jpg" '
+                         'srcset="/img/{0}-1x.jpg 1x, /img/{0}-2x.jpg 2x" '
+                         'alt="Image {0}">'.format(n))
+        elif kind == 2:
+            lines.append('<a href="../other/{0}.html" class="nav">Other {0}'
+                         '</a>'.format(n))
+        elif kind == 3:
+            lines.append('<div class="text">Lorem ipsum dolor sit amet, '
+                         'consectetur adipiscing elit {}.</div>'.format(n))
+        elif kind == 4:
+            lines.append('<a href="https://example.org/page/{0}#c">External'
+                         '</a> <a href="javascript:void(0)">JS</a>'.format(n))
+        else:
+            lines.append('<script>var item = {{"id": {0}, "url": '
+                         '"https:\\/\\/api.example.com\\/items\\/{0}"}};'
+                         'load("/api/items/{0}");</script>'.format(n))
+    lines.append('</div></body></html>')
+    return '\n'.join(lines).encode()
+
+
+def stylesheet(r):
+    """Generates a stylesheet with images.
+
+    Args:
+        r (:obj:`random.Random`): The random number generator.
+
+    Returns:
+        bytes: The stylesheet.
+    """
+    rules = ['@import url("/static/base.css");']
+    for i in range(500):
+        rules.append('.c{0} {{ color: #333; background: url(/img/bg{0}.png) '
+                     'no-repeat; }}'.format(r.randrange(10000)))
+    return '\n'.join(rules).encode()
+
+
+def json_document(r):
+    """Generates a JSON document with escaped URLs.
+
+    Args:
+        r (:obj:`random.Random`): The random number generator.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    items = ['{{"id":{0},"title":"Item {0}","link":"https:\\/\\/example.com'
+             '\\/item\\/{0}","image":"/img/{0}.png"}}'
+             .format(r.randrange(10000)) for i in range(500)]
+    return ('{"items":[' + ','.join(items) + ']}').encode()
+
+
+def corpus():
+    """Generates the corpus.
+
+    Returns:
+        dict of str and list of bytes: The documents of each kind.
+    """
+    r = random.Random(0)
+    pages = [html_page(r) for i in range(DOCUMENTS)]
+    return {
+        'html': pages,
+        'html minified': [page.replace(b'\n', b'') for page in pages],
+        'css': [stylesheet(r) for i in range(DOCUMENTS)],
+        'json': [json_document(r) for i in range(DOCUMENTS)],
+    }
+
+
+def measure(extract, documents):
+    """Measures the throughput of an extractor.
+
+    Args:
+        extract (function): The function extracting URLs from a record.
+        documents (list of bytes): The documents.
+
+    Returns:
+        tuple of (float, int): The throughput in MB/s and the number of
+            unique URLs.
+    """
+    found = 0
+    start = time.perf_counter()
+    for document in documents:
+        found += len(set(extract(PARENT, Record(document))))
+    duration = time.perf_counter() - start
+    return sum(len(d) for d in documents) / duration / 1e6, found
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    print('{:<16}{:>10}{:>14}{:>12}{:>14}{:>12}'.format(
+        'corpus', 'size', 'simple', 'urls', 'scan', 'urls'))
+    for name, documents in corpus().items():
+        simple.process_find.cache_clear()
+        simple.process_find_href.cache_clear()
+        simple_speed, simple_found = measure(simple.extract_urls, documents)
+        scan_speed, scan_found = measure(scan.extract_urls, documents)
+        print('{:<16}{:>8.1f}MB{:>9.2f}MB/s{:>12}{:>9.2f}MB/s{:>12}'.format(
+            name, sum(len(d) for d in documents) / 1e6, simple_speed,
+            simple_found, scan_speed, scan_found))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Tests for scan.py."""
+import io
+import unittest
+import urllib.parse
+
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from webarchiver.extractor.scan import (BaseUrl, Scanner, extract_urls,
+                                        resolve, scan)
+
+PARENT = 'https://example.com/dir/index.html'
+PAGE = b'''<html><head>
+<meta http-equiv="refresh" content="0; url=http://example.com/refresh">
+<link rel=stylesheet href=/style.css></head>
+<body><a href="page.html?a=1&amp;b=2#top">x</a><a href='javascript:void(0)'>
+<img srcset="/a.png 1x, /b.png 2x" src='//cdn.example.com/c.png'>
+<style>body{background:url( "/bg.png" )} @import '/more.css';</style>
+<script>var x = {"u": "https:\\/\\/example.org\\/json"}; fetch("/api?x=1");
+</script>Visit https://example.net/text now. <a href="mailto:a@b.c">m</a>
+<a href="/style.css">again</a></body></html>'''
+URLS = {
+    'http://example.com/refresh',
+    'https://example.com/style.css',
+    'https://example.com/dir/page.html?a=1&b=2',
+    'https://example.com/a.png',
+    'https://example.com/b.png',
+    'https://cdn.example.com/c.png',
+    'https://example.com/bg.png',
+    'https://example.com/more.css',
+    'https://example.org/json',
+    'https://example.com/api?x=1',
+    'https://example.net/text',
+}
+
+
+class TestScan(unittest.TestCase):
+    """Tests for the single pass extractor."""
+
+    def test_contexts(self):
+        self.assertSetEqual(scan(PARENT, [PAGE]), URLS)
+
+    def test_chunks(self):
+        for size in (1, 7, 100):
+            chunks = [PAGE[i:i+size] for i in range(0, len(PAGE), size)]
+            self.assertSetEqual(scan(PARENT, chunks), URLS, size)
+
+    def test_record(self):
+        f = io.BytesIO()
+        writer = WARCWriter(filebuf=f, gzip=False)
+        writer.write_record(writer.create_warc_record(
+            PARENT, 'response', payload=io.BytesIO(PAGE), length=len(PAGE),
+            http_headers=StatusAndHeaders('200 OK', [
+                ('Content-Type', 'text/html')
+            ], protocol='HTTP/1.1')
+        ))
+        f.seek(0)
+        record = next(iter(ArchiveIterator(f)))
+        self.assertSetEqual(extract_urls(PARENT, record, 64), URLS)
+
+    def test_resolve(self):
+        self.assertEqual(resolve(PARENT, b'../up'), 'https://example.com/up')
+        self.assertEqual(resolve(PARENT, b'/a b'),
+                         'https://example.com/a%20b')
+        self.assertEqual(resolve(PARENT, b'/a%20b'),
+                         'https://example.com/a%20b')
+        self.assertIsNone(resolve(PARENT, b'#top'))
+        self.assertIsNone(resolve(PARENT, b'ftp://example.com/'))
+        self.assertIsNone(resolve(PARENT, b'\xff'))
+
+    def test_base_url(self):
+        for parenturl in (PARENT, 'https://example.com',
+                          'https://example.com/a?b=/c', 'HTTPS://example.com/',
+                          'https://example.com/a;b'):
+            base = BaseUrl(parenturl)
+            for candidate in ('a', 'a/b?c', '?d', 'e//f', 'g?', 'a:b',
+                              'a\tb', '\x00a', '//other.com/h', '/i'):
+                url = base.join(candidate)
+                if url is not None:
+                    self.assertEqual(
+                        url, urllib.parse.urljoin(parenturl, candidate),
+                        (parenturl, candidate)
+                    )
+        self.assertEqual(BaseUrl(PARENT).join('a/b?c'),
+                         'https://example.com/dir/a/b?c')
+        self.assertIsNone(BaseUrl(PARENT).join('e//f'))
+
+    def test_base_url_cache(self):
+        scanner = Scanner(PARENT)
+        scanner.feed(b'<a href="/a#x"><a href="/a#y"><a href=" /a&#35;z">')
+        self.assertSetEqual(scanner.close(), {'https://example.com/a'})
+        self.assertEqual(scanner.base.misses, 1)
+        self.assertEqual(scanner.base.hits, 2)
+        base = BaseUrl(PARENT, 1)
+        for candidate in ('a', 'a', 'b', 'a'):
+            base.resolve(candidate)
+        self.assertEqual(base.hits, 1)
+        self.assertEqual(base.misses, 3)
@@ -1,4 +1,8 @@
-"""Simple extraction of URLs."""
+"""Simple extraction of URLs.
+
+URLs are extracted with :mod:`webarchiver.extractor.scan` when crawling. This
+module is kept as the baseline of :mod:`webarchiver.extractor.scan_benchmark`.
+"""
 import functools
 import re
 import string
@@ -17,10 +21,23 @@ def extract_urls(parenturl, record):
     Yields:
         str: The discovered URL.
     """
-    for line in iter(record.content_stream().readline, ''):
-        if line == b'':
-            break
-        for url in extract(bytes(parenturl, 'UTF8'), line):
+    lines = iter(record.content_stream().readline, b'')
+    yield from extract_lines(parenturl, lines)
+
+
+def extract_lines(parenturl, lines):
+    """Parses lines of data and yield extracted URLs.
+
+    Args:
+        parenturl (str): The parent URL.
+        lines (iterable of bytes): The lines of data.
+
+    Yields:
+        str: The discovered URL.
+    """
+    parenturl = bytes(parenturl, 'UTF8')
+    for line in lines:
+        for url in extract(parenturl, line):
             if type(url) is bytes \
                     and all(byte in printable_bytes for byte in url):
                 url = str(url, 'UTF8').strip()
@@ -0,0 +1,90 @@
+"""Handing over items from crawl threads to the server loop."""
+import queue
+import threading
+
+from webarchiver.config import *
+
+
+class HandoffQueue:
+    """A queue from many producer threads to a single consumer.
+
+    Producers add items without waiting, the consumer takes all waiting items
+    at once with :func:`drain`. Items are counted as unfinished until the
+    consumer reports them done with :func:`done`. The queue is bounded by
+    producers checking :attr:`full` before they start work that produces
+    items, so adding items never fails.
+
+    Attributes:
+        maxsize (int): The number of unfinished items at which the queue is
+            full.
+        notify (function): The function called after items are added, or
+            None. This should not wait on I/O.
+    """
+
+    def __init__(self, maxsize=HANDOFF_QUEUE_SIZE, notify=None):
+        """Inits the queue.
+
+        Args:
+            maxsize (int, optional): The number of unfinished items at which
+                the queue is full. Default is ``HANDOFF_QUEUE_SIZE``.
+            notify (function, optional): The function called after items are
+                added, for example to wake the server loop. Default is None.
+        """
+        self.maxsize = maxsize
+        self.notify = notify
+        self._queue = queue.SimpleQueue()
+        self._unfinished = 0
+        self._lock = threading.Lock()
+
+    def put(self, item):
+        """Adds an item.
+
+        Args:
+            item: The item.
+        """
+        self.put_many((item,))
+
+    def put_many(self, items):
+        """Adds items at once.
+
+        Args:
+            items (iterable): The items.
+        """
+        items = list(items)
+        if len(items) == 0:
+            return None
+        with self._lock:
+            self._unfinished += len(items)
+        self._queue.put(items)
+        if self.notify is not None:
+            self.notify()
+
+    def drain(self):
+        """Takes all waiting items.
+
+        Returns:
+            list: The items in the order they were added.
+        """
+        items = []
+        while True:
+            try:
+                items.extend(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+
+    def done(self, count=1):
+        """Reports taken items as finished.
+
+        Args:
+            count (int, optional): The number of finished items. Default is 1.
+        """
+        with self._lock:
+            self._unfinished -= count
+
+    @property
+    def full(self):
+        """bool: Whether there are ``maxsize`` or more unfinished items."""
+        return self._unfinished >= self.maxsize
+
+    def __len__(self):
+        return self._unfinished
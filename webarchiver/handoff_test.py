@@ -0,0 +1,47 @@
+"""Tests for handoff.py."""
+import threading
+import unittest
+
+from webarchiver.handoff import HandoffQueue
+
+
+class TestHandoffQueue(unittest.TestCase):
+    """Tests for handing over items to a single consumer."""
+
+    def test_drain(self):
+        queue = HandoffQueue()
+        queue.put('a')
+        queue.put_many(['b', 'c'])
+        queue.put_many([])
+        self.assertListEqual(queue.drain(), ['a', 'b', 'c'])
+        self.assertListEqual(queue.drain(), [])
+
+    def test_done(self):
+        queue = HandoffQueue(maxsize=3)
+        queue.put_many(['a', 'b', 'c'])
+        self.assertTrue(queue.full)
+        queue.drain()
+        self.assertEqual(len(queue), 3)
+        queue.done(2)
+        self.assertEqual(len(queue), 1)
+        self.assertFalse(queue.full)
+
+    def test_notify(self):
+        notified = []
+        queue = HandoffQueue(notify=lambda: notified.append(True))
+        queue.put_many([])
+        self.assertListEqual(notified, [])
+        queue.put('a')
+        self.assertListEqual(notified, [True])
+
+    def test_threads(self):
+        queue = HandoffQueue()
+        threads = [threading.Thread(target=queue.put_many,
+                                    args=(range(i * 100, (i + 1) * 100),))
+                   for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertListEqual(sorted(queue.drain()), list(range(1000)))
+        self.assertEqual(len(queue), 1000)
@@ -0,0 +1,120 @@
+"""Consistent hashing ring."""
+import bisect
+import hashlib
+
+from webarchiver.config import *
+
+
+def ring_hash(key):
+    """Hashes a key to a position on the ring.
+
+    The position is the same on every server, unlike the builtin ``hash``.
+
+    Args:
+        key (str): The key to hash.
+
+    Returns:
+        int: The position of the key on the ring.
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'),
+                                          digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """A consistent hashing ring with virtual nodes.
+
+    Each node is placed on the ring at ``replicas`` positions derived from its
+    name. A key is owned by the first node found going clockwise from the
+    position of the key. Adding or removing a node only moves the keys
+    between the positions of that node and the positions before them.
+
+    Attributes:
+        replicas (int): The number of positions of each node on the ring.
+    """
+
+    def __init__(self, replicas=HASH_RING_REPLICAS):
+        """Inits an empty ring.
+
+        Args:
+            replicas (int, optional): The number of positions of each node.
+                Default is ``HASH_RING_REPLICAS``.
+        """
+        self.replicas = replicas
+        self._positions = []
+        self._nodes = []
+        self._names = {}
+
+    def add(self, name, node):
+        """Adds a node to the ring.
+
+        Args:
+            name (str): The name of the node, which should be the same on
+                every server.
+            node: The node, returned when a key is looked up.
+        """
+        if name in self._names:
+            self.remove(name)
+        self._names[name] = node
+        for i in range(self.replicas):
+            position = ring_hash('{}#{}'.format(name, i))
+            index = bisect.bisect(self._positions, position)
+            self._positions.insert(index, position)
+            self._nodes.insert(index, name)
+
+    def remove(self, name):
+        """Removes a node from the ring.
+
+        Args:
+            name (str): The name of the node.
+        """
+        if name not in self._names:
+            return None
+        del self._names[name]
+        kept = [(p, n) for p, n in zip(self._positions, self._nodes)
+                if n != name]
+        self._positions = [p for p, n in kept]
+        self._nodes = [n for p, n in kept]
+
+    def get(self, key):
+        """Gets the node owning a key.
+
+        Args:
+            key (str): The key to look up.
+
+        Returns:
+            The node owning the key, or None if the ring is empty.
+        """
+        nodes = self.get_nodes(key, 1)
+        return nodes[0] if len(nodes) > 0 else None
+
+    def get_nodes(self, key, count):
+        """Gets the distinct nodes following a key on the ring.
+
+        The first node is the owner of the key, the following nodes are the
+        nodes to replicate the key to.
+
+        Args:
+            key (str): The key to look up.
+            count (int): The maximum number of nodes to get.
+
+        Returns:
+            list: Up to count distinct nodes.
+        """
+        count = min(count, len(self._names))
+        if count == 0:
+            return []
+        index = bisect.bisect(self._positions, ring_hash(key))
+        names = []
+        for i in range(len(self._nodes)):
+            name = self._nodes[(index + i) % len(self._nodes)]
+            if name not in names:
+                names.append(name)
+                if len(names) == count:
+                    break
+        return [self._names[name] for name in names]
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, name):
+        return name in self._names
@@ -0,0 +1,54 @@
+"""Tests for hashring.py."""
+import unittest
+
+from webarchiver.hashring import HashRing
+
+
+def build_ring(names):
+    """Creates a ring with nodes that are their own name.
+
+    Args:
+        names (iterable of str): The names of the nodes.
+
+    Returns:
+        :obj:`webarchiver.hashring.HashRing`: The created ring.
+    """
+    ring = HashRing()
+    for name in names:
+        ring.add(name, name)
+    return ring
+
+
+class TestHashRing(unittest.TestCase):
+    """Tests for the consistent hashing ring."""
+
+    def test_empty(self):
+        ring = HashRing()
+        self.assertIsNone(ring.get('example.com'))
+        self.assertListEqual(ring.get_nodes('example.com', 3), [])
+
+    def test_deterministic(self):
+        names = ['a:3000', 'b:3000', 'c:3000']
+        ring_1 = build_ring(names)
+        ring_2 = build_ring(reversed(names))
+        for i in range(100):
+            key = 'example{}.com'.format(i)
+            self.assertListEqual(ring_1.get_nodes(key, 2),
+                                 ring_2.get_nodes(key, 2))
+
+    def test_distinct_nodes(self):
+        ring = build_ring(['a:3000', 'b:3000', 'c:3000'])
+        nodes = ring.get_nodes('example.com', 5)
+        self.assertEqual(len(nodes), 3)
+        self.assertEqual(len(set(nodes)), 3)
+
+    def test_minimal_movement(self):
+        ring = build_ring(['a:3000', 'b:3000', 'c:3000'])
+        keys = ['example{}.com'.format(i) for i in range(1000)]
+        before = {key: ring.get(key) for key in keys}
+        ring.add('d:3000', 'd:3000')
+        moved = [key for key in keys if ring.get(key) != before[key]]
+        self.assertTrue(all(ring.get(key) == 'd:3000' for key in moved))
+        self.assertTrue(100 < len(moved) < 400)
+        ring.remove('d:3000')
+        self.assertDictEqual({key: ring.get(key) for key in keys}, before)
@@ -8,6 +8,8 @@ import time
 
 from webarchiver.config import *
 from webarchiver.job.archive import ArchiveUrls
+from webarchiver.job.fetch import FetchUrls
+from webarchiver.job.frontier import Frontier
 from webarchiver.url import UrlConfig
 from webarchiver.utils import *
 
@@ -46,27 +48,36 @@ class Job(threading.Thread):
             available. False by default.
     """
 
-    def __init__(self, identifier, set_files, set_urls, set_found):
+    def __init__(self, identifier, queue_files, queue_urls, queue_found,
+                 executor):
         """Inits the crawl job.
 
         Note:
             The job is a subclass of :class:`threading.Thread`.
         Args:
             identifier (str): The job identifier.
-            set_files (set): The set to which files are added to be uploaded.
-            set_urls (set): The set to which finished URLs are added.
-            set_found (set): The set to which discovered URL are added.
+            queue_files (:obj:`webarchiver.handoff.HandoffQueue`): The queue
+                to which files are added to be uploaded.
+            queue_urls (:obj:`webarchiver.handoff.HandoffQueue`): The queue
+                to which finished URLs are added.
+            queue_found (:obj:`webarchiver.handoff.HandoffQueue`): The queue
+                to which discovered URL are added.
+            executor (:obj:`webarchiver.job.executor.CrawlExecutor`): The
+                executor to run the crawls on.
         """
         threading.Thread.__init__(self)
         self._identifier = identifier
         self._directory = os.path.join(CRAWLS_DIRECTORY, self._identifier)
-        self._urls = set()
-        self._set_files = set_files
-        self._set_urls = set_urls
-        self._set_found = set_found
+        self._frontier = Frontier()
+        self._queue_files = queue_files
+        self._queue_urls = queue_urls
+        self._queue_found = queue_found
         self._last_time = 0
         self._last_time_url = 0
-        self._crawls = []
+        self._executor = executor
+        self._crawl_queued = False
+        self._retry_time = 0
+        self._condition = threading.Condition()
         self.finished = False
         self._url_quota = 0
         logger.debug('Created archive job %s.', self)
@@ -76,25 +87,65 @@ class Job(threading.Thread):
 
         A crawl if only started if at least one URL is queued for archival and
         a minimum quota ``CRAWLER_MIN_URL_QUOTA`` of URLs to be archived is
-        set. Besides this there should be a minimum of JOB_MAX_URLS URLs 
+        set. Besides this there should be a minimum of JOB_MAX_URLS URLs
         queued, a minimum of JOB_MAX_WAIT seconds since the last crawl or a
-        minimum of JOB_MAX_WAIT_URLS seconds since the last URL was added.
+        minimum of JOB_MAX_WAIT_URLS seconds since the last URL was added, or
+        URLs left over from the last crawl. A host of the queued URLs should be
+        ready to be crawled, see :class:`webarchiver.job.frontier.Frontier`.
+
+        Between crawls the loop sleeps until the first of these deadlines, or
+        until it is woken by :func:`add_url`, :func:`increase_url_quota`,
+        :func:`stop` or a crawl starting or failing, see :func:`_crawl_wait`.
+        """
+        with self._condition:
+            while not self.finished:
+                wait = self._crawl_wait()
+                if wait == 0:
+                    self.run_crawl()
+                    wait = self._crawl_wait()
+                self._condition.wait(wait)
+
+    def _crawl_wait(self):
+        """Gets the time until a crawl should be started.
+
+        Returns:
+            float: The number of seconds until a crawl should be started, 0 if
+                a crawl should be started now, or None if no crawl should be
+                started until the job is woken.
         """
-        while not self.finished:
-            if len(self._urls) > 0 \
-                    and self._url_quota >= CRAWLER_MIN_URL_QUOTA \
-                    and (check_time(self._last_time, JOB_MAX_WAIT)
-                    or check_time(self._last_time_url, JOB_MAX_WAIT_URLS)
-                    or len(self._urls) >= JOB_MAX_URLS):
-                self.run_crawl()
-            time.sleep(1)
+        if self._crawl_queued or len(self._frontier) == 0 \
+                or self._url_quota < CRAWLER_MIN_URL_QUOTA:
+            return None
+        ready = self._frontier.ready_time()
+        if ready is None:
+            return None
+        now = time.time()
+        if max(self._retry_time, ready) > now:
+            return max(self._retry_time, ready) - now
+        if len(self._frontier) >= JOB_MAX_URLS or self._frontier.backlog > 0 \
+                or check_time(self._last_time, JOB_MAX_WAIT) \
+                or check_time(self._last_time_url, JOB_MAX_WAIT_URLS):
+            return 0
+        return max(min(self._last_time + JOB_MAX_WAIT,
+                       self._last_time_url + JOB_MAX_WAIT_URLS) - now, 0.001)
 
     def run_crawl(self):
-        """Starts a thread for a new crawl with :func:`self._new_crawl`."""
-        self._last_time = time.time()
-        self._crawls.append(threading.Thread(target=self._new_crawl))
-        self._crawls[-1].daemon = True
-        self._crawls[-1].start()
+        """Queues a new crawl with :func:`self._new_crawl` on the executor.
+
+        Only one crawl of the job waits in the queue of the executor at a
+        time. If the queue of the executor or a queue for the output of the
+        crawl is full, the crawl is tried again after ``JOB_RETRY_WAIT``
+        seconds.
+        """
+        if self._crawl_queued:
+            return None
+        if not (self._queue_files.full or self._queue_urls.full
+                or self._queue_found.full) \
+                and self._executor.submit(self._new_crawl):
+            self._last_time = time.time()
+            self._crawl_queued = True
+        else:
+            self._retry_time = time.time() + JOB_RETRY_WAIT
 
     def increase_url_quota(self, quota):
         """Increases the URL quota.
@@ -104,45 +155,72 @@ class Job(threading.Thread):
         """
         logger.debug('Increasing URL quota for archive job %s with %s.', self,
                      quota)
-        self._url_quota += quota
+        with self._condition:
+            self._url_quota += quota
+            if self._url_quota >= CRAWLER_MIN_URL_QUOTA:
+                self._condition.notify()
+
+    def stop(self):
+        """Stops the loop of the job."""
+        with self._condition:
+            self.finished = True
+            self._condition.notify()
 
     def _new_crawl(self):
         """Runs a crawl and handles the output.
 
-        The current queued :class:`webarchiver.url.UrlConfig` objects are taken
-        and extacted URLs are archived using
-        :class:`webarchiver.job.archive.ArchiveUrls`. The resulting WARCs,
-        finished URLs and discovered URLs are added to their sets. The
-        discovered URLs have their parent URL set to the old URL and have their
-        depth increased.
+        A batch of queued :class:`webarchiver.url.UrlConfig` objects from as
+        many hosts as possible is taken from the frontier and extacted URLs
+        are archived using
+        :class:`webarchiver.job.archive.ArchiveUrls`, which processes the WARC
+        on the process pool of the executor, or using
+        :class:`webarchiver.job.fetch.FetchUrls` if ``CRAWL_ENGINE`` is
+        ``'fetch'``. The resulting WARCs, finished URLs and discovered URLs are
+        added to their queues. The discovered URLs have their parent URL set
+        to the old URL and have their depth increased. If the crawl failed,
+        the URLs are queued again.
         """
         logger.debug('Starting new crawl for archive job %s.', self)
-        quota = min(self._url_quota, len(self._urls))
-        urls = {self._urls.pop() for i in range(quota)}
-        urls_depths = {urlconfig.url: urlconfig.depth for urlconfig in urls} 
-        self._url_quota -= quota
-        self._urls.difference_update(urls)
+        with self._condition:
+            self._crawl_queued = False
+            urls = self._frontier.take(self._url_quota)
+            self._url_quota -= len(urls)
+            self._condition.notify()
+        if len(urls) == 0:
+            return None
+        urls_depths = {urlconfig.url: urlconfig.depth for urlconfig in urls}
         directory = self._directory + '_' + random_string(10)
-        found = ArchiveUrls(directory,
-                            {urlconfig.url for urlconfig in urls}).run()
-        if found is not False:
-            with self._set_files.lock:
-                for filename in os.listdir(directory):
-                    if filename.endswith('.warc.gz'):
-                        self._set_files.add((self._identifier,
-                                             os.path.join(directory,
-                                                          filename)))
-            with self._set_urls.lock:
-                self._set_urls.update(urls)
-            with self._set_found.lock:
-                for parenturl, url in found:
-                    self._set_found.add(
-                        UrlConfig(self._identifier, url,
-                                  list(urls_depths.values())[0]+1, parenturl) #TODO depth in case of redirect
-                    )
-        else:
-            self._urls.update(urls)
+        found = False
+        try:
+            if CRAWL_ENGINE == 'fetch':
+                crawl = FetchUrls(directory,
+                                  {urlconfig.url for urlconfig in urls})
+            else:
+                crawl = ArchiveUrls(directory,
+                                    {urlconfig.url for urlconfig in urls},
+                                    self._executor.process)
+            found = crawl.run()
+        finally:
+            with self._condition:
+                self._frontier.done(urls)
+                if found is False:
+                    for urlconfig in urls:
+                        self._frontier.add(urlconfig)
+                self._condition.notify()
+        if found is False:
             # TODO remove crawl directory?
+            return None
+        self._queue_files.put_many(
+            (self._identifier, os.path.join(directory, filename))
+            for filename in os.listdir(directory)
+            if filename.endswith('.warc.gz')
+        )
+        self._queue_urls.put_many(urls)
+        self._queue_found.put_many(
+            UrlConfig(self._identifier, url,
+                      list(urls_depths.values())[0]+1, parenturl) #TODO depth in case of redirect
+            for parenturl, url in found
+        )
 
     def add_url(self, urlconfig):
         """Queues an URL to be archived.
@@ -152,8 +230,11 @@ class Job(threading.Thread):
                 the to be queued URL.
         """
         logger.debug('Adding URL %s to archiver job %s.', urlconfig, self)
-        self._last_time_url = time.time()
-        self._urls.add(urlconfig)
+        with self._condition:
+            self._last_time_url = time.time()
+            self._frontier.add(urlconfig)
+            if len(self._frontier) in (1, JOB_MAX_URLS):
+                self._condition.notify()
 
     def __repr__(self):
         return '<{} at 0x{:x} directory={}>'.format(__name__, id(self),
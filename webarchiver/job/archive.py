@@ -1,16 +1,116 @@
 """Archives data from the internet."""
 import logging
+import multiprocessing
 import os
 import shutil
 import subprocess
 import time
 
 from webarchiver.config import *
+from webarchiver.extractor.registry import registry
 from webarchiver.utils import sha512_file
 from webarchiver.warc import WarcFile
 
 logger = logging.getLogger(__name__)
 
+_file_hashes = {}
+_wget_template = {}
+
+
+def file_hash(filename):
+    """Gets the SHA-512 hash of a file.
+
+    The hash is cached and only calculated again if the modification time or
+    size of the file changed.
+
+    Args:
+        filename (str): The path to the file.
+
+    Returns:
+        str: The hexadecimal SHA-512 hash of the file.
+    """
+    stat = os.stat(filename)
+    key = (stat.st_mtime_ns, stat.st_size)
+    cached = _file_hashes.get(filename)
+    if cached is None or cached[0] != key:
+        logger.debug('Calculating hash of file %s.', filename)
+        cached = (key, sha512_file(filename))
+        _file_hashes[filename] = cached
+    return cached[1]
+
+
+def warc_headers():
+    """Gets the headers for the warcinfo record of every crawl.
+
+    Returns:
+        tuple of tuples: The name and value of each header.
+    """
+    headers = [
+        ('operator', 'Archive Team'),
+        ('archiver-version', VERSION),
+    ]
+    for filename in FILES:
+        headers.append(('hash-{}'.format(filename), file_hash(filename)))
+    return tuple(headers)
+
+
+def wget_template():
+    """Gets the arguments for wget that are the same for every crawl.
+
+    The arguments are cached for the headers from :func:`warc_headers`, which
+    contain the hashes of the files in ``FILES``.
+
+    Returns:
+        tuple: The arguments.
+    """
+    headers = warc_headers()
+    if headers not in _wget_template:
+        arguments = [
+            '--user-agent', USER_AGENT,
+            '--no-cookies',
+            '--no-check-certificate',
+            '--execute', 'robots=off',
+            '--timeout', WGET_TIMEOUT,
+            '--tries', WGET_TRIES,
+            '--waitretry', WGET_WAITRETRY,
+        ]
+        for name, value in headers:
+            arguments.extend([
+                '--warc-header', '{}: {}'.format(name, value)
+            ])
+        _wget_template.clear()
+        _wget_template[headers] = tuple(arguments)
+    return _wget_template[headers]
+
+
+def process_warc(warc_path):
+    """Deduplicates a WARC file and extracts URLs from it.
+
+    This can run in a separate process, so only the path of the processed WARC
+    file, the discovered URLs and the counters of the extractors are
+    returned. The counters should be added to the registry of the calling
+    process, see
+    :func:`webarchiver.extractor.registry.ExtractorRegistry.merge`.
+
+    Args:
+        warc_path (str): The path of the WARC file.
+
+    Returns:
+        tuple of (str, list of tuples, dict): The path of the processed WARC
+            file, the discovered URLs and the counters of the extractors for
+            the WARC file. Each tuple consists of the parent URL and
+            discovered URL. The counters are None if this runs in the calling
+            process, which already counted the work.
+    """
+    before = registry.counters()
+    warc_file = WarcFile(warc_path)
+    warc_file.deduplicate = True
+    found = list(set(warc_file.process_urls()))
+    counters = None
+    if multiprocessing.parent_process() is not None:
+        counters = registry.counters_since(before)
+    return warc_file.warc_path_processed, found, counters
+
 
 class ArchiveUrls:
     """Archives URLs.
@@ -20,7 +120,7 @@ class ArchiveUrls:
         directory (str): Directory where the files from the crawl are stored.
     """
 
-    def __init__(self, directory, urls):
+    def __init__(self, directory, urls, process=None):
         """Inits the archival of URLs.
 
         If the directory for the fiels from the crawl does not exist it will be
@@ -30,9 +130,15 @@ class ArchiveUrls:
             urls (list of str): List of URLs to archive.
             directory (str): Directory where the files from the crawl are
                 stored.
+            process (function, optional): The function running
+                :func:`process_warc` with its arguments, for example
+                :func:`webarchiver.job.executor.CrawlExecutor.process`. Default
+                is None, which runs :func:`process_warc` in the current
+                thread.
         """
         self.urls = urls
         self.directory = directory
+        self._process = process
         if not os.path.isdir(self.directory):
             os.makedirs(self.directory)
         logger.debug('Created URL archive job %s.', self)
@@ -42,7 +148,7 @@ class ArchiveUrls:
 
         An archive jobs is started and the return code is checked against the
         allowed list of return codes. The resulting WARC is deduplicated and
-        URLs are extracted.
+        URLs are extracted in a single pass using :func:`process_warc`.
 
         Yields:
             set of tuples: Each tuple consists of the parent URL and discovered
@@ -58,9 +164,14 @@ class ArchiveUrls:
             logger.warning('Wget for archiver job %s exited with a bad code.',
                            self)
             return False
-        self.warc_file.deduplicate = True
-        self.warc_file.process()
-        return set(self.warc_file.extract_urls())
+        if self._process is None:
+            _, found, counters = process_warc(self.warc_file.warc_path)
+        else:
+            _, found, counters = self._process(process_warc,
+                                               self.warc_file.warc_path)
+        if counters is not None:
+            registry.merge(counters)
+        return set(found)
 
     def archive(self):
         """Runs a crawl job.
@@ -83,35 +194,25 @@ class ArchiveUrls:
 
     @property
     def arguments(self):
-        """list: Argument for the crawl.""" #TODO extend doc with options in list
+        """list: Argument for the crawl.
+
+        The arguments from :func:`wget_template` are extended with the
+        arguments for the directory and URLs of this crawl.
+        """ #TODO extend doc with options in list
         if not hasattr(self, '_arguments'):
-            arguments = [
-                WGET_EXECUTABLE,
-                '--user-agent', USER_AGENT,
-                '--no-cookies',
-                '--no-check-certificate',
+            arguments = [WGET_EXECUTABLE]
+            arguments.extend(wget_template())
+            arguments.extend([
                 '--output-file', os.path.join(self.directory, WGET_LOG),
                 '--output-document', os.path.join(self.directory, WGET_TEMP),
-                '--execute', 'robots=off',
-                '--timeout', WGET_TIMEOUT,
-                '--tries', WGET_TRIES,
-                '--waitretry', WGET_WAITRETRY,
                 '--warc-file', os.path.join(self.directory,
                                             os.path.basename(self.directory)),
-                '--warc-header', 'operator: Archive Team',
-                '--warc-header', 'archiver-version: {}'.format(VERSION),
-            ]
+            ])
             for url in self.urls:
                 arguments.extend([
                     '--warc-header', 'source-url: {}'.format(url),
                 ])
-            for filename in FILES:
-                arguments.extend([
-                    '--warc-header',
-                    'hash-{}: {}'.format(filename, sha512_file(filename))
-                ])
-            for url in self.urls:
-                arguments.append(url)                          
+            arguments.extend(self.urls)
             self._arguments = arguments
         return self._arguments
 
@@ -0,0 +1,179 @@
+"""Bounded execution of crawls."""
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+
+from webarchiver.config import *
+
+logger = logging.getLogger(__name__)
+
+
+class CrawlWorker(threading.Thread):
+    """A thread running crawls from the queue of a :class:`CrawlExecutor`.
+
+    Attributes:
+        busy (float): The number of seconds spend running crawls.
+        tasks (int): The number of crawls run.
+        start_time (float): The time the worker was created.
+    """
+
+    def __init__(self, executor, number):
+        """Inits the worker.
+
+        Args:
+            executor (:obj:`CrawlExecutor`): The executor to get crawls from.
+            number (int): The number of the worker.
+        """
+        super().__init__(name='crawl-worker-{}'.format(number))
+        self.daemon = True
+        self.busy = 0
+        self.tasks = 0
+        self.start_time = time.time()
+        self._executor = executor
+        self._running_since = None
+
+    def run(self):
+        """Runs crawls until a None task is received."""
+        while True:
+            task = self._executor._queue.get()
+            if task is None:
+                break
+            function, args = task
+            self._running_since = time.time()
+            try:
+                function(*args)
+            except Exception:
+                logger.exception('Crawl %s failed.', function)
+            finally:
+                self.busy += time.time() - self._running_since
+                self._running_since = None
+                self.tasks += 1
+
+    @property
+    def utilization(self):
+        """float: The fraction of time since the worker was started that it
+        was running crawls."""
+        now = time.time()
+        busy = self.busy
+        if self._running_since is not None:
+            busy += now - self._running_since
+        return busy / max(now - self.start_time, 1e-9)
+
+
+class CrawlExecutor:
+    """Runs crawls on a bounded number of worker threads.
+
+    Crawls are queued in a bounded queue. If the queue is full, no more crawls
+    are accepted until a worker takes a crawl from the queue.
+
+    CPU heavy processing of the output of crawls is run in a pool of
+    processes with :func:`process`, so it is not limited by the GIL.
+
+    Attributes:
+        workers (list of :obj:`CrawlWorker`): The worker threads.
+    """
+
+    def __init__(self, workers=CRAWL_WORKERS, queue_size=CRAWL_QUEUE_SIZE,
+                 processes=CRAWL_PROCESSES):
+        """Inits the executor and starts the workers.
+
+        Args:
+            workers (int, optional): The number of crawls to run at the same
+                time. Default is ``CRAWL_WORKERS``.
+            queue_size (int, optional): The number of crawls that can wait for
+                a worker. Default is ``CRAWL_QUEUE_SIZE``.
+            processes (int, optional): The number of processes for processing
+                the output of crawls. If 0, the output is processed in the
+                worker threads. Default is ``CRAWL_PROCESSES``.
+        """
+        self._queue = queue.Queue(queue_size)
+        self._processes = processes
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        if self._processes > 0:
+            self._pool = concurrent.futures.ProcessPoolExecutor(processes)
+        self.workers = [CrawlWorker(self, i) for i in range(workers)]
+        for worker in self.workers:
+            worker.start()
+        logger.debug('Created crawl executor %s.', self)
+
+    def submit(self, function, *args):
+        """Queues a crawl.
+
+        Args:
+            function (function): The function running the crawl.
+            *args: The arguments for the function.
+
+        Returns:
+            bool: True if the crawl is queued, False if the queue is full.
+        """
+        try:
+            self._queue.put_nowait((function, args))
+        except queue.Full:
+            logger.debug('Crawl queue is full, not queueing %s.', function)
+            return False
+        return True
+
+    def process(self, function, *args):
+        """Processes the output of a crawl and waits for the result.
+
+        The function is run in the process pool, or in the calling thread if
+        there is no process pool. The function and its arguments and result
+        should be picklable and should be kept small.
+
+        If the process pool broke because a process was killed, the pool is
+        replaced and the function is run in the calling thread.
+
+        Args:
+            function (function): The module level function processing the
+                output.
+            *args: The arguments for the function.
+
+        Returns:
+            The result of the function.
+        """
+        pool = self._pool
+        if pool is None:
+            return function(*args)
+        try:
+            return pool.submit(function, *args).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            logger.exception('Process pool broke while running %s.', function)
+            with self._pool_lock:
+                if self._pool is pool:
+                    self._pool = concurrent.futures.ProcessPoolExecutor(
+                        self._processes
+                    )
+            return function(*args)
+
+    def report(self):
+        """Logs the utilization of every worker."""
+        logger.info('Crawl executor has %d queued crawls; %s.',
+                    self._queue.qsize(),
+                    ', '.join('{} ran {} crawls with {:.0%} utilization'
+                              .format(worker.name, worker.tasks,
+                                      worker.utilization)
+                              for worker in self.workers))
+
+    def shutdown(self):
+        """Stops the workers after the queued crawls are finished.
+
+        The process pool is shut down after the workers are stopped.
+        """
+        for worker in self.workers:
+            self._queue.put(None)
+        for worker in self.workers:
+            worker.join()
+        if self._pool is not None:
+            self._pool.shutdown()
+
+    @property
+    def queued(self):
+        """int: The number of crawls waiting for a worker."""
+        return self._queue.qsize()
+
+    def __repr__(self):
+        return '<{} at 0x{:x} workers={}>'.format(__name__, id(self),
+                                                  len(self.workers))
@@ -0,0 +1,58 @@
+"""Tests for executor.py."""
+import os
+import threading
+import time
+import unittest
+
+from webarchiver.job.executor import CrawlExecutor
+
+
+class TestCrawlExecutor(unittest.TestCase):
+    """Tests for the crawl executor."""
+
+    def test_run(self):
+        executor = CrawlExecutor(2, 10)
+        done = []
+        for i in range(10):
+            self.assertTrue(executor.submit(done.append, i))
+        executor.shutdown()
+        self.assertListEqual(sorted(done), list(range(10)))
+        self.assertEqual(sum(worker.tasks for worker in executor.workers), 10)
+
+    def test_back_pressure(self):
+        executor = CrawlExecutor(1, 1)
+        started = threading.Event()
+        release = threading.Event()
+
+        def crawl():
+            started.set()
+            release.wait()
+
+        self.assertTrue(executor.submit(crawl))
+        started.wait()
+        self.assertTrue(executor.submit(crawl))
+        self.assertFalse(executor.submit(crawl))
+        self.assertEqual(executor.queued, 1)
+        time.sleep(0.1)
+        self.assertGreater(executor.workers[0].utilization, 0.5)
+        release.set()
+        executor.shutdown()
+
+    def test_failing_crawl(self):
+        executor = CrawlExecutor(1, 2)
+        done = []
+        executor.submit(lambda: 1 / 0)
+        executor.submit(done.append, 1)
+        executor.shutdown()
+        self.assertListEqual(done, [1])
+
+    def test_process(self):
+        executor = CrawlExecutor(1, 1, 1)
+        self.assertNotEqual(executor.process(os.getpid), os.getpid())
+        self.assertEqual(executor.process(pow, 2, 10), 1024)
+        executor.shutdown()
+
+    def test_process_in_thread(self):
+        executor = CrawlExecutor(1, 1, 0)
+        self.assertEqual(executor.process(os.getpid), os.getpid())
+        executor.shutdown()
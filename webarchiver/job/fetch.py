@@ -0,0 +1,643 @@
+"""Fetches URLs with asyncio and writes the responses directly to a WARC."""
+import asyncio
+import base64
+import collections
+import contextlib
+import hashlib
+import io
+import logging
+import os
+import ssl
+import tempfile
+import time
+import urllib.parse
+import zlib
+
+from webarchiver.config import *
+from webarchiver.extractor.registry import SNIFF_SIZE, registry
+from webarchiver.job.archive import warc_headers
+from webarchiver.warc import add_payload, payload_database, \
+    record_is_duplicate, remote_record_is_duplicate
+
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+"""The default port for each supported URL scheme."""
+
+REDIRECT_STATUS_CODES = frozenset([301, 302, 303, 307, 308])
+"""The status codes of responses with a ``Location`` to follow."""
+
+
+class HttpError(Exception):
+    """Raised when a server sends an invalid HTTP response."""
+
+
+def parse_head(head):
+    """Parses the status line and headers of a HTTP response.
+
+    Args:
+        head (bytes): The status line and headers, ending with an empty line.
+
+    Returns:
+        :obj:`warcio.statusandheaders.StatusAndHeaders`: The parsed status
+            line and headers.
+
+    Raises:
+        HttpError: If the status line is invalid.
+    """
+    lines = str(head, 'iso-8859-1').split('\r\n')
+    protocol, _, statusline = lines[0].partition(' ')
+    if not protocol.startswith('HTTP/') \
+            or not statusline.split(' ', 1)[0].isdigit():
+        raise HttpError('Invalid status line {!r}.'.format(lines[0]))
+    headers = []
+    for line in lines[1:]:
+        if len(line) == 0:
+            continue
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return StatusAndHeaders(statusline, headers, protocol=protocol)
+
+
+class BodyExtractor:
+    """Extracts URLs from a response body while it is received.
+
+    The body is decompressed if needed. The extractor is chosen by
+    :obj:`webarchiver.extractor.registry.registry` when the first
+    ``SNIFF_SIZE`` bytes are received.
+
+    Attributes:
+        url (str): The URL of the response.
+        urls (set of str): The discovered URLs.
+    """
+
+    def __init__(self, url, content_type=None, content_encoding=None):
+        """Inits the extractor.
+
+        Args:
+            url (str): The URL of the response.
+            content_type (str, optional): The ``Content-Type`` of the body.
+                Default is None.
+            content_encoding (str, optional): The ``Content-Encoding`` of the
+                body. Bodies with an unsupported encoding are skipped. Default
+                is None.
+        """
+        self.url = url
+        self.urls = set()
+        self._content_type = content_type
+        self._extractor = None
+        self._scanner = None
+        self._head = []
+        self._size = 0
+        self._seconds = 0
+        self._enabled = True
+        self._decompressor = None
+        if content_encoding in ('gzip', 'x-gzip'):
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif content_encoding == 'deflate':
+            self._decompressor = zlib.decompressobj()
+        elif content_encoding not in (None, '', 'identity'):
+            logger.debug('Not extracting URLs from %s with encoding %s.', url,
+                         content_encoding)
+            self._enabled = False
+
+    def feed(self, data):
+        """Extracts URLs from the next part of the body.
+
+        Args:
+            data (bytes): The next part of the body.
+        """
+        if not self._enabled or len(data) == 0:
+            return None
+        if self._decompressor is not None:
+            try:
+                data = self._decompressor.decompress(data)
+            except zlib.error:
+                logger.warning('Could not decompress body of %s.', self.url)
+                self._enabled = False
+                return None
+        self._size += len(data)
+        if self._scanner is None:
+            self._head.append(data)
+            if self._size < SNIFF_SIZE:
+                return None
+            data = self._start()
+            if data is None:
+                return None
+        start = time.perf_counter()
+        self._scanner.feed(data)
+        self._seconds += time.perf_counter() - start
+
+    def close(self):
+        """Extracts URLs from the end of the body."""
+        if not self._enabled:
+            return None
+        if self._scanner is None:
+            data = self._start()
+            if data is None:
+                return None
+            self._scanner.feed(data)
+        start = time.perf_counter()
+        self.urls.update(self._scanner.close())
+        self._seconds += time.perf_counter() - start
+        self._extractor.count(self._size, self._seconds, len(self.urls),
+                              self._scanner.base.hits,
+                              self._scanner.base.misses)
+        self._enabled = False
+
+    def _start(self):
+        """Chooses the extractor using the start of the body.
+
+        Returns:
+            bytes: The start of the body to scan, or None if the body is
+                skipped.
+        """
+        head = b''.join(self._head)
+        self._head = []
+        self._extractor = registry.extractor_for(self._content_type, head)
+        if self._extractor is None:
+            logger.debug('Skipping body of %s with content type %s.',
+                         self.url, self._content_type)
+            self._enabled = False
+            return None
+        self._scanner = self._extractor.scanner(self.url)
+        return head
+
+
+class Connection:
+    """A connection to a host.
+
+    Attributes:
+        reader (:obj:`asyncio.StreamReader`): The reader of the connection.
+        writer (:obj:`asyncio.StreamWriter`): The writer of the connection.
+        reusable (bool): True if the connection can be used for another
+            request, else False.
+        requests (int): The number of requests sent on the connection.
+    """
+
+    def __init__(self, reader, writer):
+        """Inits the connection.
+
+        Args:
+            reader (:obj:`asyncio.StreamReader`): The reader of the
+                connection.
+            writer (:obj:`asyncio.StreamWriter`): The writer of the
+                connection.
+        """
+        self.reader = reader
+        self.writer = writer
+        self.reusable = False
+        self.requests = 0
+
+    @property
+    def address(self):
+        """str: The IP address of the host."""
+        peername = self.writer.get_extra_info('peername')
+        return peername[0] if peername else None
+
+    @property
+    def closed(self):
+        """bool: True if the connection is closed, else False."""
+        return self.reader.at_eof() or self.writer.is_closing()
+
+    def close(self):
+        """Closes the connection."""
+        self.reusable = False
+        self.writer.close()
+
+
+class ConnectionPool:
+    """Keeps connections to hosts open to be reused by later requests.
+
+    The number of connections to a single host is limited.
+    """
+
+    def __init__(self, per_host):
+        """Inits the pool.
+
+        Args:
+            per_host (int): The maximum number of connections to a host.
+        """
+        self._per_host = per_host
+        self._limits = {}
+        self._idle = collections.defaultdict(list)
+        self._ssl = ssl.create_default_context()
+        self._ssl.check_hostname = False
+        self._ssl.verify_mode = ssl.CERT_NONE
+
+    @contextlib.asynccontextmanager
+    async def connection(self, key):
+        """Gets a connection to a host.
+
+        An idle connection to the host is used if available, else a new
+        connection is opened. The connection is kept for reuse afterwards if
+        it is marked as reusable.
+
+        Args:
+            key (tuple of (str, str, int)): The scheme, host and port.
+
+        Yields:
+            :obj:`Connection`: The connection.
+        """
+        if key not in self._limits:
+            self._limits[key] = asyncio.Semaphore(self._per_host)
+        async with self._limits[key]:
+            connection = await self._open(key)
+            try:
+                yield connection
+            except BaseException:
+                connection.close()
+                raise
+            if connection.reusable:
+                self._idle[key].append(connection)
+            else:
+                connection.close()
+
+    async def _open(self, key):
+        """Takes an idle connection or opens a new connection.
+
+        Args:
+            key (tuple of (str, str, int)): The scheme, host and port.
+
+        Returns:
+            :obj:`Connection`: The connection.
+        """
+        idle = self._idle[key]
+        while len(idle) > 0:
+            connection = idle.pop()
+            if not connection.closed:
+                connection.reusable = False
+                return connection
+            connection.close()
+        scheme, host, port = key
+        logger.debug('Opening connection to %s:%s.', host, port)
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(
+                host, port, limit=FETCH_READ_SIZE,
+                ssl=self._ssl if scheme == 'https' else None,
+                server_hostname=host if scheme == 'https' else None
+            ),
+            FETCH_TIMEOUT
+        )
+        return Connection(reader, writer)
+
+    async def close(self):
+        """Closes the idle connections."""
+        connections = [c for idle in self._idle.values() for c in idle]
+        self._idle.clear()
+        for connection in connections:
+            connection.close()
+        for connection in connections:
+            with contextlib.suppress(OSError):
+                await connection.writer.wait_closed()
+
+
+class FetchUrls:
+    """Archives URLs by fetching them in-process.
+
+    This is an alternative for :class:`webarchiver.job.archive.ArchiveUrls`.
+    The URLs are fetched concurrently with :mod:`asyncio`, reusing
+    connections to the same host. Each response is written directly to the
+    WARC file as it is received, while URLs are extracted from the body. The
+    WARC file does not need to be processed afterwards.
+
+    Redirects are not followed; the URL in the ``Location`` header is
+    returned as a discovered URL.
+
+    Attributes:
+        urls (list of str): List of URLs to archive.
+        directory (str): Directory where the files from the crawl are stored.
+        warc_path (str): The path of the WARC file.
+        database (str): The path of the local payload deduplication
+            database, or None to only use ``DEDUPLICATION_SERVER``.
+    """
+
+    def __init__(self, directory, urls, connections=FETCH_CONNECTIONS,
+                 connections_per_host=FETCH_CONNECTIONS_PER_HOST,
+                 database=DEDUPLICATION_DATABASE):
+        """Inits the archival of URLs.
+
+        If the directory for the files from the crawl does not exist it will be
+        created.
+
+        Args:
+            directory (str): Directory where the files from the crawl are
+                stored.
+            urls (list of str): List of URLs to archive.
+            connections (int, optional): The maximum number of URLs fetched
+                at the same time. Default is ``FETCH_CONNECTIONS``.
+            connections_per_host (int, optional): The maximum number of
+                connections to a single host. Default is
+                ``FETCH_CONNECTIONS_PER_HOST``.
+            database (str, optional): The path of the local payload
+                deduplication database, see
+                :func:`webarchiver.warc.payload_database`. Default is
+                ``DEDUPLICATION_DATABASE``.
+        """
+        self.urls = urls
+        self.database = database
+        self.directory = directory
+        self.warc_path = os.path.join(
+            self.directory, os.path.basename(self.directory) + '.warc.gz'
+        )
+        self._connections = connections
+        self._connections_per_host = connections_per_host
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        logger.debug('Created URL fetch job %s.', self)
+
+    def run(self):
+        """Runs the crawl.
+
+        Returns:
+            set of tuples: Each tuple consists of the parent URL and discovered
+                URL.
+            bool: False if the WARC file could not be written.
+        """
+        logger.debug('Starting URL fetch job %s.', self)
+        local = payload_database(self.database)
+        cache = (local.hits, local.misses) if local is not None else (0, 0)
+        try:
+            with open(self.warc_path, 'wb') as f:
+                self._writer = WARCWriter(filebuf=f, gzip=True)
+                self._write_warcinfo()
+                return asyncio.run(self._run())
+        except OSError:
+            logger.exception('Could not write WARC file %s.', self.warc_path)
+            return False
+        finally:
+            if local is not None:
+                local.commit()
+                registry.count_payloads({'hits': local.hits - cache[0],
+                                         'misses': local.misses - cache[1]})
+
+    async def _run(self):
+        """Fetches all URLs.
+
+        Returns:
+            set of tuples: Each tuple consists of the parent URL and discovered
+                URL.
+        """
+        self._pool = ConnectionPool(self._connections_per_host)
+        self._limit = asyncio.Semaphore(self._connections)
+        try:
+            results = await asyncio.gather(*[self._fetch(url)
+                                             for url in self.urls])
+        finally:
+            await self._pool.close()
+        return set().union(*results)
+
+    async def _fetch(self, url):
+        """Fetches an URL, trying again on network errors.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            set of tuples: Each tuple consists of the parent URL and discovered
+                URL.
+        """
+        if urllib.parse.urlsplit(url).scheme not in DEFAULT_PORTS:
+            logger.warning('Not fetching URL %s with unsupported scheme.', url)
+            return set()
+        async with self._limit:
+            for tries in range(FETCH_TRIES):
+                try:
+                    return await self._fetch_once(url)
+                except (OSError, EOFError, ValueError, HttpError,
+                        asyncio.TimeoutError, asyncio.LimitOverrunError) \
+                        as error:
+                    logger.info('Fetching URL %s failed on try %s: %r.', url,
+                                tries, error)
+        logger.warning('Could not fetch URL %s.', url)
+        return set()
+
+    async def _fetch_once(self, url):
+        """Fetches an URL and writes the request and response to the WARC.
+
+        Args:
+            url (str): The URL to fetch.
+
+        Returns:
+            set of tuples: Each tuple consists of the parent URL and discovered
+                URL.
+        """
+        parts = urllib.parse.urlsplit(url)
+        key = (parts.scheme, parts.hostname,
+               parts.port or DEFAULT_PORTS[parts.scheme])
+        target = parts.path or '/'
+        if parts.query:
+            target += '?' + parts.query
+        request = StatusAndHeaders('GET {} HTTP/1.1'.format(target), [
+            ('Host', parts.netloc.rsplit('@', 1)[-1]),
+            ('User-Agent', USER_AGENT),
+            ('Accept', '*/*'),
+            ('Accept-Encoding', 'identity'),
+            ('Connection', 'keep-alive'),
+        ], is_http_request=True)
+        with tempfile.SpooledTemporaryFile(FETCH_SPOOL_SIZE) as body:
+            async with self._pool.connection(key) as connection:
+                logger.debug('Fetching URL %s.', url)
+                connection.requests += 1
+                connection.writer.write(request.to_bytes())
+                await self._read(connection.writer.drain())
+                response = parse_head(await self._read(
+                    connection.reader.readuntil(b'\r\n\r\n')
+                ))
+                digester = hashlib.sha1()
+                extractor = BodyExtractor(
+                    url, response.get_header('Content-Type'),
+                    (response.get_header('Content-Encoding') or '').lower()
+                )
+
+                def received(raw, data):
+                    body.write(raw)
+                    digester.update(data)
+                    extractor.feed(data)
+
+                connection.reusable = await self._read_body(connection,
+                                                            response, received)
+                address = connection.address
+            extractor.close()
+            location = response.get_header('Location')
+            if location and int(response.get_statuscode()) \
+                    in REDIRECT_STATUS_CODES:
+                extractor.urls.add(urllib.parse.urljoin(url, location))
+            digest = 'sha1:' + str(base64.b32encode(digester.digest()),
+                                   'ascii')
+            if await self._write_records(url, request, response, body,
+                                         digest, address):
+                return set()
+        return {(url, found) for found in extractor.urls}
+
+    async def _read_body(self, connection, response, received):
+        """Reads the body of a response.
+
+        Args:
+            connection (:obj:`Connection`): The connection to read from.
+            response (:obj:`warcio.statusandheaders.StatusAndHeaders`): The
+                status line and headers of the response.
+            received (function): The function called with the raw data and
+                the data with the transfer encoding removed as it is received.
+
+        Returns:
+            bool: True if the connection can be reused, else False.
+
+        Raises:
+            HttpError: If the body is invalid.
+            EOFError: If the connection is closed before the body is complete.
+        """
+        reader = connection.reader
+        status_code = int(response.get_statuscode())
+        reusable = response.protocol == 'HTTP/1.1' \
+            and (response.get_header('Connection') or '').lower() != 'close'
+        transfer_encoding = response.get_header('Transfer-Encoding') or ''
+        content_length = response.get_header('Content-Length')
+        if status_code < 200 or status_code in (204, 304):
+            return reusable
+        if 'chunked' in transfer_encoding.lower():
+            while True:
+                line = await self._read(reader.readuntil(b'\r\n'))
+                try:
+                    size = int(line.split(b';', 1)[0], 16)
+                except ValueError:
+                    raise HttpError('Invalid chunk size {!r}.'.format(line))
+                if size == 0:
+                    break
+                data = await self._read(reader.readexactly(size + 2))
+                received(line + data, data[:-2])
+            trailer = line
+            while line != b'\r\n':
+                line = await self._read(reader.readuntil(b'\r\n'))
+                trailer += line
+            received(trailer, b'')
+            return reusable
+        if content_length is not None:
+            try:
+                remaining = int(content_length)
+            except ValueError:
+                raise HttpError('Invalid Content-Length {!r}.'
+                                .format(content_length))
+            while remaining > 0:
+                data = await self._read(
+                    reader.read(min(remaining, FETCH_READ_SIZE))
+                )
+                if len(data) == 0:
+                    raise asyncio.IncompleteReadError(b'', remaining)
+                remaining -= len(data)
+                received(data, data)
+            return reusable
+        while True:
+            data = await self._read(reader.read(FETCH_READ_SIZE))
+            if len(data) == 0:
+                return False
+            received(data, data)
+
+    async def _read(self, awaitable):
+        """Waits for a read or write with a timeout of ``FETCH_TIMEOUT``.
+
+        Args:
+            awaitable (awaitable): The read or write.
+
+        Returns:
+            The result of the read or write.
+        """
+        return await asyncio.wait_for(awaitable, FETCH_TIMEOUT)
+
+    async def _write_records(self, url, request, response, body, digest,
+                             address):
+        """Writes the request and response records to the WARC.
+
+        A response with status code 200 is looked up in the local payload
+        deduplication database and written as revisit record if it is a
+        duplicate, see :func:`webarchiver.warc.record_is_duplicate`. Only if
+        it is not found and ``DEDUPLICATION_SERVER`` is set, the server is
+        asked in a thread so other fetches continue meanwhile. A payload that
+        is not a duplicate is added to the local database.
+
+        Args:
+            url (str): The URL of the records.
+            request (:obj:`warcio.statusandheaders.StatusAndHeaders`): The
+                request line and headers.
+            response (:obj:`warcio.statusandheaders.StatusAndHeaders`): The
+                status line and headers of the response.
+            body (file object): The raw body of the response.
+            digest (str): The SHA-1 digest of the payload.
+            address (str): The IP address of the host.
+
+        Returns:
+            bool: True if the response was written as revisit record.
+        """
+        duplicate = False
+        deduplicate = response.get_statuscode() == '200'
+        if deduplicate:
+            counts = {'records': 1}
+            duplicate = record_is_duplicate(url, digest, self.database, False)
+            if not duplicate and DEDUPLICATION_SERVER is not None:
+                counts['remote'] = 1
+                duplicate = await asyncio.get_running_loop().run_in_executor(
+                    None, remote_record_is_duplicate, url, digest
+                )
+                if duplicate:
+                    add_payload(duplicate[1], digest, duplicate[0],
+                                self.database)
+            counts['duplicates'] = 1 if duplicate else 0
+            registry.count_payloads(counts)
+        warc_headers_dict = {}
+        if address is not None:
+            warc_headers_dict['WARC-IP-Address'] = address
+        if duplicate:
+            logger.debug('Record %s %s is a duplicate.', url, digest)
+            response_record = self._writer.create_revisit_record(
+                url, digest, duplicate[1], duplicate[0],
+                http_headers=response, warc_headers_dict=warc_headers_dict
+            )
+        else:
+            length = body.tell()
+            body.seek(0)
+            warc_headers_dict['WARC-Payload-Digest'] = digest
+            response_record = self._writer.create_warc_record(
+                url, 'response', payload=body, length=length,
+                http_headers=response, warc_headers_dict=warc_headers_dict
+            )
+        request_record = self._writer.create_warc_record(
+            url, 'request', http_headers=request,
+            warc_headers_dict={
+                'WARC-Concurrent-To': response_record.rec_headers
+                                      .get_header('WARC-Record-ID')
+            }
+        )
+        self._writer.write_record(request_record)
+        self._writer.write_record(response_record)
+        if deduplicate and not duplicate:
+            add_payload(url, digest,
+                        response_record.rec_headers.get_header('WARC-Date'),
+                        self.database)
+        return bool(duplicate)
+
+    def _write_warcinfo(self):
+        """Writes the warcinfo record to the WARC.
+
+        The record contains the headers from
+        :func:`webarchiver.job.archive.warc_headers` and the URLs of this
+        crawl.
+        """
+        fields = [('software', 'webarchiver/{}'.format(VERSION))]
+        fields.extend(warc_headers())
+        fields.extend(('source-url', url) for url in self.urls)
+        payload = ''.join('{}: {}\r\n'.format(name, value)
+                          for name, value in fields).encode('utf-8')
+        self._writer.write_record(self._writer.create_warc_record(
+            '', 'warcinfo', payload=io.BytesIO(payload), length=len(payload),
+            warc_content_type='application/warc-fields',
+            warc_headers_dict={
+                'WARC-Filename': os.path.basename(self.warc_path)
+            }
+        ))
+
+    def __repr__(self):
+        return '<{} at 0x{:x} directory={}>'.format(__name__, id(self),
+                                                    self.directory)
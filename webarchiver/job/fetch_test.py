@@ -0,0 +1,156 @@
+"""Tests for fetch.py."""
+import gzip
+import http.server
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import unittest
+
+from warcio.archiveiterator import ArchiveIterator
+
+from webarchiver.job.fetch import FetchUrls
+
+PAGE = b'<html>\n<a href="/page">page</a>\n' \
+       b'<img src="http://example.com/image.png">\n</html>'
+CHUNKS = (b'<a href="/chunk', b'ed">chunked</a>\n', b'<a href="/last">')
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    """Handler for the test server, keeping connections alive."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        """Serves the test pages."""
+        self.server.clients.append(self.client_address)
+        path = self.path.split('?', 1)[0]
+        if path in ('/', '/page'):
+            self._send(200, PAGE)
+        elif path == '/gzip':
+            self._send(200, gzip.compress(PAGE),
+                       [('Content-Encoding', 'gzip')])
+        elif path == '/chunked':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            for chunk in CHUNKS:
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            self.wfile.write(b'0\r\n\r\n')
+        elif path == '/redirect':
+            self._send(301, b'', [('Location', '/page')])
+        else:
+            self._send(404, b'')
+
+    def _send(self, status, body, headers=()):
+        """Sends a response with a ``Content-Length``.
+
+        Args:
+            status (int): The status code.
+            body (bytes): The body.
+            headers (iterable of tuples, optional): Extra headers. Default is
+                no extra headers.
+        """
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def read_warc(path):
+    """Reads the records of a WARC file.
+
+    Args:
+        path (str): The path of the WARC file.
+
+    Returns:
+        list of tuples: The type, target URI and content of each record.
+    """
+    with open(path, 'rb') as f:
+        return [(record.rec_type,
+                 record.rec_headers.get_header('WARC-Target-URI'),
+                 record.content_stream().read())
+                for record in ArchiveIterator(f)]
+
+
+class TestFetchUrls(unittest.TestCase):
+    """Tests for fetching URLs into a WARC file."""
+
+    def setUp(self):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      Handler)
+        self.server.clients = []
+        self.base = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.directory = os.path.join(tempfile.mkdtemp(), 'crawl')
+        self.database = os.path.join(os.path.dirname(self.directory),
+                                     'payloads')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def test_fetch(self):
+        urls = [self.base + path for path in ('/', '/chunked', '/redirect',
+                                              '/missing')]
+        fetch = FetchUrls(self.directory, urls, database=self.database)
+        found = fetch.run()
+        self.assertIn((self.base + '/', self.base + '/page'), found)
+        self.assertIn((self.base + '/', 'http://example.com/image.png'),
+                      found)
+        self.assertIn((self.base + '/chunked', self.base + '/chunked'),
+                      found)
+        self.assertIn((self.base + '/chunked', self.base + '/last'), found)
+        self.assertIn((self.base + '/redirect', self.base + '/page'), found)
+        records = read_warc(fetch.warc_path)
+        self.assertEqual(records[0][0], 'warcinfo')
+        self.assertIn(('source-url: ' + urls[0]).encode(), records[0][2])
+        responses = {url: content for type_, url, content in records
+                     if type_ == 'response'}
+        self.assertEqual(sum(type_ == 'request' for type_, _, _ in records),
+                         4)
+        self.assertEqual(responses[self.base + '/'], PAGE)
+        self.assertEqual(responses[self.base + '/chunked'], b''.join(CHUNKS))
+        self.assertEqual(responses[self.base + '/missing'], b'')
+
+    def test_keep_alive(self):
+        urls = [self.base + '/?{}'.format(i) for i in range(5)]
+        found = FetchUrls(self.directory, urls, connections_per_host=1,
+                          database=self.database).run()
+        self.assertEqual(len(self.server.clients), 5)
+        self.assertEqual(len(set(self.server.clients)), 1)
+        self.assertIn((urls[0], self.base + '/page'), found)
+
+    def test_gzip(self):
+        found = FetchUrls(self.directory, [self.base + '/gzip'],
+                          database=self.database).run()
+        self.assertIn((self.base + '/gzip', self.base + '/page'), found)
+
+    def test_deduplicate(self):
+        urls = [self.base + '/page']
+        FetchUrls(self.directory, urls, database=self.database).run()
+        fetch = FetchUrls(os.path.join(self.directory, 'again'), urls,
+                          database=self.database)
+        self.assertSetEqual(fetch.run(), set())
+        self.assertListEqual([type_ for type_, _, _
+                              in read_warc(fetch.warc_path)],
+                             ['warcinfo', 'request', 'revisit'])
+
+    def test_unreachable(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            url = 'http://127.0.0.1:{}/'.format(s.getsockname()[1])
+        fetch = FetchUrls(self.directory, [url], database=self.database)
+        self.assertSetEqual(fetch.run(), set())
+        self.assertListEqual([type_ for type_, _, _
+                              in read_warc(fetch.warc_path)], ['warcinfo'])
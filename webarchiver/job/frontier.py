@@ -0,0 +1,207 @@
+"""The URLs of a job waiting to be crawled, queued per host.
+
+Every host has its own queue. A host is ready when it is allowed to be
+crawled again, which is ``FRONTIER_HOST_DELAY`` seconds after it was last
+given to a crawl, and when it is in fewer than ``FRONTIER_HOST_CRAWLS``
+running crawls. A crawl fetches its URLs one at a time, so this limits the
+number of connections to a host. Ready hosts are kept in a heap by the time
+they are allowed to be crawled. A batch of URLs takes one URL from each ready
+host in turn, up to ``FRONTIER_HOST_BATCH`` URLs per host, so as many hosts
+as possible are crawled at once instead of many URLs of one host.
+"""
+import collections
+import heapq
+import itertools
+import logging
+import time
+import urllib.parse
+
+from webarchiver.config import *
+
+logger = logging.getLogger(__name__)
+
+
+def url_host(url):
+    """Gets the host an URL is queued by.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The lowercase network location of the URL.
+    """
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+class Host:
+    """The queue of URLs of a single host.
+
+    Attributes:
+        name (str): The host.
+        urls (:obj:`collections.deque`): The queued
+            :class:`webarchiver.url.UrlConfig` objects.
+        active (int): The number of running crawls with URLs of the host.
+        allowed (float): The time the host is allowed to be crawled again.
+        deadline (float): The time of the entry of the host in the heap of
+            ready hosts, or None if it is not in the heap.
+    """
+
+    def __init__(self, name):
+        """Inits the host without URLs.
+
+        Args:
+            name (str): The host.
+        """
+        self.name = name
+        self.urls = collections.deque()
+        self.active = 0
+        self.allowed = 0
+        self.deadline = None
+
+    @property
+    def free(self):
+        """bool: Whether URLs of the host can be given to a new crawl."""
+        return len(self.urls) > 0 and self.active < FRONTIER_HOST_CRAWLS
+
+    def __repr__(self):
+        return '<{} at 0x{:x} host={}>'.format(__name__, id(self), self.name)
+
+
+class Frontier:
+    """The URLs of a job waiting to be crawled.
+
+    A host is in the heap of ready hosts at most once. Hosts without URLs
+    that can be crawled are left out of the heap until URLs are added or
+    crawled. An URL is queued at most once; it can be queued again after it
+    is taken.
+
+    Attributes:
+        backlog (int): The number of queued URLs that were already queued
+            when the last batch was taken. These URLs waited for a batch
+            once, so they should not wait for more URLs to be added.
+    """
+
+    def __init__(self, clock=time.time):
+        """Inits the frontier without URLs.
+
+        Args:
+            clock (function, optional): The function returning the time in
+                seconds. Default is :func:`time.time`.
+        """
+        self.clock = clock
+        self._hosts = {}
+        self._heap = []
+        self._queued = set()
+        self._counter = itertools.count()
+        self._length = 0
+        self.backlog = 0
+
+    def add(self, urlconfig):
+        """Queues an URL if it is not queued yet.
+
+        Args:
+            urlconfig (:obj:`webarchiver.url.UrlConfig`): The URL.
+
+        Returns:
+            bool: True if the URL was queued, False if it was already queued.
+        """
+        if urlconfig.url in self._queued:
+            logger.debug('URL %s is already queued.', urlconfig.url)
+            return False
+        self._queued.add(urlconfig.url)
+        name = url_host(urlconfig.url)
+        host = self._hosts.get(name)
+        if host is None:
+            host = self._hosts[name] = Host(name)
+        host.urls.append(urlconfig)
+        self._length += 1
+        self._schedule(host)
+        return True
+
+    def take(self, count):
+        """Takes a batch of URLs from the ready hosts.
+
+        URLs are taken from the ready hosts in turn, starting with the host
+        that was ready first, and at most ``FRONTIER_HOST_BATCH`` URLs of a
+        host. The hosts in the batch are not ready again for
+        ``FRONTIER_HOST_DELAY`` seconds. The batch counts as a running crawl
+        of its hosts until its URLs are given to :func:`done`.
+
+        Args:
+            count (int): The maximum number of URLs.
+
+        Returns:
+            list of :obj:`webarchiver.url.UrlConfig`: The URLs.
+        """
+        now = self.clock()
+        taken = []
+        while len(taken) < count and len(self._heap) > 0 \
+                and self._heap[0][0] <= now:
+            host = heapq.heappop(self._heap)[2]
+            host.deadline = None
+            taken.append(host)
+        urls = []
+        hosts = taken
+        for i in range(FRONTIER_HOST_BATCH):
+            if len(urls) == count or len(hosts) == 0:
+                break
+            for host in hosts:
+                if len(urls) == count:
+                    break
+                urlconfig = host.urls.popleft()
+                self._queued.remove(urlconfig.url)
+                urls.append(urlconfig)
+            hosts = [host for host in hosts if len(host.urls) > 0]
+        self._length -= len(urls)
+        if len(urls) > 0:
+            self.backlog = self._length
+        for host in taken:
+            host.active += 1
+            host.allowed = now + FRONTIER_HOST_DELAY
+            self._schedule(host)
+        return urls
+
+    def done(self, urlconfigs):
+        """Reports a batch taken with :func:`take` as crawled.
+
+        Args:
+            urlconfigs (iterable of :obj:`webarchiver.url.UrlConfig`): The
+                URLs of the batch.
+        """
+        for name in {url_host(urlconfig.url) for urlconfig in urlconfigs}:
+            host = self._hosts[name]
+            host.active -= 1
+            if host.active == 0 and len(host.urls) == 0:
+                del self._hosts[host.name]
+            else:
+                self._schedule(host)
+
+    def ready_time(self):
+        """Gets the time the next host is ready.
+
+        Returns:
+            float: The time the next host is ready, or None if no host has
+                URLs that can be crawled.
+        """
+        if len(self._heap) == 0:
+            return None
+        return self._heap[0][0]
+
+    def _schedule(self, host):
+        """Adds a host to the heap of ready hosts if it has URLs that can be
+        crawled and is not in the heap yet.
+
+        Args:
+            host (:obj:`Host`): The host.
+        """
+        if host.deadline is not None or not host.free:
+            return None
+        host.deadline = host.allowed
+        heapq.heappush(self._heap, (host.deadline, next(self._counter), host))
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<{} at 0x{:x} hosts={} urls={}>' \
+            .format(__name__, id(self), len(self._hosts), self._length)
@@ -0,0 +1,115 @@
+"""Tests for frontier.py."""
+import unittest
+
+from webarchiver.config import *
+from webarchiver.job.frontier import Frontier
+from webarchiver.url import UrlConfig
+
+
+class Clock:
+    """A clock only moving when it is told to."""
+
+    def __init__(self):
+        """Inits the clock at zero seconds."""
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def add_urls(frontier, host, count):
+    """Queues URLs of a host.
+
+    Args:
+        frontier (:obj:`webarchiver.job.frontier.Frontier`): The frontier.
+        host (str): The host.
+        count (int): The number of URLs.
+    """
+    for i in range(count):
+        frontier.add(UrlConfig('job_1', 'https://{}/{}'.format(host, i), 0,
+                               None))
+
+
+def hosts(urlconfigs):
+    """Gets the hosts of URLs.
+
+    Args:
+        urlconfigs (list of :obj:`webarchiver.url.UrlConfig`): The URLs.
+
+    Returns:
+        list of str: The host of each URL.
+    """
+    return [urlconfig.url.split('/')[2] for urlconfig in urlconfigs]
+
+
+class TestFrontier(unittest.TestCase):
+    """Tests for taking batches of URLs from many hosts."""
+
+    def test_diversity(self):
+        frontier = Frontier(Clock())
+        add_urls(frontier, 'a.com', 10)
+        add_urls(frontier, 'b.com', 1)
+        add_urls(frontier, 'c.com', 10)
+        self.assertListEqual(hosts(frontier.take(5)),
+                             ['a.com', 'b.com', 'c.com', 'a.com', 'c.com'])
+        self.assertEqual(len(frontier), 16)
+
+    def test_delay(self):
+        clock = Clock()
+        frontier = Frontier(clock)
+        add_urls(frontier, 'a.com', 10)
+        self.assertEqual(len(frontier.take(1)), 1)
+        self.assertListEqual(frontier.take(1), [])
+        self.assertEqual(frontier.ready_time(), FRONTIER_HOST_DELAY)
+        clock.time = FRONTIER_HOST_DELAY
+        add_urls(frontier, 'b.com', 1)
+        self.assertListEqual(hosts(frontier.take(2)), ['b.com', 'a.com'])
+
+    def test_crawls(self):
+        clock = Clock()
+        frontier = Frontier(clock)
+        add_urls(frontier, 'a.com', FRONTIER_HOST_CRAWLS + 1)
+        batches = []
+        for i in range(FRONTIER_HOST_CRAWLS):
+            clock.time = i * FRONTIER_HOST_DELAY
+            batches.append(frontier.take(1))
+        clock.time = FRONTIER_HOST_CRAWLS * FRONTIER_HOST_DELAY
+        self.assertIsNone(frontier.ready_time())
+        self.assertListEqual(frontier.take(100), [])
+        frontier.done(batches[0])
+        self.assertEqual(len(frontier.take(100)), 1)
+
+    def test_full_batch(self):
+        frontier = Frontier(Clock())
+        add_urls(frontier, 'a.com', JOB_MAX_URLS)
+        self.assertEqual(len(frontier.take(JOB_MAX_URLS)), JOB_MAX_URLS)
+
+    def test_backlog(self):
+        clock = Clock()
+        frontier = Frontier(clock)
+        add_urls(frontier, 'a.com', 3)
+        self.assertEqual(frontier.backlog, 0)
+        frontier.take(2)
+        add_urls(frontier, 'b.com', 1)
+        self.assertEqual(frontier.backlog, 1)
+        clock.time = FRONTIER_HOST_DELAY
+        self.assertEqual(len(frontier.take(2)), 2)
+        self.assertEqual(frontier.backlog, 0)
+
+    def test_done(self):
+        frontier = Frontier(Clock())
+        add_urls(frontier, 'a.com', 1)
+        frontier.done(frontier.take(1))
+        self.assertEqual(len(frontier), 0)
+        self.assertEqual(len(frontier._hosts), 0)
+
+    def test_duplicate(self):
+        frontier = Frontier(Clock())
+        add_urls(frontier, 'a.com', 1)
+        add_urls(frontier, 'a.com', 1)
+        self.assertEqual(len(frontier), 1)
+        urls = frontier.take(100)
+        self.assertEqual(len(urls), 1)
+        self.assertTrue(frontier.add(urls[0]))
+        self.assertFalse(frontier.add(urls[0]))
+        self.assertEqual(len(frontier), 1)
@@ -0,0 +1,85 @@
+"""Tests for the job loop in __init__.py."""
+import threading
+import unittest
+
+from webarchiver.config import *
+from webarchiver.handoff import HandoffQueue
+from webarchiver.job import Job
+from webarchiver.url import UrlConfig
+
+
+class Executor:
+    """An executor recording submitted crawls without running them."""
+
+    def __init__(self, accept=True):
+        """Inits the executor.
+
+        Args:
+            accept (bool, optional): Whether crawls are accepted. Default is
+                True.
+        """
+        self.accept = accept
+        self.submits = 0
+        self.submitted = threading.Event()
+
+    def submit(self, function, *args):
+        """Records a crawl.
+
+        Args:
+            function (function): The function running the crawl.
+            *args: The arguments for the function.
+
+        Returns:
+            bool: Whether the crawl is accepted.
+        """
+        self.submits += 1
+        self.submitted.set()
+        return self.accept
+
+
+class TestJob(unittest.TestCase):
+    """Tests for starting crawls of a job."""
+
+    def start_job(self, executor):
+        """Starts a job with a quota for ``JOB_MAX_URLS`` URLs.
+
+        Args:
+            executor (:obj:`Executor`): The executor for the job.
+
+        Returns:
+            :obj:`webarchiver.job.Job`: The job.
+        """
+        job = Job('job_1', HandoffQueue(), HandoffQueue(), HandoffQueue(),
+                  executor)
+        job._last_time = job._last_time_url = 2**40
+        job.start()
+        self.addCleanup(job.join)
+        self.addCleanup(job.stop)
+        job.increase_url_quota(JOB_MAX_URLS)
+        return job
+
+    def add_urls(self, job, count):
+        """Adds URLs to a job.
+
+        Args:
+            job (:obj:`webarchiver.job.Job`): The job.
+            count (int): The number of URLs.
+        """
+        for i in range(count):
+            job.add_url(UrlConfig('job_1', 'https://example.com/{}'.format(i),
+                                  0, None))
+
+    def test_max_urls(self):
+        executor = Executor()
+        job = self.start_job(executor)
+        self.add_urls(job, JOB_MAX_URLS - 1)
+        self.assertFalse(executor.submitted.wait(0.2))
+        self.add_urls(job, JOB_MAX_URLS)
+        self.assertTrue(executor.submitted.wait(0.5))
+        self.assertEqual(executor.submits, 1)
+
+    def test_stop(self):
+        job = self.start_job(Executor())
+        job.stop()
+        job.join(1)
+        self.assertFalse(job.is_alive())
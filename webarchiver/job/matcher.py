@@ -0,0 +1,164 @@
+"""Matching URLs against the regular expressions of a job."""
+import re
+
+try:
+    from re import _parser as sre_parse
+except ImportError:
+    import sre_parse
+
+MIN_LITERAL_LENGTH = 3
+"""The minimum length of a literal to be used for skipping a regular
+expression."""
+
+_BACKREFERENCE = re.compile(r'\\[1-9]|\(\?P=')
+
+
+def required_literal(regex):
+    """Finds a literal string every match of a regular expression contains.
+
+    The longest run of literal characters in the top level of the regular
+    expression is used. Case insensitive regular expressions have no literal.
+
+    Args:
+        regex (str): The regular expression.
+
+    Returns:
+        str: The literal, or None if no literal of at least
+            ``MIN_LITERAL_LENGTH`` characters is found.
+    """
+    try:
+        parsed = sre_parse.parse(regex)
+    except (re.error, TypeError):
+        return None
+    if parsed.state.flags & re.IGNORECASE:
+        return None
+    longest = current = ''
+    for op, av in parsed:
+        if op == sre_parse.LITERAL:
+            current += chr(av)
+            continue
+        longest = max(longest, current, key=len)
+        current = ''
+    longest = max(longest, current, key=len)
+    return longest if len(longest) >= MIN_LITERAL_LENGTH else None
+
+
+def combine(regexes):
+    """Combines regular expressions into a single alternation.
+
+    Args:
+        regexes (iterable of str): The regular expressions.
+
+    Returns:
+        :obj:`re.Pattern`: The compiled alternation, or None if no regular
+            expressions are given.
+
+    Raises:
+        re.error: If the alternation cannot be compiled.
+    """
+    regexes = ['(?:{})'.format(regex) for regex in regexes]
+    if len(regexes) == 0:
+        return None
+    return re.compile('|'.join(regexes))
+
+
+class RegexSet:
+    """A set of regular expressions searched at once.
+
+    The regular expressions are combined in a single alternation. Regular
+    expressions with a required literal are only searched if one of these
+    literals is in the string, which is checked with a single alternation of
+    the literals. Regular expressions with backreferences, or all regular
+    expressions if they cannot be combined, are searched one by one.
+    """
+
+    def __init__(self, regexes):
+        """Compiles the regular expressions.
+
+        Args:
+            regexes (iterable of str): The regular expressions.
+        """
+        regexes = list(regexes)
+        with_literal = []
+        literals = []
+        without_literal = []
+        self._separate = []
+        for regex in regexes:
+            if _BACKREFERENCE.search(regex):
+                self._separate.append(re.compile(regex))
+                continue
+            literal = required_literal(regex)
+            if literal is None:
+                without_literal.append(regex)
+            else:
+                with_literal.append(regex)
+                literals.append(literal)
+        try:
+            self._literals = combine(re.escape(l) for l in literals)
+            self._with_literal = combine(with_literal)
+            self._without_literal = combine(without_literal)
+        except re.error:
+            self._literals = self._with_literal = self._without_literal = None
+            self._separate = [re.compile(regex) for regex in regexes]
+
+    def search(self, string):
+        """Checks if one or more of the regular expressions match.
+
+        Args:
+            string (str): The string to search.
+
+        Returns:
+            bool: True if a regular expression matches, else False.
+        """
+        if self._without_literal is not None \
+                and self._without_literal.search(string):
+            return True
+        if self._literals is not None and self._literals.search(string) \
+                and self._with_literal.search(string):
+            return True
+        for regex in self._separate:
+            if regex.search(string):
+                return True
+        return False
+
+
+class UrlMatcher:
+    """Matches URLs against the allowed and ignored regular expressions.
+
+    An URL is allowed if it matches one or more of the allowed regular
+    expressions and none of the ignored regular expressions.
+    """
+
+    def __init__(self, allow_regex, ignore_regex):
+        """Compiles the regular expressions.
+
+        Args:
+            allow_regex (iterable of str): The allowed regular expressions.
+            ignore_regex (iterable of str): The ignored regular expressions.
+        """
+        self._allow = RegexSet(allow_regex)
+        self._ignore = RegexSet(ignore_regex)
+
+    def allowed(self, url):
+        """Checks if an URL is allowed.
+
+        Args:
+            url (str): The URL to check.
+
+        Returns:
+            bool: True if the URL is allowed, else False.
+        """
+        return self._allow.search(url) and not self._ignore.search(url)
+
+    def filter_urls(self, urls):
+        """Filters the allowed URLs.
+
+        Args:
+            urls (iterable of str): The URLs to filter.
+
+        Returns:
+            list of str: The allowed URLs.
+        """
+        allow = self._allow.search
+        ignore = self._ignore.search
+        return [url for url in urls if allow(url) and not ignore(url)]
@@ -0,0 +1,70 @@
+"""Tests for matcher.py."""
+import pickle
+import re
+import unittest
+
+from webarchiver.job.matcher import UrlMatcher, required_literal
+from webarchiver.job.settings import JobSettings
+
+ALLOW = (r'https?://(?:www)?example\.com/', r'https?://[^/]+\.london')
+IGNORE = (r'https?://[^/]+\.nl', r'/calendar/\d+', r'(?i)LOGOUT',
+          r'/(\w+)/\1/', r'[?&]sid=')
+URLS = (
+    'https://example.com/',
+    'http://wwwexample.com/page',
+    'https://shop.london/item',
+    'https://example.nl/',
+    'https://example.com/calendar/2019',
+    'https://example.com/calendar/',
+    'https://example.com/Logout',
+    'https://example.com/a/a/b',
+    'https://example.com/a/b/a',
+    'https://example.com/page?x=1&sid=2',
+    'https://example.org/',
+)
+
+
+def allowed(url):
+    """Checks if an URL is allowed with a loop over the regular expressions.
+
+    Args:
+        url (str): The URL to check.
+
+    Returns:
+        bool: True if the URL is allowed, else False.
+    """
+    return any(re.search(regex, url) for regex in ALLOW) \
+        and not any(re.search(regex, url) for regex in IGNORE)
+
+
+class TestUrlMatcher(unittest.TestCase):
+    """Tests for the URL matcher."""
+
+    def test_allowed(self):
+        matcher = UrlMatcher(ALLOW, IGNORE)
+        for url in URLS:
+            self.assertEqual(bool(matcher.allowed(url)), allowed(url), url)
+
+    def test_filter_urls(self):
+        matcher = UrlMatcher(ALLOW, IGNORE)
+        self.assertListEqual(matcher.filter_urls(URLS),
+                             [url for url in URLS if allowed(url)])
+
+    def test_no_allow_regex(self):
+        self.assertListEqual(UrlMatcher((), ()).filter_urls(URLS), [])
+
+    def test_required_literal(self):
+        self.assertEqual(required_literal(ALLOW[0]), 'example.com/')
+        self.assertEqual(required_literal(r'/calendar/\d+'), '/calendar/')
+        self.assertIsNone(required_literal(r'(?i)LOGOUT'))
+        self.assertIsNone(required_literal(r'abc|def'))
+
+    def test_pickle(self):
+        settings = JobSettings.__new__(JobSettings)
+        settings.allow_regex = ALLOW
+        settings.ignore_regex = IGNORE
+        self.assertIsNotNone(settings.matcher)
+        unpickled = pickle.loads(pickle.dumps(settings))
+        self.assertNotIn('_matcher', unpickled.__dict__)
+        self.assertListEqual(unpickled.filter_urls(URLS),
+                             settings.filter_urls(URLS))
@@ -3,6 +3,7 @@ import logging
 import os
 import sys
 
+from webarchiver.job.matcher import UrlMatcher
 from webarchiver.request import get
 from webarchiver.utils import random_string
 
@@ -33,6 +34,8 @@ class JobSettings:
             discovered during the job. URLs that match one or more of the
             regular expressions are not used.
         urls: The list of initial URLs for the job.
+        matcher: The :class:`webarchiver.job.matcher.UrlMatcher` for the
+            allowed and ignored regular expressions.
     """
 
     def __init__(self, identifier, config, location):
@@ -100,6 +103,33 @@ class JobSettings:
         setattr(self, key, t(self.config[key])
                 if key in self.config else default)
 
+    @property
+    def matcher(self):
+        """:obj:`webarchiver.job.matcher.UrlMatcher`: The matcher for the
+        allowed and ignored regular expressions.
+
+        The matcher is created once and not pickled, it is created again after
+        unpickling."""
+        if getattr(self, '_matcher', None) is None:
+            self._matcher = UrlMatcher(self.allow_regex, self.ignore_regex)
+        return self._matcher
+
+    def filter_urls(self, urls):
+        """Filters the URLs allowed by the regular expressions.
+
+        Args:
+            urls (iterable of str): The URLs to filter.
+
+        Returns:
+            list of str: The allowed URLs.
+        """
+        return self.matcher.filter_urls(urls)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_matcher', None)
+        return state
+
     def get_raw_response(self, url):
         """Gets the response for a URL.
 
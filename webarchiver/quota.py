@@ -0,0 +1,182 @@
+"""Token buckets for the URL quota of a job.
+
+The rate of a job is enforced by a single stager server, the counter, which
+keeps a :class:`TokenBucket`. The stager servers of the job lease blocks of
+tokens from the counter ahead of time and keep them in a :class:`QuotaLease`.
+URL quotas are granted to crawler servers from the lease, without asking the
+counter.
+
+Every token granted to a crawler server was taken from the bucket of the
+counter first. In any period of ``t`` seconds at most
+``rate * t + burst`` tokens are leased. A stager server holds at most one
+lease, or two if a request it gave up on is answered late. So at most
+``rate * t + burst + 2 * stagers * lease size`` URLs are granted in the
+period.
+"""
+import logging
+import math
+import time
+
+from webarchiver.config import *
+
+logger = logging.getLogger(__name__)
+
+
+def lease_size(rate):
+    """Gets the number of tokens in a lease.
+
+    Args:
+        rate (float): The rate in URLs per second of the job.
+
+    Returns:
+        int: The tokens for ``QUOTA_LEASE_TIME`` seconds, at least 1.
+    """
+    return max(1, math.ceil(rate * QUOTA_LEASE_TIME))
+
+
+def burst_size(rate):
+    """Gets the number of tokens the bucket of the counter holds at most.
+
+    Args:
+        rate (float): The rate in URLs per second of the job.
+
+    Returns:
+        int: The tokens for ``QUOTA_BURST_TIME`` seconds, at least 1.
+    """
+    return max(1, math.ceil(rate * QUOTA_BURST_TIME))
+
+
+class TokenBucket:
+    """A bucket filling with tokens at a fixed rate.
+
+    Attributes:
+        rate (float): The number of tokens added per second.
+        burst (int): The number of tokens the bucket holds at most.
+        clock (function): The function returning the time in seconds.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        """Inits a full bucket.
+
+        Args:
+            rate (float): The number of tokens added per second.
+            burst (int): The number of tokens the bucket holds at most.
+            clock (function, optional): The function returning the time in
+                seconds. Default is :func:`time.monotonic`.
+        """
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = burst
+        self._time = clock()
+
+    def take(self, count):
+        """Takes whole tokens from the bucket.
+
+        Args:
+            count (int): The number of tokens wanted.
+
+        Returns:
+            int: The number of tokens taken, which is less than `count` if
+                the bucket holds less.
+        """
+        self._fill()
+        taken = max(0, min(count, int(self._tokens)))
+        self._tokens -= taken
+        return taken
+
+    @property
+    def tokens(self):
+        """float: The number of tokens in the bucket."""
+        self._fill()
+        return self._tokens
+
+    def _fill(self):
+        """Adds the tokens for the time since the last fill."""
+        now = self.clock()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._time) * self.rate)
+        self._time = now
+
+    def __repr__(self):
+        return '<{} at 0x{:x} rate={} burst={}>' \
+            .format(__name__, id(self), self.rate, self.burst)
+
+
+class QuotaLease:
+    """The tokens a stager server leased from the counter of a job.
+
+    A new lease is requested when less than half of a lease is left, unless
+    the last request was less than ``QUOTA_LEASE_WAIT`` seconds ago. While a
+    request waits for an answer no new request is made, until it is given up
+    after ``QUOTA_LEASE_TIME`` seconds. The request is for the tokens missing
+    to a full lease.
+
+    Attributes:
+        size (int): The number of tokens in a full lease.
+        tokens (int): The number of tokens left to grant.
+        requested (bool): Whether a requested lease was not yet received.
+        leases (int): The number of leases received.
+        clock (function): The function returning the time in seconds.
+    """
+
+    def __init__(self, size, clock=time.monotonic):
+        """Inits the lease without tokens.
+
+        Args:
+            size (int): The number of tokens in a full lease.
+            clock (function, optional): The function returning the time in
+                seconds. Default is :func:`time.monotonic`.
+        """
+        self.size = size
+        self.tokens = 0
+        self.requested = False
+        self.leases = 0
+        self.clock = clock
+        self._last_request = None
+
+    def grant(self, count):
+        """Grants tokens from the lease.
+
+        Args:
+            count (int): The number of tokens wanted.
+
+        Returns:
+            int: The number of tokens granted, which is less than `count` if
+                less are left.
+        """
+        granted = max(0, min(count, self.tokens))
+        self.tokens -= granted
+        return granted
+
+    def request(self):
+        """Requests a new lease if one is needed.
+
+        Returns:
+            int: The number of tokens to request from the counter, or None if
+                no lease is needed yet.
+        """
+        if self.tokens >= self.size / 2:
+            return None
+        now = self.clock()
+        if self._last_request is not None:
+            wait = QUOTA_LEASE_TIME if self.requested else QUOTA_LEASE_WAIT
+            if now - self._last_request < wait:
+                return None
+        self._last_request = now
+        self.requested = True
+        return self.size - self.tokens
+
+    def add(self, tokens):
+        """Adds the tokens of a received lease.
+
+        Args:
+            tokens (int): The number of tokens leased by the counter.
+        """
+        self.tokens += tokens
+        self.requested = False
+        self.leases += 1
+
+    def __repr__(self):
+        return '<{} at 0x{:x} tokens={}/{}>' \
+            .format(__name__, id(self), self.tokens, self.size)
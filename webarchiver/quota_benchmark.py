@@ -0,0 +1,158 @@
+"""Benchmark for quota.py.
+
+Simulates crawler servers requesting an URL quota from a random stager server
+of a job every ``URL_QUOTA_TIME`` seconds. The old scheme, where every request
+is passed on to the counter, is compared to stager servers granting from
+tokens leased from the counter. For both the number of quota messages, the
+time until a quota is granted and the rate of granted URLs is printed. Every
+message takes ``LATENCY`` seconds.
+"""
+import heapq
+import itertools
+import math
+import random
+
+from webarchiver.config import *
+from webarchiver.quota import QuotaLease, TokenBucket, burst_size, lease_size
+
+LATENCY = 0.005
+DURATION = 600
+RATE = 50
+SETUPS = ((3, 10), (5, 50), (10, 200))
+
+
+class Clock:
+    """The time of the simulation."""
+
+    def __init__(self):
+        """Inits the clock at zero seconds."""
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+def requests(crawlers, stagers, rng):
+    """Yields the URL quota requests of the crawler servers.
+
+    Args:
+        crawlers (int): The number of crawler servers.
+        stagers (int): The number of stager servers.
+        rng (:obj:`random.Random`): The random generator.
+
+    Yields:
+        tuple: The time of the request and the stager server asked.
+    """
+    events = [(rng.uniform(0, URL_QUOTA_TIME), c) for c in range(crawlers)]
+    heapq.heapify(events)
+    while events[0][0] < DURATION:
+        time, c = heapq.heappop(events)
+        yield time, rng.randrange(stagers)
+        heapq.heappush(events, (time + URL_QUOTA_TIME, c))
+
+
+def counter_scheme(crawlers, stagers, rng):
+    """Simulates passing every request on to the counter.
+
+    Stager server 0 is the counter. It grants the URLs for the time since its
+    last grant.
+
+    Args:
+        crawlers (int): The number of crawler servers.
+        stagers (int): The number of stager servers.
+        rng (:obj:`random.Random`): The random generator.
+
+    Returns:
+        tuple: The number of messages, the grant latencies and the number of
+            granted URLs.
+    """
+    messages = 0
+    latencies = []
+    granted = 0
+    last = 0
+    for time, stager in requests(crawlers, stagers, rng):
+        hops = 2 if stager == 0 else 4
+        messages += hops
+        at_counter = time + LATENCY * (hops - 1) / 2
+        granted += int((at_counter - last) * RATE)
+        last = at_counter
+        latencies.append(hops * LATENCY)
+    return messages, latencies, granted
+
+
+def lease_scheme(crawlers, stagers, rng):
+    """Simulates granting from leased tokens.
+
+    Stager server 0 is the counter. Leases arrive ``2 * LATENCY`` seconds
+    after they are requested. A stager server without tokens does not answer
+    a request, so only granted quotas have a latency.
+
+    Args:
+        crawlers (int): The number of crawler servers.
+        stagers (int): The number of stager servers.
+        rng (:obj:`random.Random`): The random generator.
+
+    Returns:
+        tuple: The number of messages, the grant latencies and the number of
+            granted URLs.
+    """
+    clock = Clock()
+    bucket = TokenBucket(RATE, burst_size(RATE), clock)
+    leases = [QuotaLease(lease_size(RATE), clock) for s in range(stagers)]
+    share = math.ceil(lease_size(RATE) / crawlers)
+    arrivals = []
+    counter = itertools.count()
+    messages = 0
+    latencies = []
+    granted = 0
+    for s in range(1, stagers):
+        arrivals.append((LATENCY * 2, next(counter), s,
+                         bucket.take(leases[s].request())))
+        messages += 2
+    for time, stager in requests(crawlers, stagers, rng):
+        while len(arrivals) > 0 and arrivals[0][0] <= time:
+            clock.time, i, s, tokens = heapq.heappop(arrivals)
+            leases[s].add(tokens)
+        clock.time = time
+        lease = leases[stager]
+        if stager == 0:
+            count = lease.request()
+            if count is not None:
+                lease.add(bucket.take(count))
+        quota = lease.grant(share)
+        if quota > 0:
+            granted += quota
+            messages += 2
+            latencies.append(2 * LATENCY)
+        else:
+            messages += 1
+        count = lease.request() if stager != 0 else None
+        if count is not None:
+            clock.time = time + LATENCY
+            heapq.heappush(arrivals, (time + 2 * LATENCY, next(counter),
+                                      stager, bucket.take(count)))
+            messages += 2
+    return messages, latencies, granted
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    print('{:<10}{:>8}{:>9}{:>12}{:>12}{:>12}{:>10}'.format(
+        'scheme', 'stagers', 'crawlers', 'messages/s', 'latency',
+        'URLs/s', 'grants'))
+    for stagers, crawlers in SETUPS:
+        for name, scheme in (('counter', counter_scheme),
+                             ('lease', lease_scheme)):
+            messages, latencies, granted = scheme(crawlers, stagers,
+                                                  random.Random(0))
+            print('{:<10}{:>8}{:>9}{:>12.1f}{:>10.2f}ms{:>12.1f}{:>10}'
+                  .format(name, stagers, crawlers, messages / DURATION,
+                          sum(latencies) / len(latencies) * 1000,
+                          granted / DURATION, len(latencies)))
+    stagers = max(s for s, c in SETUPS)
+    print('Leases grant at most {} URLs/s plus {} URLs for {} stagers.'
+          .format(RATE, burst_size(RATE) + 2 * stagers * lease_size(RATE),
+                  stagers))
+
+if __name__ == '__main__':
+    main()
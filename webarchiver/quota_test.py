@@ -0,0 +1,87 @@
+"""Tests for quota.py."""
+import random
+import unittest
+
+from webarchiver.config import *
+from webarchiver.quota import QuotaLease, TokenBucket, burst_size, lease_size
+
+
+class Clock:
+    """A clock only moving when it is told to."""
+
+    def __init__(self):
+        """Inits the clock at zero seconds."""
+        self.time = 0
+
+    def __call__(self):
+        return self.time
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Tests for taking tokens at a fixed rate."""
+
+    def test_take(self):
+        clock = Clock()
+        bucket = TokenBucket(10, 20, clock)
+        self.assertEqual(bucket.take(15), 15)
+        self.assertEqual(bucket.take(15), 5)
+        self.assertEqual(bucket.take(1), 0)
+        clock.time = 0.55
+        self.assertEqual(bucket.take(15), 5)
+        self.assertAlmostEqual(bucket.tokens, 0.5)
+
+    def test_burst(self):
+        clock = Clock()
+        bucket = TokenBucket(10, 20, clock)
+        clock.time = 100
+        self.assertEqual(bucket.take(100), 20)
+
+
+class TestQuotaLease(unittest.TestCase):
+    """Tests for granting from and renewing leased tokens."""
+
+    def test_request(self):
+        clock = Clock()
+        lease = QuotaLease(100, clock)
+        self.assertEqual(lease.request(), 100)
+        self.assertIsNone(lease.request())
+        lease.add(100)
+        self.assertEqual(lease.grant(60), 60)
+        self.assertIsNone(lease.request())
+        clock.time = QUOTA_LEASE_WAIT
+        self.assertEqual(lease.request(), 60)
+        self.assertEqual(lease.grant(60), 40)
+        self.assertEqual(lease.grant(1), 0)
+
+    def test_given_up(self):
+        clock = Clock()
+        lease = QuotaLease(100, clock)
+        lease.request()
+        clock.time = QUOTA_LEASE_WAIT
+        self.assertIsNone(lease.request())
+        clock.time = QUOTA_LEASE_TIME
+        self.assertEqual(lease.request(), 100)
+
+    def test_size(self):
+        self.assertEqual(lease_size(0.01), 1)
+        self.assertEqual(lease_size(5), 5 * QUOTA_LEASE_TIME)
+        self.assertEqual(burst_size(5), 5 * QUOTA_BURST_TIME)
+
+    def test_bound(self):
+        clock = Clock()
+        rate = 50
+        bucket = TokenBucket(rate, burst_size(rate), clock)
+        leases = [QuotaLease(lease_size(rate), clock) for i in range(5)]
+        rng = random.Random(0)
+        granted = 0
+        for step in range(6000):
+            clock.time = step * 0.1
+            lease = rng.choice(leases)
+            granted += lease.grant(rng.randint(1, 200))
+            count = lease.request()
+            if count is not None:
+                lease.add(bucket.take(count))
+        bound = rate * clock.time + burst_size(rate) \
+            + 2 * len(leases) * lease_size(rate)
+        self.assertLessEqual(granted, bound)
+        self.assertGreater(granted, rate * clock.time * 0.9)
@@ -1,12 +1,16 @@
 """The base of the servers."""
+import collections
+import itertools
 import logging
-import pickle
 import random
-import select
+import selectors
 import socket
-import struct
+import time
 
 from webarchiver.config import *
+from webarchiver.server import codec, transfer
+from webarchiver.server.scheduler import Scheduler
+from webarchiver.utils import check_time
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,19 @@ class Node:
     Args:
         socket: The socket of the node.
         listener: The listener of the node as tuple of (host, port).
+        read_buffer (bytearray): Received data that does not yet form a
+            complete message.
+        codec (:obj:`webarchiver.server.codec.BinaryCodec` or
+            :obj:`webarchiver.server.codec.PickleCodec`): The codec used to
+            encode messages send to the node.
+        interned (dict): The job identifiers interned by the node.
+        interned_defined (set): The numbers of the job identifiers interned
+            by this server that are defined on the node.
+        write_offset (int): The number of bytes of the first frame in the
+            write queue that are already send.
+        receiver (:obj:`webarchiver.server.transfer.StreamReceiver`): The
+            receiver of the stream that is currently being received from the
+            node, or None.
     """
     #TODO add if this is a stager of crawler server?
     def __init__(self, s, listener=None):
@@ -31,6 +48,12 @@ class Node:
         """
         self.socket = s
         self.listener = listener
+        self.read_buffer = bytearray()
+        self.codec = codec.CODECS[codec.BASE_CODEC]
+        self.interned = {}
+        self.interned_defined = set()
+        self.write_offset = 0
+        self.receiver = None
 
     def __getattr__(self, attr):
         """If the attribute is not found, find it in the socket.
@@ -49,7 +72,13 @@ class Node:
 
 
 class BaseServer:
-    """The base for the server for a crawler or stager."""
+    """The base for the server for a crawler or stager.
+
+    The periodic work of a server is done by tasks on its
+    :class:`webarchiver.server.scheduler.Scheduler`. The loop waits on the
+    sockets until the next task is due, or until a task is woken with
+    :func:`wake`.
+    """
 
     def __init__(self, host=None, port=None):
         """Creates the base server with an address.
@@ -70,12 +99,12 @@ class BaseServer:
         """
         self._address = (host or socket.getfqdn(),
                          port or random.randrange(50000, 60000))
-        self._read_list = []
-        self._write_list = []
-        self._error_list = []
+        self._selector = selectors.DefaultSelector()
         self._write_queue = {}
-        self._last_stager_request = 0
-        self._last_ping = 0
+        self._interner = codec.Interner()
+        self._batches = {}
+        self._accepted_codecs = {codec.BASE_CODEC} | set(WIRE_CODECS)
+        self._scheduler = Scheduler()
 
         logger.info('Creating server with listener %s.', self._address)
         self._socket = Node(socket.socket(socket.AF_INET, socket.SOCK_STREAM),
@@ -83,7 +112,11 @@ class BaseServer:
         self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._socket.bind(('0.0.0.0', self._address[1]))
         self._socket.listen(LISTEN_QUEUE)
-        self._read_list.append(self._socket)
+        self._selector.register(self._socket, selectors.EVENT_READ)
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._selector.register(self._wake_reader, selectors.EVENT_READ)
 
     def run(self):
         """Runs a loop to get the new readable and writable sockets."""
@@ -91,14 +124,100 @@ class BaseServer:
             self._run_round()
 
     def _run_round(self):
-        """Initiates the reading from and writing to sockets."""
-        read_ready, write_ready, error_ready = select.select(
-            self._read_list, self._write_list, self._error_list, 1)
-        for s in read_ready:
-            self._read_socket(s)
-        for s in write_ready:
-            self._write_socket(s)
-        #self._handle_error(error_ready) TODO
+        """Initiates the reading from and writing to sockets.
+
+        The selector returns the registered :class:`Node` objects that are
+        ready for reading and/or writing, waiting at most until the next task
+        is due. A :class:`Node` that is closed while handling the read event
+        is not written to anymore. The tasks that are due or woken are run
+        afterwards.
+        """
+        for key, events in self._selector.select(self._scheduler.timeout()):
+            s = key.fileobj
+            if s is self._wake_reader:
+                self._read_wake()
+                continue
+            if events & selectors.EVENT_READ:
+                self._read_socket(s)
+            if events & selectors.EVENT_WRITE and s in self._write_queue:
+                self._write_socket(s)
+        self._scheduler.run()
+
+    def wake(self, *tasks):
+        """Runs tasks in the loop as soon as possible.
+
+        This can be called from any thread. A byte is written to the wake up
+        socket, so a loop waiting on the selector returns.
+
+        Args:
+            *tasks (:obj:`webarchiver.server.scheduler.Task`): The tasks.
+        """
+        self._scheduler.wake(*tasks)
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _read_wake(self):
+        """Empties the wake up socket."""
+        try:
+            while len(self._wake_reader.recv(SOCKET_READ_SIZE)) > 0:
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+    def _add_node(self, s):
+        """Registers a :class:`Node` for reading.
+
+        The :class:`Node` is registered once with the selector and gets a
+        write queue. The socket of the :class:`Node` is made non-blocking.
+        Registering an already registered :class:`Node` does nothing.
+
+        Args:
+            s (:obj:`Node`): The node to register.
+        """
+        if s in self._write_queue:
+            return None
+        logger.debug('Registering node %s.', s)
+        s.setblocking(False)
+        self._write_queue[s] = collections.deque()
+        self._selector.register(s, selectors.EVENT_READ)
+
+    def _remove_node(self, s):
+        """Unregisters a :class:`Node` and closes its socket.
+
+        Args:
+            s (:obj:`Node`): The node to unregister.
+        """
+        if s not in self._write_queue:
+            return None
+        logger.debug('Unregistering node %s.', s)
+        for item in self._write_queue.pop(s):
+            if isinstance(item, transfer.FileSender):
+                item.close()
+                self._stream_aborted(s, item)
+        if s.receiver is not None:
+            s.receiver.close()
+            s.receiver = None
+        self._selector.unregister(s)
+        s.close()
+
+    def _set_writable(self, s, writable):
+        """Sets whether the selector should wait for a :class:`Node` to be
+        writable.
+
+        A :class:`Node` is always waited on for reading. The interest is only
+        changed if it differs from the current interest.
+
+        Args:
+            s (:obj:`Node`): The node to change the interest for.
+            writable (bool): True to also wait for the node to be writable.
+        """
+        events = selectors.EVENT_READ
+        if writable:
+            events |= selectors.EVENT_WRITE
+        if self._selector.get_key(s).events != events:
+            self._selector.modify(s, events)
 
     def _connect_socket(self, address):
         """Connects to an address.
@@ -119,13 +238,17 @@ class BaseServer:
         return s
 
     def _read_socket(self, s):
-        """Reads a message from a :class:`Node`.
+        """Reads messages from a :class:`Node`.
 
-        Reads a message from a socket, send by a crawler or stager. The first
-        8 bytes contain the length for the whole message. This length is used
-        to received the full messages in parts. The messages is loaded with
-        :mod:`pickle` and send to :func:`self._process_message` to be
-        processed.
+        Reads the data that is available on a socket, send by a crawler or
+        stager, into the read buffer of the :class:`Node`. Only a single
+        receive is done, so a slow server does not block the loop. Every
+        complete message in the read buffer is send to
+        :func:`self._process_message` to be processed. If the connection is
+        closed, the :class:`Node` is removed.
+
+        The raw bytes following a stream command are given to the receiver of
+        the :class:`Node` instead, after which decoding messages continues.
 
         The received message is printed to stdout as::
 
@@ -134,45 +257,180 @@ class BaseServer:
         Args:
             s (:obj:`Node`): The node to read from.
         """
-        message_length = s.recv(8)
-        if len(message_length) == 0:
-            return
-        message_length = struct.unpack('L', message_length)[0]
-        message = b''
-        while len(message) < message_length:
-            message += s.recv(message_length - len(message))
-        message = pickle.loads(message)
-        logger.debug('Received message %s from %s.', message, s)
-        self._process_message(s, message)
+        try:
+            data = s.recv(SOCKET_READ_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return None
+        except ConnectionError:
+            data = b''
+        if len(data) == 0:
+            logger.info('Connection with %s closed.', s)
+            self._remove_node(s)
+            return None
+        if s.receiver is not None and len(s.read_buffer) == 0:
+            data = memoryview(data)[self._read_stream(s, data):]
+        s.read_buffer += data
+        while s.receiver is None and len(s.read_buffer) > 0:
+            try:
+                messages = self._read_messages(s)
+            except codec.CodecError as error:
+                logger.error('Could not decode message from %s: %s', s, error)
+                self._remove_node(s)
+                return None
+            for message in messages:
+                logger.debug('Received message %s from %s.', message, s)
+                self._process_message(s, message)
+            if s.receiver is None or s not in self._write_queue:
+                break
+            del s.read_buffer[:self._read_stream(s, s.read_buffer)]
+
+    def _read_stream(self, s, data):
+        """Gives received bytes to the receiver of a :class:`Node`.
+
+        If the stream is complete, :func:`_stream_received` is called with
+        the receiver and messages are decoded again.
+
+        Args:
+            s (:obj:`Node`): The node the data was received from.
+            data (bytes-like object): The received data.
+
+        Returns:
+            int: The number of bytes of the data that belong to the stream.
+        """
+        receiver = s.receiver
+        length = receiver.write(data)
+        if receiver.done:
+            s.receiver = None
+            self._stream_received(s, receiver)
+        return length
+
+    def _stream_received(self, s, receiver):
+        """Handles a stream that was completely received.
+
+        Args:
+            s (:obj:`Node`): The node the stream was received from.
+            receiver (:obj:`webarchiver.server.transfer.StreamReceiver`): The
+                receiver of the stream.
+        """
+        pass
+
+    def _stream_aborted(self, s, sender):
+        """Handles a file that could not be completely send.
+
+        Args:
+            s (:obj:`Node`): The node the file was send to.
+            sender (:obj:`webarchiver.server.transfer.FileSender`): The
+                sender of the file.
+        """
+        pass
+
+    def _read_messages(self, s):
+        """Decodes the complete messages in the read buffer of a
+        :class:`Node`.
+
+        Each message starts with a header containing the length of the
+        message. The messages are decoded with
+        :func:`webarchiver.server.codec.decode` without copying them out of
+        the buffer. The decoded data is removed from the read buffer at once,
+        an incomplete message is left in the buffer for a next read.
+
+        Decoding stops after a stream command, because raw bytes follow it.
+        A :class:`webarchiver.server.transfer.StreamReceiver` discarding the
+        stream is set on the :class:`Node`, which the command handler can
+        replace.
+
+        Args:
+            s (:obj:`Node`): The node to decode the messages of.
+
+        Returns:
+            list: The decoded messages.
+
+        Raises:
+            webarchiver.server.codec.CodecError: If a message could not be
+                decoded.
+        """
+        buffer = s.read_buffer
+        messages = []
+        offset = 0
+        header_size = codec.HEADER.size
+        view = memoryview(buffer)
+        try:
+            while len(buffer) - offset >= header_size:
+                message_length = codec.HEADER.unpack_from(buffer, offset)[0]
+                end = offset + header_size + message_length
+                if len(buffer) < end:
+                    break
+                message = codec.decode(view[offset+header_size:end],
+                                       s.interned, self._accepted_codecs)
+                offset = end
+                if message is None:
+                    continue
+                messages.append(message)
+                if message[0] in codec.STREAM_COMMANDS:
+                    s.receiver = transfer.StreamReceiver(message[-1])
+                    break
+        finally:
+            view.release()
+        del buffer[:offset]
+        return messages
 
     def _write_socket(self, s):
-        """Writes all waiting messages for a :class:`Node`.
+        """Writes waiting frames for a :class:`Node`.
+
+        Up to ``SOCKET_WRITE_BATCH`` frames from the write queue are send at
+        once with a single scatter/gather ``sendmsg`` call, without joining
+        them. Fully send frames are removed from the write queue. If a frame
+        is only partially send, the offset is kept so the next write continues
+        where this one stopped. Writing stops when the socket would block.
 
-        Each message for a certain :class:`Node` is dumped with :mod:`pickle`,
-        after which the length of the messages is prepended to the message. The
-        message is then send.
+        A :class:`webarchiver.server.transfer.FileSender` in the write queue
+        is send in chunks and removed after the whole file is send.
 
-        The :class:`Node` is put back in the read list and removed from the
-        write list.
+        After the write queue is empty the selector stops waiting for the
+        :class:`Node` to be writable.
 
         Args:
-            s (:obj:`Node`): The :class:`Node` to write the message to.
+            s (:obj:`Node`): The :class:`Node` to write the frames to.
         """
-        while len(self._write_queue[s]) > 0:
-            message = self._write_queue[s].pop(0)
-            logger.debug('Sending message %s to %s.', message, s)
-            message = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
-            s.sendall(struct.pack('L', len(message)) + message)
-        self._read_list.append(s)
-        self._write_list.remove(s)
+        queue = self._write_queue[s]
+        while len(queue) > 0:
+            try:
+                if isinstance(queue[0], transfer.FileSender):
+                    queue[0].send(s)
+                    if queue[0].done:
+                        queue.popleft().close()
+                    continue
+                buffers = []
+                for frame in itertools.islice(queue, SOCKET_WRITE_BATCH):
+                    if isinstance(frame, transfer.FileSender):
+                        break
+                    buffers.append(frame)
+                if s.write_offset > 0:
+                    buffers[0] = memoryview(buffers[0])[s.write_offset:]
+                sent = s.sendmsg(buffers) + s.write_offset
+            except (BlockingIOError, InterruptedError):
+                return None
+            except ConnectionError as error:
+                logger.info('Connection with %s lost: %s', s, error)
+                self._remove_node(s)
+                return None
+            while len(queue) > 0 and not isinstance(queue[0],
+                                                    transfer.FileSender) \
+                    and sent >= len(queue[0]):
+                sent -= len(queue.popleft())
+            s.write_offset = sent
+        self._set_writable(s, False)
 
     def _write_socket_message(self, s, *message):
         """Prepares writing a message to a :class:`Node`.
 
         A single :class:`Node` can be given or a list, set, or dict. The
-        message it copied and added to the write queue of every given
-        :class:`Node`. Each :class:`Node` is removed from the read list and
-        added to the write list.
+        message is encoded once for every codec used by the given
+        :class:`Node`s with :func:`webarchiver.server.codec.encode`. The same
+        immutable frame is added to the write queue of every :class:`Node`
+        using that codec, preceded by frames defining the interned job
+        identifiers that are not yet defined on the :class:`Node`. The
+        selector waits for each :class:`Node` to be writable.
 
         Args:
             s (:obj:`Node` or list or set or dict): One or more :class:`Node`s
@@ -186,20 +444,155 @@ class BaseServer:
                          s_original, s)
         if type(s) in [list, set, dict]:
             logger.debug('Sending message %s to %s servers.', message, len(s))
-            for s_ in s:
-                self._write_socket_message(s_, *message)
+            nodes = s
+        else:
+            logger.debug('Sending message %s to %s.', message, s)
+            nodes = (s,)
+        frames = {}
+        for s_ in nodes:
+            if s_ not in self._write_queue:
+                logger.warning('Node %s is not registered, dropping message '
+                               '%s.', s_, message)
+                continue
+            if s_.codec not in frames:
+                frames[s_.codec] = codec.encode(s_.codec, message,
+                                                self._interner)
+            frame, used = frames[s_.codec]
+            self._write_queue[s_].extend(
+                codec.encode_interned(s_.codec, used, self._interner,
+                                      s_.interned_defined)
+            )
+            self._write_queue[s_].append(frame)
+            self._set_writable(s_, True)
+
+    def _write_socket_file(self, s, filename, offset, *message):
+        """Streams a file to a :class:`Node`.
+
+        The stream command is send, followed by the bytes of the file from
+        the offset on. The number of bytes is added as last field to the
+        command::
+
+            <command> <fields> <length>
+
+        The file is not read into memory, but send in chunks by a
+        :class:`webarchiver.server.transfer.FileSender` in the write queue.
+
+        Args:
+            s (:obj:`Node`): The :class:`Node` to send the file to.
+            filename (str): The path to the file.
+            offset (int): The position in the file to start sending from.
+            *message: The stream command and its fields.
+        """
+        if s not in self._write_queue:
+            logger.warning('Not sending file %s to unregistered node %s.',
+                           filename, s)
             return None
-        self._write_queue[s].append(message)
-        if s in self._read_list:
-            self._read_list.remove(s)
-        if s not in self._write_list:
-            self._write_list.append(s)
-
-    def _write_socket_file(self, s, filename, *message):
-        """Writes a file to a :class:`Node` object.""" #TODO
-        with open(filename, 'rb') as f:
-            self._write_socket_message(s, message[0], filename, f.read(),
-                                       *message[1:])
+        sender = transfer.FileSender(filename, offset)
+        self._write_socket_message(s, *message, sender.remaining)
+        self._write_queue[s].append(sender)
+
+    def _write_socket_batch(self, s, command, fields, item):
+        """Adds an item to a batched message to one or more :class:`Node`s.
+
+        Items for the same :class:`Node`s, command and fields are collected
+        into a single message like::
+
+            <command> <fields> <item> <item> ...
+
+        The message is send with :func:`_write_socket_message` when it holds
+        ``BATCH_MAX_ITEMS`` items, or by a task running :func:`_flush_batch`
+        ``BATCH_MAX_WAIT`` seconds after the first item was added.
+
+        Args:
+            s (:obj:`Node` or list or set or dict): One or more :class:`Node`s
+                to send the message to.
+            command (str): The command of the batched message.
+            fields (tuple): The fields of the message before the items.
+            item: The item to add.
+        """
+        if type(s) in [list, set, dict]:
+            s = tuple(s)
+        key = (s, command, fields)
+        if key not in self._batches:
+            created = time.time()
+            self._batches[key] = (created, [])
+            self._scheduler.add(self._flush_batch, key, created,
+                                delay=BATCH_MAX_WAIT)
+        items = self._batches[key][1]
+        items.append(item)
+        if len(items) >= BATCH_MAX_ITEMS:
+            del self._batches[key]
+            self._write_socket_batch_message(key, items)
+
+    def _flush_batches(self, force=False):
+        """Sends the batched messages that are waiting too long.
+
+        Args:
+            force (bool, optional): Whether to send every batched message,
+                regardless of how long it is waiting. Default is False.
+        """
+        for key, (created, items) in list(self._batches.items()):
+            if force or check_time(created, BATCH_MAX_WAIT):
+                del self._batches[key]
+                self._write_socket_batch_message(key, items)
+
+    def _flush_batch(self, key, created):
+        """Sends a batched message if it was not yet send.
+
+        Args:
+            key (tuple): A tuple (:class:`Node`s, command, fields) of the
+                batched message.
+            created (float): The time the first item was added to the batched
+                message.
+        """
+        if key in self._batches and self._batches[key][0] == created:
+            self._write_socket_batch_message(key, self._batches.pop(key)[1])
+
+    def _write_socket_batch_message(self, key, items):
+        """Sends a batched message.
+
+        Args:
+            key (tuple): A tuple (:class:`Node`s, command, fields) of the
+                batched message.
+            items (list): The items of the batched message.
+        """
+        s, command, fields = key
+        if type(s) is tuple:
+            s = list(s)
+        self._write_socket_message(s, command, *fields, *items)
+
+    def _choose_codec(self, offered):
+        """Chooses the codec to use with a server that announced itself.
+
+        Args:
+            offered (list of int): The identifiers of the codecs offered by the
+                announcing server.
+
+        Returns:
+            int: The identifier of the first codec in ``WIRE_CODECS`` that is
+                offered, or ``BASE_CODEC`` if none is offered.
+        """
+        for identifier in WIRE_CODECS:
+            if identifier in offered:
+                return identifier
+        return codec.BASE_CODEC
+
+    def _set_codec(self, s, identifier):
+        """Sets the codec to encode messages to a :class:`Node` with.
+
+        Args:
+            s (:obj:`Node`): The node to set the codec for.
+            identifier (int): The identifier of the codec.
+
+        Returns:
+            bool: True if the codec is set, False if the codec is not accepted.
+        """
+        if identifier not in self._accepted_codecs:
+            logger.warning('Codec %s for %s is not accepted.', identifier, s)
+            return False
+        logger.debug('Using codec %s for %s.', identifier, s)
+        s.codec = codec.CODECS[identifier]
+        return True
 
     def _process_message(self, s, message):
         """Processes a received message.
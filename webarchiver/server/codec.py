@@ -0,0 +1,564 @@
+"""Encoding and decoding of messages send between servers.
+
+Every message is send as a frame. A frame starts with a header of 4 bytes in
+network byte order containing the length of the payload. The first byte of
+the payload is the identifier of the codec that encoded the message, so every
+frame can be decoded on its own.
+
+Two codecs are available:
+
+* :class:`PickleCodec` with identifier 0, the original encoding of messages
+  with :mod:`pickle`.
+* :class:`BinaryCodec` with identifier 1, a compact encoding using a fixed
+  schema for every known command.
+
+Every server speaks ``BASE_CODEC`` when a connection is created. A better
+codec is negotiated when a server announces itself.
+"""
+import pickle
+import struct
+
+from webarchiver.job.settings import JobSettings
+from webarchiver.url import UrlConfig
+
+HEADER = struct.Struct('!I')
+"""The header of a frame containing the length of the payload."""
+
+
+class CodecError(ValueError):
+    """Exception for messages that can not be encoded or decoded."""
+    pass
+
+
+class Interner:
+    """Assigns numbers to job identifiers.
+
+    Job identifiers are send in almost every message. The binary codec sends
+    the number assigned to the job identifier instead. The first time a number
+    is used on a connection an ``INTERN`` message is send to define it.
+    """
+
+    def __init__(self):
+        """Inits the interner."""
+        self._indices = {}
+
+    def index(self, identifier):
+        """Gets the number for a job identifier.
+
+        Args:
+            identifier (str): The job identifier.
+
+        Returns:
+            int: The number assigned to the job identifier.
+        """
+        index = self._indices.get(identifier)
+        if index is None:
+            index = self._indices[identifier] = len(self._indices) + 1
+        return index
+
+
+class PickleCodec:
+    """Encodes messages with :mod:`pickle`.
+
+    Note:
+        Loading a pickled message can execute code, only enable this codec
+        between trusted servers.
+    """
+    identifier = 0
+
+    def encode(self, message, interner):
+        """Encodes a message.
+
+        Args:
+            message (tuple): The message to encode.
+            interner (:obj:`Interner`): Not used.
+
+        Returns:
+            tuple of (bytes, dict): The payload and an empty dict, since no job
+                identifiers are interned.
+        """
+        return bytes((self.identifier,)) \
+            + pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL), {}
+
+    def decode(self, data, interned):
+        """Decodes a payload.
+
+        Args:
+            data (bytes-like): The payload.
+            interned (dict): Not used.
+
+        Returns:
+            tuple: The decoded message.
+        """
+        return pickle.loads(memoryview(data)[1:])
+
+
+def _encode_uint(out, value):
+    if value < 0:
+        raise CodecError('Negative value {} for unsigned integer.'
+                         .format(value))
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_uint(data, pos):
+    result = data[pos]
+    pos += 1
+    if result < 0x80:
+        return result, pos
+    result &= 0x7f
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _encode_int(out, value, interner, used):
+    _encode_uint(out, value << 1 if value >= 0 else (-value << 1) - 1)
+
+
+def _decode_int(data, pos, interned):
+    value, pos = _decode_uint(data, pos)
+    return (value >> 1) if not value & 1 else -((value + 1) >> 1), pos
+
+
+def _encode_uint_field(out, value, interner, used):
+    _encode_uint(out, value)
+
+
+def _decode_uint_field(data, pos, interned):
+    return _decode_uint(data, pos)
+
+
+def _encode_bytes(out, value, interner, used):
+    length = len(value)
+    if length < 0x80:
+        out.append(length)
+    else:
+        _encode_uint(out, length)
+    out += value
+
+
+def _decode_bytes(data, pos, interned):
+    length = data[pos]
+    if length < 0x80:
+        pos += 1
+    else:
+        length, pos = _decode_uint(data, pos)
+    end = pos + length
+    if end > len(data):
+        raise CodecError('Truncated message.')
+    return data[pos:end], end
+
+
+def _encode_str(out, value, interner, used):
+    _encode_bytes(out, value.encode('utf-8'), interner, used)
+
+
+def _decode_str(data, pos, interned):
+    value, pos = _decode_bytes(data, pos, interned)
+    return value.decode('utf-8'), pos
+
+
+def _encode_optional_str(out, value, interner, used):
+    if value is None:
+        out.append(0)
+        return None
+    value = value.encode('utf-8')
+    _encode_uint(out, len(value) + 1)
+    out += value
+
+
+def _decode_optional_str(data, pos, interned):
+    length, pos = _decode_uint(data, pos)
+    if length == 0:
+        return None, pos
+    end = pos + length - 1
+    if end > len(data):
+        raise CodecError('Truncated message.')
+    return data[pos:end].decode('utf-8'), end
+
+
+def _encode_job(out, value, interner, used):
+    index = interner.index(value)
+    used[index] = value
+    _encode_uint(out, index)
+
+
+def _decode_job(data, pos, interned):
+    index, pos = _decode_uint(data, pos)
+    if index not in interned:
+        raise CodecError('Job identifier number {} is not defined.'
+                         .format(index))
+    return interned[index], pos
+
+
+def _encode_listener(out, value, interner, used):
+    _encode_str(out, value[0], interner, used)
+    _encode_uint(out, value[1])
+
+
+def _decode_listener(data, pos, interned):
+    host, pos = _decode_str(data, pos, interned)
+    port, pos = _decode_uint(data, pos)
+    return (host, port), pos
+
+
+def _encode_strs(out, value, interner, used):
+    _encode_uint(out, len(value))
+    if len(value) == 0:
+        return None
+    joined = '\x00'.join(value)
+    if joined.count('\x00') != len(value) - 1:
+        raise CodecError('String in list contains a null character.')
+    _encode_str(out, joined, interner, used)
+
+
+def _decode_strs(data, pos, interned):
+    length, pos = _decode_uint(data, pos)
+    if length == 0:
+        return (), pos
+    joined, pos = _decode_str(data, pos, interned)
+    values = tuple(joined.split('\x00'))
+    if len(values) != length:
+        raise CodecError('Wrong number of strings in list.')
+    return values, pos
+
+
+def _encode_str_dict(out, value, interner, used):
+    _encode_uint(out, len(value))
+    for key, s in value.items():
+        _encode_str(out, key, interner, used)
+        _encode_str(out, s, interner, used)
+
+
+def _decode_str_dict(data, pos, interned):
+    length, pos = _decode_uint(data, pos)
+    values = {}
+    for i in range(length):
+        key, pos = _decode_str(data, pos, interned)
+        values[key], pos = _decode_str(data, pos, interned)
+    return values, pos
+
+
+def _encode_urlconfig(out, value, interner, used):
+    _encode_job(out, value.job_identifier, interner, used)
+    _encode_str(out, value.url, interner, used)
+    _encode_uint(out, value.depth)
+    _encode_optional_str(out, value.parent_url, interner, used)
+
+
+def _decode_urlconfig(data, pos, interned):
+    job_identifier, pos = _decode_job(data, pos, interned)
+    url, pos = _decode_str(data, pos, interned)
+    depth, pos = _decode_uint(data, pos)
+    parent_url, pos = _decode_optional_str(data, pos, interned)
+    return UrlConfig(job_identifier, url, depth, parent_url), pos
+
+
+_SETTINGS_FIELDS = (
+    ('identifier', _encode_str, _decode_str),
+    ('config', _encode_str_dict, _decode_str_dict),
+    ('allow_regex', _encode_strs, _decode_strs),
+    ('ignore_regex', _encode_strs, _decode_strs),
+    ('rate', _encode_uint_field, _decode_uint_field),
+    ('depth', _encode_uint_field, _decode_uint_field),
+    ('urls', _encode_strs, _decode_strs),
+    ('_raw_config', _encode_bytes, _decode_bytes),
+)
+"""The attributes of the job settings that are send.
+
+The raw responses and files are only kept on the server that loaded the job.
+"""
+
+
+def _encode_settings(out, value, interner, used):
+    for attribute, encoder, decoder in _SETTINGS_FIELDS:
+        encoder(out, getattr(value, attribute), interner, used)
+
+
+def _decode_settings(data, pos, interned):
+    settings = JobSettings.__new__(JobSettings)
+    for attribute, encoder, decoder in _SETTINGS_FIELDS:
+        value, pos = decoder(data, pos, interned)
+        setattr(settings, attribute, value)
+    settings._raw_config = bytes(settings._raw_config)
+    settings._raw_responses = {}
+    settings._raw_files = {}
+    return settings, pos
+
+
+TYPES = {
+    'int': (_encode_int, _decode_int),
+    'uint': (_encode_uint_field, _decode_uint_field),
+    'str': (_encode_str, _decode_str),
+    'bytes': (_encode_bytes, _decode_bytes),
+    'job': (_encode_job, _decode_job),
+    'listener': (_encode_listener, _decode_listener),
+    'urlconfig': (_encode_urlconfig, _decode_urlconfig),
+    'settings': (_encode_settings, _decode_settings),
+}
+"""The types that can be used in the schema of a command.
+
+Each type has an encoder and a decoder. The job type is an interned job
+identifier.
+"""
+
+COMMANDS = (
+    ('INTERN', ('uint', 'str')),
+    ('PING', ()),
+    ('PONG', ()),
+    ('ANNOUNCE_CRAWLER', ('listener', '*uint')),
+    ('ANNOUNCE_CRAWLER_EXTRA', ('listener', '*uint')),
+    ('ANNOUNCE_STAGER', ('listener', '*uint')),
+    ('ANNOUNCE_STAGER_EXTRA', ('listener', '*uint')),
+    ('CONFIRMED', ('int', '*uint')),
+    ('ALREADY_CONFIRMED', ()),
+    ('STAGER_NEW', ('listener',)),
+    ('ADD_STAGER', ('listener',)),
+    ('REQUEST_STAGER', ('uint', '*listener')),
+    ('NEW_JOB', ('settings',)),
+    ('NEW_JOB_CRAWL', ('settings',)),
+    ('NEW_JOB_STAGER', ('job', '*listener')),
+    ('CONFIRMED_JOB', ('int', 'job')),
+    ('JOB_SET_COUNTER', ('job', 'listener')),
+    ('JOB_CRAWL_CONFIRMED', ('job',)),
+    ('JOB_START', ('job',)),
+    ('JOB_START_CRAWL', ('job',)),
+    ('JOB_STARTED_CRAWL', ('job',)),
+    ('JOB_STARTED_STAGER', ('job',)),
+    ('JOB_URL', ('urlconfig',)),
+    ('JOB_URL_BACKUP', ('urlconfig', 'listener')),
+    ('JOB_URL_CRAWL', ('urlconfig',)),
+    ('JOB_URL_DISCOVERED', ('urlconfig',)),
+    ('JOB_URL_FINISHED', ('job', 'str', 'listener')),
+    ('CRAWLER_JOB_FINISHED', ('job',)),
+    ('STAGER_JOB_FINISHED', ('job',)),
+    ('REQUEST_URL_QUOTA', ('job',)),
+    ('REQUEST_URL_QUOTA_LEASE', ('job', 'uint')),
+    ('ASSIGNED_URL_QUOTA_LEASE', ('job', 'uint')),
+    ('ASSIGNED_URL_QUOTA', ('job', 'int')),
+    ('REQUEST_UPLOAD_PERMISSION', ('job', 'str', 'uint')),
+    ('UPLOAD_PERMISSION_GRANTED', ('job', 'str')),
+    ('UPLOAD_PERMISSION_DENIED', ('job', 'str')),
+    ('REQUEST_UPLOAD_REVOKE', ('job', 'str')),
+    ('WARC_FILE', ('str', 'bytes', 'job')),
+    ('WARC_FILE_RECEIVED', ('job', 'str')),
+    ('JOB_URL_BATCH', ('job', '*urlconfig')),
+    ('JOB_URL_BACKUP_BATCH', ('job', 'listener', '*urlconfig')),
+    ('JOB_URL_CRAWL_BATCH', ('job', '*urlconfig')),
+    ('JOB_URL_DISCOVERED_BATCH', ('job', '*urlconfig')),
+    ('JOB_URL_FINISHED_BATCH', ('job', 'listener', '*str')),
+    ('WARC_FILE_OFFER', ('job', 'str', 'uint', 'str')),
+    ('WARC_FILE_RESUME', ('job', 'str', 'uint')),
+    ('WARC_FILE_DATA', ('job', 'str', 'uint', 'uint')),
+    ('WARC_FILE_DENIED', ('job', 'str')),
+    ('STAGER_LISTENER', ('listener',)),
+)
+"""The schema of the commands for :class:`BinaryCodec`.
+
+The opcode of a command is its position in this tuple, new commands should
+only be appended. A type starting with ``*`` can only be the last field and
+is repeated zero or more times.
+"""
+
+STREAM_COMMANDS = frozenset(['WARC_FILE_DATA'])
+"""The commands followed by raw bytes, the number of raw bytes is the last
+field of the command."""
+
+
+class BinaryCodec:
+    """Encodes messages into a compact binary format.
+
+    A payload is the codec identifier, the opcode of the command and the
+    fields of the command according to the schema in ``COMMANDS``. Integers
+    and lengths are encoded as variable length integers.
+    """
+    identifier = 1
+
+    def __init__(self, commands=COMMANDS):
+        """Inits the codec.
+
+        Args:
+            commands (tuple, optional): The schema of the commands. Default is
+                ``COMMANDS``.
+        """
+        self._encoders = {}
+        self._decoders = []
+        for opcode, (command, fields) in enumerate(commands):
+            rest = None
+            if len(fields) > 0 and fields[-1].startswith('*'):
+                rest = TYPES[fields[-1][1:]]
+                fields = fields[:-1]
+            fields = [TYPES[t] for t in fields]
+            self._encoders[command] = (
+                opcode, [t[0] for t in fields], rest and rest[0]
+            )
+            self._decoders.append(
+                (command, [t[1] for t in fields], rest and rest[1])
+            )
+
+    def encode(self, message, interner):
+        """Encodes a message.
+
+        Args:
+            message (tuple): The message to encode, the first item is the
+                command.
+            interner (:obj:`Interner`): The interner for job identifiers.
+
+        Returns:
+            tuple of (bytes, dict): The payload and a dict with the interned
+                job identifiers used in the payload like::
+
+                    {<number>: <job identifier>}
+
+        Raises:
+            CodecError: If the message does not match the schema.
+        """
+        if message[0] not in self._encoders:
+            raise CodecError('Unknown command {}.'.format(message[0]))
+        opcode, fields, rest = self._encoders[message[0]]
+        values = message[1:]
+        if len(values) < len(fields) \
+                or (rest is None and len(values) != len(fields)):
+            raise CodecError('Wrong number of fields for {}.'.format(message))
+        out = bytearray((self.identifier,))
+        _encode_uint(out, opcode)
+        used = {}
+        try:
+            for encoder, value in zip(fields, values):
+                encoder(out, value, interner, used)
+            if rest is not None:
+                _encode_uint(out, len(values) - len(fields))
+                for value in values[len(fields):]:
+                    rest(out, value, interner, used)
+        except (AttributeError, IndexError, TypeError) as error:
+            raise CodecError('Could not encode {}: {}.'
+                             .format(message, error)) from error
+        return bytes(out), used
+
+    def decode(self, data, interned):
+        """Decodes a payload.
+
+        An ``INTERN`` message is used to define a number for a job identifier
+        in ``interned`` and is not returned.
+
+        Args:
+            data (bytes-like): The payload.
+            interned (dict): The interned job identifiers received on the
+                connection like::
+
+                    {<number>: <job identifier>}
+
+        Returns:
+            tuple: The decoded message.
+            NoneType: If the message was an ``INTERN`` message.
+
+        Raises:
+            CodecError: If the payload is not valid.
+        """
+        data = bytes(data)
+        try:
+            opcode, pos = _decode_uint(data, 1)
+            if opcode >= len(self._decoders):
+                raise CodecError('Unknown opcode {}.'.format(opcode))
+            command, fields, rest = self._decoders[opcode]
+            message = [command]
+            for decoder in fields:
+                value, pos = decoder(data, pos, interned)
+                message.append(value)
+            if rest is not None:
+                length, pos = _decode_uint(data, pos)
+                for i in range(length):
+                    value, pos = rest(data, pos, interned)
+                    message.append(value)
+        except (IndexError, UnicodeDecodeError) as error:
+            raise CodecError('Invalid payload: {}.'.format(error)) from error
+        if pos != len(data):
+            raise CodecError('Trailing data after {}.'.format(command))
+        if command == 'INTERN':
+            interned[message[1]] = message[2]
+            return None
+        return tuple(message)
+
+
+CODECS = {codec.identifier: codec for codec in (PickleCodec(), BinaryCodec())}
+"""The available codecs by identifier."""
+
+BASE_CODEC = BinaryCodec.identifier
+"""The codec used on a connection before a codec is negotiated."""
+
+
+def encode(codec, message, interner):
+    """Encodes a message into a frame.
+
+    The frame does not depend on the connection it is send over, so the same
+    frame can be send to multiple servers using the same codec.
+
+    Args:
+        codec (:obj:`BinaryCodec` or :obj:`PickleCodec`): The codec to use.
+        message (tuple): The message to encode.
+        interner (:obj:`Interner`): The interner for job identifiers.
+
+    Returns:
+        tuple of (bytes, dict): The frame, which is the header and the
+            payload, and the interned job identifiers used in the frame.
+    """
+    payload, used = codec.encode(message, interner)
+    return HEADER.pack(len(payload)) + payload, used
+
+
+def encode_interned(codec, used, interner, defined):
+    """Encodes the definitions of interned job identifiers into frames.
+
+    Only frames for job identifiers that are not yet defined on the
+    connection are created.
+
+    Args:
+        codec (:obj:`BinaryCodec` or :obj:`PickleCodec`): The codec to use.
+        used (dict): The interned job identifiers used by a frame.
+        interner (:obj:`Interner`): The interner for job identifiers.
+        defined (set): The numbers of the job identifiers that are defined on
+            the connection. New definitions are added to it.
+
+    Returns:
+        list of bytes: The frames with ``INTERN`` messages.
+    """
+    frames = []
+    for index, identifier in used.items():
+        if index not in defined:
+            frames.append(encode(codec, ('INTERN', index, identifier),
+                                 interner)[0])
+            defined.add(index)
+    return frames
+
+
+def decode(data, interned, accepted):
+    """Decodes a payload with the codec it was encoded with.
+
+    Args:
+        data (bytes-like): The payload.
+        interned (dict): The interned job identifiers received on the
+            connection.
+        accepted (set of int): The identifiers of the codecs that are
+            accepted.
+
+    Returns:
+        tuple: The decoded message.
+        NoneType: If the payload only defined an interned job identifier.
+
+    Raises:
+        CodecError: If the codec of the payload is not accepted or the payload
+            is not valid.
+    """
+    if len(data) == 0:
+        raise CodecError('Empty payload.')
+    if data[0] not in accepted:
+        raise CodecError('Codec {} is not accepted.'.format(data[0]))
+    return CODECS[data[0]].decode(data, interned)
@@ -0,0 +1,94 @@
+"""Benchmark for codec.py.
+
+Compares the binary codec with the original encoding of messages with
+:mod:`pickle` and a native-endian length header.
+"""
+import pickle
+import struct
+import timeit
+
+from webarchiver.job.settings import JobSettings
+from webarchiver.server import codec
+from webarchiver.url import UrlConfig
+
+IDENTIFIER = 'example_abcd1234'
+
+
+def messages():
+    """Creates the messages to benchmark.
+
+    Returns:
+        dict: The name of each message with the message.
+    """
+    settings = JobSettings.__new__(JobSettings)
+    settings.identifier = IDENTIFIER
+    settings.config = {'url': 'https://example.com/', 'rate': '4',
+                       'allow regex': r'https?://(?:www)?example\.com/'}
+    settings.allow_regex = (r'https?://(?:www)?example\.com/',)
+    settings.ignore_regex = (r'https?://[^/]+\.nl',)
+    settings.rate = 4
+    settings.depth = 3
+    settings.urls = tuple('https://example.com/page{}'.format(i)
+                          for i in range(1000))
+    settings._raw_config = b'[example]\nurl = https://example.com/\n'
+    settings._raw_responses = {}
+    settings._raw_files = {}
+    urlconfig = UrlConfig(IDENTIFIER, 'https://example.com/some/page.html',
+                          2, 'https://example.com/some/')
+    return {
+        'PING': ('PING',),
+        'JOB_URL': ('JOB_URL', urlconfig),
+        'JOB_URL_FINISHED': ('JOB_URL_FINISHED', IDENTIFIER, urlconfig.url,
+                             ('stager.example.com', 51234)),
+        'NEW_JOB_CRAWL': ('NEW_JOB_CRAWL', settings),
+    }
+
+
+def pickle_encode(message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    return struct.pack('L', len(payload)) + payload
+
+
+def pickle_decode(frame):
+    return pickle.loads(memoryview(frame)[8:])
+
+
+def binary_encode(message, interner):
+    return codec.encode(codec.CODECS[codec.BinaryCodec.identifier], message,
+                        interner)[0]
+
+
+def binary_decode(frame, interned):
+    return codec.decode(memoryview(frame)[codec.HEADER.size:], interned,
+                        {codec.BinaryCodec.identifier})
+
+
+def measure(function, number):
+    """Measures the time in microseconds to run a function once."""
+    return min(timeit.repeat(function, number=number, repeat=5)) \
+        / number * 1e6
+
+
+def main():
+    """Runs the benchmark and prints the results."""
+    print('{:<20}{:>10}{:>10}{:>12}{:>12}{:>12}{:>12}'.format(
+        'message', 'pickle B', 'binary B', 'pickle enc', 'binary enc',
+        'pickle dec', 'binary dec'))
+    for name, message in messages().items():
+        number = 100 if name == 'NEW_JOB_CRAWL' else 20000
+        interner = codec.Interner()
+        interned = {interner.index(IDENTIFIER): IDENTIFIER}
+        pickle_frame = pickle_encode(message)
+        binary_frame = binary_encode(message, interner)
+        print('{:<20}{:>10}{:>10}{:>10.2f}us{:>10.2f}us{:>10.2f}us{:>10.2f}us'
+              .format(
+                  name, len(pickle_frame), len(binary_frame),
+                  measure(lambda: pickle_encode(message), number),
+                  measure(lambda: binary_encode(message, interner), number),
+                  measure(lambda: pickle_decode(pickle_frame), number),
+                  measure(lambda: binary_decode(binary_frame, interned),
+                          number)
+              ))
+
+if __name__ == '__main__':
+    main()
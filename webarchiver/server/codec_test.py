@@ -0,0 +1,140 @@
+"""Tests for codec.py."""
+import unittest
+
+from webarchiver.job.settings import JobSettings
+from webarchiver.server import codec
+from webarchiver.url import UrlConfig
+
+
+def roundtrip(message, codec_identifier=codec.BinaryCodec.identifier):
+    """Encodes a message into frames and decodes the frames again.
+
+    Args:
+        message (tuple): The message to encode.
+        codec_identifier (int, optional): The identifier of the codec to use.
+            Default is the identifier of the binary codec.
+
+    Returns:
+        list: The decoded messages.
+    """
+    interner = codec.Interner()
+    interned = {}
+    messages = []
+    frame, used = codec.encode(codec.CODECS[codec_identifier], message,
+                               interner)
+    intern_frames = codec.encode_interned(codec.CODECS[codec_identifier],
+                                          used, interner, set())
+    for frame in intern_frames + [frame]:
+        length = codec.HEADER.unpack_from(frame)[0]
+        payload = memoryview(frame)[codec.HEADER.size:]
+        assert len(payload) == length
+        decoded = codec.decode(payload, interned, {codec_identifier})
+        if decoded is not None:
+            messages.append(decoded)
+    return messages
+
+
+class TestBinaryCodec(unittest.TestCase):
+    """Tests for the binary codec."""
+
+    def test_no_fields(self):
+        self.assertListEqual(roundtrip(('PING',)), [('PING',)])
+
+    def test_variable_fields(self):
+        message = ('REQUEST_STAGER', 2, ('a.example.com', 3000),
+                   ('b.example.com', 65535))
+        self.assertListEqual(roundtrip(message), [message])
+        self.assertListEqual(roundtrip(('REQUEST_STAGER', 2)),
+                             [('REQUEST_STAGER', 2)])
+
+    def test_signed_integers(self):
+        for i in (0, 1, -1, 300, -300, 2**80):
+            self.assertListEqual(roundtrip(('CONFIRMED', i)),
+                                 [('CONFIRMED', i)])
+
+    def test_interned_job(self):
+        interner = codec.Interner()
+        defined = set()
+        frame, used = codec.encode(codec.CODECS[1], ('JOB_START', 'job_1'),
+                                   interner)
+        self.assertEqual(len(codec.encode_interned(codec.CODECS[1], used,
+                                                   interner, defined)), 1)
+        self.assertEqual(len(codec.encode_interned(codec.CODECS[1], used,
+                                                   interner, defined)), 0)
+
+    def test_undefined_job(self):
+        frame, used = codec.encode(codec.CODECS[1], ('JOB_START', 'job_1'),
+                                   codec.Interner())
+        with self.assertRaises(codec.CodecError):
+            codec.decode(frame[codec.HEADER.size:], {}, {1})
+
+    def test_urlconfig(self):
+        for parent_url in (None, '', 'https://example.com/'):
+            urlconfig = UrlConfig('job_1', 'https://example.com/a', 2,
+                                  parent_url)
+            message = roundtrip(('JOB_URL_CRAWL', urlconfig))[0]
+            self.assertEqual(message[1].job_identifier, 'job_1')
+            self.assertEqual(message[1].url, urlconfig.url)
+            self.assertEqual(message[1].depth, 2)
+            self.assertEqual(message[1].parent_url, parent_url)
+
+    def test_settings(self):
+        settings = JobSettings.__new__(JobSettings)
+        settings.identifier = 'job_1'
+        settings.config = {'url': 'https://example.com/\nhttps://a.com/'}
+        settings.allow_regex = ('https?://example\\.com/',)
+        settings.ignore_regex = ()
+        settings.rate = 4
+        settings.depth = 2**63 - 1
+        settings.urls = ('https://example.com/', 'https://a.com/')
+        settings._raw_config = b'[job]'
+        decoded = roundtrip(('NEW_JOB', settings))[0][1]
+        for attribute in ('identifier', 'config', 'allow_regex',
+                          'ignore_regex', 'rate', 'depth', 'urls',
+                          '_raw_config'):
+            self.assertEqual(getattr(decoded, attribute),
+                             getattr(settings, attribute))
+
+    def test_batch(self):
+        urlconfigs = [UrlConfig('job_1', 'https://example.com/{}'.format(i), 1,
+                                None) for i in range(3)]
+        message = roundtrip(('JOB_URL_BACKUP_BATCH', 'job_1', ('a', 3000))
+                            + tuple(urlconfigs))[0]
+        self.assertEqual(message[:3], ('JOB_URL_BACKUP_BATCH', 'job_1',
+                                       ('a', 3000)))
+        self.assertListEqual([u.url for u in message[3:]],
+                             [u.url for u in urlconfigs])
+        message = ('JOB_URL_FINISHED_BATCH', 'job_1', ('a', 3000),
+                   'https://example.com/0', 'https://example.com/1')
+        self.assertListEqual(roundtrip(message), [message])
+
+    def test_unknown_command(self):
+        with self.assertRaises(codec.CodecError):
+            roundtrip(('NOT_A_COMMAND',))
+
+    def test_wrong_number_of_fields(self):
+        with self.assertRaises(codec.CodecError):
+            roundtrip(('JOB_START',))
+        with self.assertRaises(codec.CodecError):
+            roundtrip(('PING', 1))
+
+    def test_truncated_payload(self):
+        frame = codec.encode(codec.CODECS[1], ('STAGER_NEW', ('a', 3000)),
+                             codec.Interner())[0]
+        with self.assertRaises(codec.CodecError):
+            codec.decode(frame[codec.HEADER.size:-1], {}, {1})
+
+
+class TestDecode(unittest.TestCase):
+    """Tests for decoding payloads of different codecs."""
+
+    def test_pickle(self):
+        message = ('JOB_URL_FINISHED', 'job_1', 'https://example.com/',
+                   ('a', 3000))
+        self.assertListEqual(roundtrip(message, 0), [message])
+
+    def test_not_accepted(self):
+        frame = codec.encode(codec.CODECS[0], ('PING',),
+                             codec.Interner())[0]
+        with self.assertRaises(codec.CodecError):
+            codec.decode(frame[codec.HEADER.size:], {}, {1})
@@ -7,10 +7,14 @@ import time
 
 from webarchiver.config import *
 from webarchiver.database import UrlDeduplicationDatabase
+from webarchiver.extractor.registry import registry
+from webarchiver.handoff import HandoffQueue
+from webarchiver.job.executor import CrawlExecutor
 from webarchiver.server.base import BaseServer, Node
 from webarchiver.server.job import CrawlerServerJob
 from webarchiver.server.node import CrawlerNode
-from webarchiver.set import LockedSet
+from webarchiver.server.transfer import file_digest
+from webarchiver.url import group_by_job
 from webarchiver.utils import check_time, key_lowest_value, sample
 
 logger = logging.getLogger(__name__)
@@ -35,41 +39,53 @@ class CrawlerServer(BaseServer):
         self.add_stager((stager_host, stager_port))
         self._jobs = {}
         self._upload_permissions = UploadPermissions()
-        self._filenames_set = LockedSet()
-        self._finished_urls_set = LockedSet()
-        self._found_urls_set = LockedSet()
+        self._filenames = set()
+        self._executor = CrawlExecutor()
         self._last_upload_request = 0
-        self._last_url_quota = 0
-        self._last_finish_check = 0
+        self._add_tasks()
+        self._filenames_queue = HandoffQueue(
+            notify=functools.partial(self.wake, self._upload_task)
+        )
+        self._finished_urls_queue = HandoffQueue(
+            notify=functools.partial(self.wake, self._finish_urls_task)
+        )
+        self._found_urls_queue = HandoffQueue(
+            notify=functools.partial(self.wake, self._found_urls_task)
+        )
         logger.info('Created crawler server.')
 
-    def _run_round(self):
-        """Runs the base server loop and functions specific for this server.
-
-        The :func:`webarchiver.server.base.BaseServer._run_round` function is
-        run, together with a function to request new stager servers, ping
-        upload WARC files, process finished and discovered URLs and request URL
-        quotas from a stager server.
-        """
-        super()._run_round()
-        self.request_stager()
-        self.ping()
-        self.upload()
-        self.finish_urls()
-        self.found_urls()
-        self.request_url_quota()
-        self.finish_jobs()
+    def _add_tasks(self):
+        """Adds the tasks of the server to the scheduler.
+
+        The server requests new stager servers, pings, requests URL quotas
+        from a stager server, checks for finished jobs and reports the
+        utilization of the crawl executor every interval. WARC files are
+        uploaded every ``REQUEST_UPLOAD_TIME`` seconds. The counters of the
+        extractors are reported with the crawl executor. Uploading and
+        reporting finished and discovered URLs is also woken when a crawl adds
+        to their queues.
+        """
+        add = self._scheduler.add
+        add(self.request_stager, interval=REQUEST_STAGER_TIME)
+        add(self.ping, interval=PING_TIME)
+        self._upload_task = add(self.upload, interval=REQUEST_UPLOAD_TIME)
+        self._finish_urls_task = add(self.finish_urls)
+        self._found_urls_task = add(self.found_urls)
+        add(self.request_url_quota, interval=URL_QUOTA_TIME)
+        add(self.finish_jobs, interval=FINISH_CHECK_TIME)
+        add(self._executor.report, interval=CRAWL_REPORT_TIME)
+        add(registry.report, interval=CRAWL_REPORT_TIME)
 
     def _create_socket(self, address):
         """Creates and connects a :class:`webarchiver.server.base.Node` and
-        adds this to the write queue.
+        registers it with the selector.
 
         Args:
             address (tuple): A tuple (host, port) to connect to.
         """
         logger.debug('Creating connection with listener %s.', address)
         s = self._connect_socket(address)
-        self._write_queue[s] = []
+        self._add_node(s)
         return s
 
     def add_stager(self, listener, extra=False, s=None):
@@ -77,10 +93,10 @@ class CrawlerServer(BaseServer):
 
         Creates or uses a connected :class:`webarchiver.server.base.Node` of a
         stager that the crawler server is not yet connected to. The new stager
-        is added to the read list and the message is send to the stager
+        is registered with the selector and the message is send to the stager
         server::
 
-            ANNOUNCE_CRAWLER <own listener>
+            ANNOUNCE_CRAWLER <own listener> <offered codecs>
 
         In case this is not the first stager server ``ANNOUNCE_CRAWLER_EXTRA``
         is used instead of ``ANNOUNCE_CRAWLER``.
@@ -104,29 +120,28 @@ class CrawlerServer(BaseServer):
                 logger.warning('Stager %s already added.', listener)
                 return None
         s_ = self._create_socket(listener) if not s else s
-        self._read_list.append(s_)
+        self._add_node(s_)
         self._stager[s_] = CrawlerNode()
         self._write_socket_message(s_, 'ANNOUNCE_CRAWLER' \
                                    + ('_EXTRA' if extra else ''),
-                                   self._address)
+                                   self._address, *WIRE_CODECS)
         return True
 
     def request_stager(self):
         """Requests new stager server to connect to.
 
-        The new stager server are needed and the last request was long enough
-        ago a request is made to a random stager server to send a certain
-        number of stager server the crawler server is not connected to::
+        If new stager servers are needed, a request is made every
+        ``REQUEST_STAGER_TIME`` seconds to a random stager server to send a
+        certain number of stager server the crawler server is not connected
+        to::
 
             REQUEST_STAGER <number stagers needed> <listeners of connected
                 stager servers>
         """
-        if self.stager_needed > 0 and check_time(self._last_stager_request,
-                                                  REQUEST_STAGER_TIME):
+        if self.stager_needed > 0:
             self._write_socket_message(sample(self._stager, 1),
                                        'REQUEST_STAGER', self.stager_needed,
                                        *[s.listener for s in self._stager])
-            self._last_stager_request = time.time()
 
     def ping(self):
         """Pings all stager servers.
@@ -138,11 +153,9 @@ class CrawlerServer(BaseServer):
         When the message is send the servers are set not having replied with a
         pong.
         """
-        if check_time(self._last_ping, PING_TIME):
-            for s in self._stager:
-                self._stager[s].pong = False
-            self._write_socket_message(self._stager, 'PING')
-            self._last_ping = time.time()
+        for s in self._stager:
+            self._stager[s].pong = False
+        self._write_socket_message(self._stager, 'PING')
 
   #  def request_upload(self):
   #      if check_time(self._last_upload_request, config.REQUEST_UPLOAD_TIME):
@@ -169,39 +182,45 @@ class CrawlerServer(BaseServer):
         If no server responded to the request in time, the request is reset.
         Both requested and received data is saved in a :class:`WarcFile`
         object.
+
+        The WARC files written by crawls are taken from their queue first.
+        They are reported done when the stager server received them.
         """
-        if len(self._filenames_set) == 0:
+        self._filenames.update(self._filenames_queue.drain())
+        if len(self._filenames) == 0:
             return None
         logger.debug('Uploading WARC files.')
-        with self._filenames_set.lock:
-            for job, path in self._filenames_set:
-                warc_file = self._upload_permissions[path]
-                if not warc_file.requested:
-                    self._write_socket_message(self._jobs[job].stagers,
-                                               'REQUEST_UPLOAD_PERMISSION',
-                                               job, path, warc_file.filesize)
-                    warc_file.requested = True
-                    continue
-                if warc_file.chosen is False:
-                    logger.debug('Resetting requests for WARC file %s for not'
-                                  ' chosing server in time.', warc_file)
-                    del self._upload_permissions[path]
-                elif warc_file.chosen is not None and not warc_file.revoked:
-                    self._write_socket_message(warc_file.to_revoke,
-                                               'REQUEST_UPLOAD_REVOKE', job,
-                                               path)
-                    warc_file.revoked = True
-                    self.upload_warc(warc_file.chosen, job, path)
+        for job, path in self._filenames:
+            warc_file = self._upload_permissions[path]
+            if not warc_file.requested:
+                self._write_socket_message(self._jobs[job].stagers,
+                                           'REQUEST_UPLOAD_PERMISSION',
+                                           job, path, warc_file.filesize)
+                warc_file.requested = True
+                continue
+            if warc_file.chosen is False:
+                logger.debug('Resetting requests for WARC file %s for not'
+                              ' chosing server in time.', warc_file)
+                del self._upload_permissions[path]
+            elif warc_file.chosen is not None and not warc_file.revoked:
+                self._write_socket_message(warc_file.to_revoke,
+                                           'REQUEST_UPLOAD_REVOKE', job,
+                                           path)
+                warc_file.revoked = True
+                self.upload_warc(warc_file.chosen, job, path)
 
     def upload_warc(self, s, job, path):
         """Uploads a WARC file.
 
         A temporary file for the path with extension ``.uploading`` is created
         to show the file is being uploaded. If this ``.uploading`` file
-        already exists, the file is not uploaded. The file is uploaded using
-        the :func:`_write_socket_file` function::
+        already exists, the file is not uploaded. The file is offered to the
+        stager server with its size and digest::
 
-            WARC_FILE <path> <file> <job identifier>
+            WARC_FILE_OFFER <job identifier> <path> <filesize>
+                <SHA-256 digest>
+
+        The stager server answers with the offset to start uploading from.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The
@@ -212,113 +231,141 @@ class CrawlerServer(BaseServer):
         if os.path.isfile(path + '.uploading'):
             return False
         open(path + '.uploading', 'w').close()
-        self._write_socket_file(s, path, 'WARC_FILE', job)
-        return True #TODO confirmation?
+        self._write_socket_message(s, 'WARC_FILE_OFFER', job, path,
+                                   os.path.getsize(path), file_digest(path))
+        return True
+
+    def _stream_aborted(self, s, sender):
+        """Resets the upload of a WARC file that could not be send.
+
+        The upload permissions for the WARC file are requested again, after
+        which the upload resumes from the bytes already received.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server the
+                WARC file was send to.
+            sender (:obj:`webarchiver.server.transfer.FileSender`): The
+                sender of the WARC file.
+        """
+        logger.info('Upload of WARC file %s to %s aborted.', sender.path, s)
+        self._reset_upload(sender.path)
+
+    def _reset_upload(self, path):
+        """Resets the upload of a WARC file.
+
+        The ``.uploading`` file and the upload permissions are removed, so
+        :func:`upload` requests permission to upload the WARC file again.
+
+        Args:
+            path (str): The path to the WARC file.
+        """
+        if os.path.isfile(path + '.uploading'):
+            os.remove(path + '.uploading')
+        self._upload_permissions.pop(path, None)
 
     def finish_urls(self):
         """Confirms to the stager server which URLs finished.
 
         After a crawl finishes the finished URLs are added to a set of
-        finished URLs. Each finished URL is send to all stager server connected
-        to the job::
+        finished URLs. The finished URLs are batched per stager server that
+        queued them and send to all stager server connected to the job::
 
-            JOB_URL_FINISHED <job_identifier> <URL> <listener that queued URL>
+            JOB_URL_FINISHED_BATCH <job_identifier> <listener that queued URL>
+                <URL> ...
 
-        The URLs are in the finished URLs set as
-        :class:`webarchiver.url.UrlConfig` objects. After being send an URL is
-        deleted from the job and from the set of finished URLs.
+        The URLs are taken from the queue of finished URLs as
+        :class:`webarchiver.url.UrlConfig` objects. The finished URLs of a job
+        are added to the database of the job at once. After being send an URL
+        is deleted from the job.
         """
-        if len(self._finished_urls_set) == 0:
+        drained = self._finished_urls_queue.drain()
+        if len(drained) == 0:
             return None
-        finished = set()
         logger.debug('Reporting finished URLs.')
-        with self._finished_urls_set.lock:
-            for urlconfig in self._finished_urls_set:
-                print(self._jobs)
-                identifier = urlconfig.job_identifier
-                job = self._jobs[identifier]
-                job.finished_url(urlconfig)
-                self._write_socket_message(job.stagers, 'JOB_URL_FINISHED',
-                                           urlconfig.job_identifier,
-                                           urlconfig.url,
-                                           job.get_url_stager(urlconfig) \
-                                               .listener)
-                finished.add(urlconfig)
-                job.delete_url_stager(urlconfig)
-                print(self._jobs)
-            self._finished_urls_set.difference_update(finished)
+        finished = set(drained)
+        for identifier, urlconfigs in group_by_job(finished).items():
+            self._jobs[identifier].finished_urls(urlconfigs)
+        for urlconfig in finished:
+            identifier = urlconfig.job_identifier
+            job = self._jobs[identifier]
+            self._write_socket_batch(job.stagers,
+                                     'JOB_URL_FINISHED_BATCH',
+                                     (identifier,
+                                      job.get_url_stager(urlconfig)
+                                          .listener),
+                                     urlconfig.url)
+            job.delete_url_stager(urlconfig)
+        self._finished_urls_queue.done(len(drained))
 
     def found_urls(self):
         """Reports discovered URLs to the stager servers.
 
-        The URLs discovered in a crawl are added to a found URLs set. They
-        are in :class:`webarchiver.url.UrlConfig` objects. Each URL is send to
-        a randomly chosen stager server connected to the job the URL was
+        The URLs discovered in a crawl are added to a found URLs queue. They
+        are in :class:`webarchiver.url.UrlConfig` objects. Each URL is batched
+        for a randomly chosen stager server connected to the job the URL was
         discovered in::
 
-            JOB_URL_DISCOVERED :obj:`webarchiver.url.UrlConfig`
+            JOB_URL_DISCOVERED_BATCH <job identifier>
+                :obj:`webarchiver.url.UrlConfig` ...
 
-        Send URLs are removed from the set.
+        The URLs of a job are checked for being allowed and archived at once.
         """
-        if len(self._found_urls_set) == 0:
+        drained = self._found_urls_queue.drain()
+        if len(drained) == 0:
             return None
-        finished = set()
-        logger.debug('Reporting finished URLs.')
-        with self._found_urls_set.lock:
-            for urlconfig in self._found_urls_set:
-                finished.add(urlconfig)
-                identifier = urlconfig.job_identifier
-                if self._jobs[identifier].archived_url(urlconfig):
+        logger.debug('Reporting discovered URLs.')
+        for identifier, urlconfigs in group_by_job(set(drained)).items():
+            job = self._jobs[identifier]
+            urlconfigs = job.allowed_urls(urlconfigs)
+            archived = job.archived_urls(urlconfigs)
+            for urlconfig in urlconfigs:
+                if urlconfig.url in archived:
                     continue
-                print(urlconfig.url, urlconfig.parent_url, urlconfig.depth)
-                if not self._jobs[identifier].allowed_url(urlconfig):
-                    continue
-                print('passed', urlconfig.url, urlconfig.parent_url,
-                      urlconfig.depth)
-                stager = sample(self._jobs[identifier].stagers, 1)[0]
-                self._write_socket_message(stager, 'JOB_URL_DISCOVERED',
-                                           urlconfig)
-            self._found_urls_set.difference_update(finished)
+                stager = sample(job.stagers, 1)[0]
+                self._write_socket_batch(stager,
+                                         'JOB_URL_DISCOVERED_BATCH',
+                                         (identifier,), urlconfig)
+        self._found_urls_queue.done(len(drained))
 
     def finish_jobs(self):
         """Checks running jobs for being finished.
 
+        Every ``FINISH_CHECK_TIME`` seconds, the batched messages are send.
         If a job is finished on this crawler server, this is reported to the
         stager servers connected to the crawler server that are running the
         job::
 
             CRAWLER_JOB_FINISHED <job identifier>
 
+        The filter of archived URLs of a finished job is saved.
+
         Note:
             A finished job means that the job currently is not active. It can
             become active again if new URLs are send to it.
         """
-        if not check_time(self._last_finish_check, FINISH_CHECK_TIME):
-            return None
+        self._flush_batches(force=True)
         for identifier, job in self._jobs.items():
             if job.finished:
+                job.save()
                 self._write_socket_message(job.stagers, 'CRAWLER_JOB_FINISHED',
                                            identifier)
-        self._last_finish_check = time.time()
 
     def request_url_quota(self):
         """Requests a quotum for URLs to crawl for a job.
 
-        After `URL_QUOTA_TIME` seconds a random stager connected to a running
+        Every `URL_QUOTA_TIME` seconds a random stager connected to a running
         job is asked for an URL quota for URLs to be crawled::
 
             REQUEST_URL_QUOTA <job identifier>
         """
-        if check_time(self._last_url_quota, URL_QUOTA_TIME):
-            self._last_url_quota = time.time()
-            if len(self._jobs) == 0:
-                return None
-            job = key_lowest_value({
-                job: self._jobs[job].received_url_quota
-                for job in self._jobs
-            })
-            self._write_socket_message(sample(self._jobs[job].stagers, 1)[0],
-                                       'REQUEST_URL_QUOTA', job)
+        if len(self._jobs) == 0:
+            return None
+        job = key_lowest_value({
+            job: self._jobs[job].received_url_quota
+            for job in self._jobs
+        })
+        self._write_socket_message(sample(self._jobs[job].stagers, 1)[0],
+                                   'REQUEST_URL_QUOTA', job)
 
     def create_job(self, settings):
         """Creates a new job.
@@ -343,8 +390,9 @@ class CrawlerServer(BaseServer):
             logger.warning('Job %s already created.', settings)
             return None
         self._jobs[settings.identifier] = \
-            CrawlerServerJob(settings, self._filenames_set,
-                             self._finished_urls_set, self._found_urls_set)
+            CrawlerServerJob(settings, self._filenames_queue,
+                             self._finished_urls_queue,
+                             self._found_urls_queue, self._executor)
 
     def start_job(self, identifier):
         """Starts a job.
@@ -422,7 +470,6 @@ class CrawlerServer(BaseServer):
             self._stager[s].pong = True
         else:
             logger.info('Pong was send from %s without initial ping.', s)
-            self.ping()
 
     def _command_confirmed(self, s, message):
         """Processes the ``CONFIRMED`` command.
@@ -431,14 +478,19 @@ class CrawlerServer(BaseServer):
 
             CONFIRMED 1
 
+        If the stager server chose a codec, it is used for the next messages
+        to the stager server.
+
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
                 queued the command.
             message (list): The command that was received::
 
-                    CONFIRMED <confirmed state>
+                    CONFIRMED <confirmed state> <chosen codec>
         """
         self._stager[s].confirmed = True
+        if len(message) > 2:
+            self._set_codec(s, message[2])
         if message[1] == 0:
             self._write_socket_message(s, 'CONFIRMED', 1)
 
@@ -491,6 +543,23 @@ class CrawlerServer(BaseServer):
         """
         self.job_add_url(s, message[1])
 
+    def _command_job_url_crawl_batch(self, s, message):
+        """Processes the ``JOB_URL_CRAWL_BATCH`` command.
+
+        Adds every :class:`webarchiver.url.UrlConfig` object in the batch to a
+        job.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    JOB_URL_CRAWL_BATCH <job identifier>
+                        :obj:`webarchiver.url.UrlConfig` ...
+        """
+        for urlconfig in message[2:]:
+            self.job_add_url(s, urlconfig)
+
     def _command_job_start_crawl(self, s, message):
         """Processes the ``JOB_START_CRAWL`` command.
 
@@ -511,6 +580,45 @@ class CrawlerServer(BaseServer):
 #    def _command_upload_requested(self, s, message):
 #        self._jobs[s]['upload'] = eval(message[2]) #FIXME
 
+    def _command_warc_file_resume(self, s, message):
+        """Processes the ``WARC_FILE_RESUME`` command.
+
+        The stager server accepted an offered WARC file. The WARC file is
+        streamed from the requested offset with :func:`_write_socket_file`::
+
+            WARC_FILE_DATA <job identifier> <path> <offset> <length>
+                <raw bytes>
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    WARC_FILE_RESUME <job identifier> <path> <offset>
+        """
+        if message[2] not in self._upload_permissions:
+            return None
+        logger.debug('Uploading WARC file %s from offset %d.', message[2],
+                     message[3])
+        self._write_socket_file(s, message[2], message[3], 'WARC_FILE_DATA',
+                                *message[1:4])
+
+    def _command_warc_file_denied(self, s, message):
+        """Processes the ``WARC_FILE_DENIED`` command.
+
+        The stager server did not accept the offered WARC file or its bytes.
+        The upload is reset, see :func:`_reset_upload`.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    WARC_FILE_DENIED <job identifier> <path to WARC file>
+        """
+        logger.info('Upload of WARC file %s to %s denied.', message[2], s)
+        self._reset_upload(message[2])
+
     def _command_warc_file_received(self, s, message):
         """Processes the ``WARC_FILE_RECEIVED`` command.
 
@@ -525,7 +633,8 @@ class CrawlerServer(BaseServer):
                     WARC_FILE_RECEIVED <job identifier> <path to WARC file>
         """
         logger.debug('Removing WARC file %s.', message[2])
-        self._filenames_set.remove((message[1], message[2]))
+        self._filenames.remove((message[1], message[2]))
+        self._filenames_queue.done()
         del self._upload_permissions[message[2]]
         os.remove(message[2])
         os.remove(message[2] + '.uploading')
@@ -552,7 +661,8 @@ class CrawlerServer(BaseServer):
         """Processes the ``UPLOAD_PERMISSION_GRANTED`` command.
 
         The upload of a WARC file is permitted. Sets the upload permission for
-        the stager server for the WARC file.
+        the stager server for the WARC file. The upload is run again after
+        ``REQUEST_UPLOAD_TIME`` seconds to choose a stager server.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
@@ -565,6 +675,7 @@ class CrawlerServer(BaseServer):
         if not warc_file.requested:
             return False
         warc_file.granted(s)
+        self._scheduler.schedule(self._upload_task, REQUEST_UPLOAD_TIME)
 
     def _command_upload_permission_denied(self, s, message):
         """Processes the ``UPLOAD_PERMISSION_DENIED`` command.
@@ -744,4 +855,3 @@ class WarcFile:
     def __repr__(self):
         return '<{} at 0x{:x} WARC file={}>'.format(__name__, id(self),
                                                     self._path)
-
@@ -1,8 +1,8 @@
 """Configuration for a job on a crawler server."""
 import logging
-import re
 import time
 
+from webarchiver.bloom import BloomFilter
 from webarchiver.database import UrlDeduplicationDatabase
 from webarchiver.job import Job
 
@@ -26,34 +26,70 @@ class CrawlerServerJob:
             received.
     """
 
-    def __init__(self, settings, filenames_set, finished_urls_set,
-                 found_urls_set):
+    def __init__(self, settings, filenames_queue, finished_urls_queue,
+                 found_urls_queue, executor):
         """Inits the job for the crawler server.
 
         A crawling job is created for the actual crawl and the database is for
-        the URLs is started.
+        the URLs is started. A filter in front of the database is loaded, see
+        :func:`_load_url_filter`.
 
         Args:
             settings (:obj:`webarchiver.job.settings.JobSettings`): The
                 settings for the job.
-            filenames_set (set): The set to add the finished WARCs to.
-            finished_urls_set (set): The set to add the finished URLs to.
-            found_urls_set (set): The set to add the discovered URLs to.
+            filenames_queue (:obj:`webarchiver.handoff.HandoffQueue`): The
+                queue to add the finished WARCs to.
+            finished_urls_queue (:obj:`webarchiver.handoff.HandoffQueue`): The
+                queue to add the finished URLs to.
+            found_urls_queue (:obj:`webarchiver.handoff.HandoffQueue`): The
+                queue to add the discovered URLs to.
+            executor (:obj:`webarchiver.job.executor.CrawlExecutor`): The
+                executor to run the crawls on.
         """
         self.settings = settings
         self.stagers = []
         self.started = False
         self.received_url_quota = time.time()
-        self._filenames_set = filenames_set
-        self._finished_urls_set = finished_urls_set
-        self._found_urls_set = found_urls_set
-        self._job = Job(self.identifier, filenames_set, finished_urls_set,
-                        found_urls_set)
+        self._filenames_queue = filenames_queue
+        self._finished_urls_queue = finished_urls_queue
+        self._found_urls_queue = found_urls_queue
+        self._job = Job(self.identifier, filenames_queue, finished_urls_queue,
+                        found_urls_queue, executor)
         self._urls = {}
         self._url_database = UrlDeduplicationDatabase(self.identifier,
             'crawler_' + self.identifier)
+        self._url_filter = self._load_url_filter()
         logger.debug('Created crawler job %s.', self)
 
+    def _load_url_filter(self):
+        """Loads the filter of archived URLs.
+
+        The saved filter is used if it contains as many URLs as the database,
+        else the filter is rebuild from the URLs in the database.
+
+        Returns:
+            :obj:`webarchiver.bloom.BloomFilter`: The filter.
+        """
+        url_filter = BloomFilter.load(self.url_filter_path)
+        count = self._url_database.count()
+        if url_filter is None or url_filter.count != count:
+            logger.debug('Building URL filter for crawler job %s from %d '
+                         'URLs.', self, count)
+            url_filter = BloomFilter()
+            for url in self._url_database.urls():
+                url_filter.add(url)
+        return url_filter
+
+    def save(self):
+        """Saves the filter of archived URLs with the job.
+
+        The database is committed first, so the filter matches the database.
+        """
+        logger.debug('Saving URL filter for crawler job %s.', self)
+        self._url_database.commit()
+        self._url_filter.count = self._url_database.count()
+        self._url_filter.save(self.url_filter_path)
+
     def add_stager(self, s):
         """Adds a stager server to the project.
 
@@ -151,10 +187,13 @@ class CrawlerServerJob:
         """
         logger.debug('URL %s finished for crawler job %s.', urlconfig, self)
         self._url_database.insert(urlconfig)
+        self._url_filter.add(urlconfig.url)
 
     def archived_url(self, urlconfig):
         """Checks if an URL is already archived.
 
+        The database is only checked if the filter possibly contains the URL.
+
         Args:
             urlconfig (:obj:`webarchiver.url.UrlConfig`): The configuration
                 of the URL to be checked.
@@ -162,8 +201,40 @@ class CrawlerServerJob:
         Returns:
             bool: True if the URL is already archived, else False.
         """
+        if urlconfig.url not in self._url_filter:
+            return False
         return self._url_database.has_url(urlconfig.url)
 
+    def finished_urls(self, urlconfigs):
+        """Adds finished URLs to the database at once.
+
+        Args:
+            urlconfigs (list of :obj:`webarchiver.url.UrlConfig`): The
+                configurations of the finished URLs.
+        """
+        logger.debug('%d URLs finished for crawler job %s.', len(urlconfigs),
+                     self)
+        self._url_database.insert_many(urlconfigs)
+        for urlconfig in urlconfigs:
+            self._url_filter.add(urlconfig.url)
+
+    def archived_urls(self, urlconfigs):
+        """Checks which URLs are already archived at once.
+
+        Only the URLs the filter possibly contains are checked in the
+        database.
+
+        Args:
+            urlconfigs (list of :obj:`webarchiver.url.UrlConfig`): The
+                configurations of the URLs to be checked.
+
+        Returns:
+            set of str: The URLs that are already archived.
+        """
+        return self._url_database.has_urls(urlconfig.url
+                                           for urlconfig in urlconfigs
+                                           if urlconfig.url in self._url_filter)
+
     def allowed_url(self, urlconfig):
         """Checks if an URL is allowed to be crawled.
 
@@ -179,17 +250,26 @@ class CrawlerServerJob:
         Returns:
             bool: True if the URL is allowed, False if not.
         """
-        for regex in self.settings.allow_regex:
-            if re.search(regex, urlconfig.url):
-                break
-        else:
-            return False
-        for regex in self.settings.ignore_regex:
-            if re.search(regex, urlconfig.url):
-                return False
         if urlconfig.depth > self.max_depth:
             return False
-        return True
+        return self.settings.matcher.allowed(urlconfig.url)
+
+    def allowed_urls(self, urlconfigs):
+        """Filters the URLs allowed to be crawled at once.
+
+        See :func:`allowed_url`.
+
+        Args:
+            urlconfigs (list of :obj:`webarchiver.url.UrlConfig`): The
+                configurations of the URLs to be checked.
+
+        Returns:
+            list of :obj:`webarchiver.url.UrlConfig`: The allowed URLs.
+        """
+        urlconfigs = {urlconfig.url: urlconfig for urlconfig in urlconfigs
+                      if urlconfig.depth <= self.max_depth}
+        return [urlconfigs[url]
+                for url in self.settings.filter_urls(urlconfigs)]
 
     @property
     def max_depth(self):
@@ -206,12 +286,17 @@ class CrawlerServerJob:
         """str: The job identifier."""
         return self.settings.identifier
 
+    @property
+    def url_filter_path(self):
+        """str: The path the filter of archived URLs is saved to."""
+        return 'crawler_{}.bloom'.format(self.identifier)
+
     @property
     def finished(self):
         """bool: True if crawler is not active."""
-        return len(self._urls) == 0 and len(self._filenames_set) == 0 \
-            and len(self._finished_urls_set) == 0 \
-            and len(self._found_urls_set) == 0
+        return len(self._urls) == 0 and len(self._filenames_queue) == 0 \
+            and len(self._finished_urls_queue) == 0 \
+            and len(self._found_urls_queue) == 0
 
     def __repr__(self):
         return '<{} at 0x{:x} job={}>' \
@@ -1,11 +1,18 @@
 """Configuration for a job on a stager server."""
+import heapq
+import itertools
 import logging
+import math
 import time
+import urllib.parse
 
+from webarchiver.bloom import BloomFilter
 from webarchiver.config import *
+from webarchiver.database import UrlDeduplicationDatabase
+from webarchiver.hashring import HashRing
+from webarchiver.quota import QuotaLease, TokenBucket, burst_size, lease_size
 from webarchiver.server.base import Node
 from webarchiver.url import init_urls
-from webarchiver.utils import sample, split_set
 
 logger = logging.getLogger(__name__)
 
@@ -54,9 +61,27 @@ class StagerServerJob:
             ``stagers`` a backup of some of the URLs assigned to this stager
             server. Each URL is backed up in a dict with the URL as key and
             URL configuration as value.
+        ring (:obj:`webarchiver.hashring.HashRing`): The ring deciding which
+            stager server owns and backs up an URL. It contains this stager
+            server as None and the stager servers in ``stagers``.
+        seen_urls (:obj:`webarchiver.bloom.BloomFilter`): The filter of URLs
+            that were discovered before. It is in front of a database holding
+            these URLs, which confirms the URLs the filter possibly contains.
+        crawler_heap (list): A heap with items like::
+
+                (<expected drain time>, <counter>, <version>,
+                :obj:`webarchiver.server.base.Node`)
+
+            The crawler server with the lowest expected drain time is on top.
+            Items with a version that is not the current version of the
+            crawler server are outdated and skipped.
+        quota (:obj:`webarchiver.quota.QuotaLease`): The tokens leased from
+            the counter, from which URL quotas are granted to crawler servers.
+            None until the counter is set.
     """
 
-    def __init__(self, settings, initial, initial_stager=None):
+    def __init__(self, settings, initial, initial_stager=None,
+                 listener=None):
         """Inits the job configuration.
 
         Args:
@@ -67,6 +92,8 @@ class StagerServerJob:
             initial_stager (:obj:`webarchiver.server.base.Node`): The initial
                 server that created the job. This is the server that loaded the
                 job first and spread it among other stager servers.
+            listener (tuple, optional): The listener of this stager server,
+                used to place this stager server on the ring.
         """
         self.settings = settings
         self.initial = initial
@@ -77,6 +104,17 @@ class StagerServerJob:
         self.crawlers = {}
         self.stagers = {}
         self.backup = {}
+        self.ring = HashRing()
+        self.ring.add(ring_name(listener), None)
+        self.crawler_heap = []
+        self._heap_counter = itertools.count()
+        self.quota = None
+        self._url_database = UrlDeduplicationDatabase(self.identifier,
+            'stager_' + self.identifier)
+        self.seen_urls = self._load_url_filter()
+        for urlconfig in self.discovered_urls.values():
+            if not self.seen_url(urlconfig.url):
+                self._add_seen_url(urlconfig)
         logger.debug('Created stager job %s.', self)
 
     def add_crawler(self, s):
@@ -106,6 +144,7 @@ class StagerServerJob:
         """
         logger.debug('Crawler %s confirmed on stager job %s.', s, self)
         self.crawlers[s].confirmed = True
+        self._push_crawler(s)
 
     def add_stager(self, s):
         """Adds a stager server to the job.
@@ -120,8 +159,23 @@ class StagerServerJob:
         logger.debug('Adding stager %s to crawler job %s.', s, self)
         self.stagers[s] = StagerServerJobStager(s)
         self.backup[s.listener] = {}
+        self.ring.add(ring_name(s.listener), s)
         self.reset_finished()
 
+    def set_listener(self, s, previous):
+        """Moves a stager server on the ring to its announced listener.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server, with
+                its announced listener.
+            previous (tuple): The listener the stager server was known by.
+        """
+        logger.debug('Moving stager %s from %s on stager job %s.', s,
+                     previous, self)
+        self.ring.remove(ring_name(previous))
+        self.ring.add(ring_name(s.listener), s)
+        self.backup[s.listener] = self.backup.pop(previous, {})
+
     def backup_url(self, s, urlconfig):
         """Backs an URL up.
 
@@ -143,11 +197,13 @@ class StagerServerJob:
     def share_urls(self):
         """Shares the discovered URLs over the stager servers.
 
-        The set of discovered URLs is split into smaller sets according to the
-        number of stager servers that are on the job. A set is assigned to this
-        stager server. The other sets are assigned to other stager servers. For
-        each set of URLs a number of ``MAX_BACKUPS`` stager servers are chosen
-        for backup of the URL.
+        The stager server owning an URL and the ``MAX_BACKUPS`` stager
+        servers backing it up are the stager servers following the URL on
+        the ring. With ``HASH_RING_BY_HOST`` the host of the URL is used as
+        key, so all URLs of a host are assigned to the same stager server.
+        Every stager server uses the same ring, so an URL is always assigned
+        to the same stager servers and a joining stager server only takes
+        over a small part of the URLs.
 
         Yields:
             tuple: Each URL in a set for a certain stager server is yielded for
@@ -165,52 +221,156 @@ class StagerServerJob:
         logger.debug('Sharing discovered URLs for stager job %s.', self)
         if len(self.discovered_urls) == 0:
             return None
-        url_lists = split_set(self.discovered_urls, len(self.stagers)+1)
-        backups = sample(self.stagers, MAX_BACKUPS)
-        for urlconfig in url_lists.pop():
-            #self.add_url_crawler(url)
-            yield urlconfig, None, backups
-            del self.discovered_urls[urlconfig.url]
-        for s in self.stagers:
-            backups = sample(['this'] + [s_ for s_ in self.stagers if s_ != s],
-                             MAX_BACKUPS) # FIXME make pretty
-            add_current = 'this' in backups
+        assigned = {}
+        for urlconfig in list(self.discovered_urls.values()):
+            key = ring_key(urlconfig.url)
+            if key not in assigned:
+                assigned[key] = self.ring.get_nodes(key, MAX_BACKUPS+1)
+            s, *backups = assigned[key]
+            add_current = None in backups
+            if add_current:
+                backups = [s_ for s_ in backups if s_ is not None]
+            yield urlconfig, s, backups
             if add_current:
-                print('backup to self')
-                backups.remove('this')
-            for urlconfig in url_lists.pop():
-                yield urlconfig, s, backups
-                if add_current:
-                    self.backup_url(s, urlconfig)
-                del self.discovered_urls[urlconfig.url]
+                self.backup_url(s, urlconfig)
+            del self.discovered_urls[urlconfig.url]
         self.reset_finished()
 
     def add_url_crawler(self, urlconfig):
         """Adds an URL to a crawler.
 
-        The URL is added to the list of current URLs and added to the
-        configuration of the crawler server.
+        The URL is assigned to the crawler server with the lowest expected
+        drain time, see :func:`StagerServerJobCrawler.drain_time`. Only
+        confirmed and started crawler servers are considered, unless there
+        are none. The URL is added to the list of current URLs and added to
+        the configuration of the crawler server.
 
         Args:
             :obj:`webarchiver.url.UrlConfig`: The URL to assign.
         """
-        crawler = sample(self.crawlers, 1)[0]
+        crawler = self._least_loaded_crawler()
         logger.debug('Assigning URL %s to crawler %s.', urlconfig, crawler)
         self.current_urls[urlconfig.url] = urlconfig
         self.crawlers[crawler].add_url(urlconfig.url)
+        self._push_crawler(crawler)
         self.reset_finished()
         return crawler
 
+    def _least_loaded_crawler(self):
+        """Gets the crawler server with the lowest expected drain time.
+
+        Outdated items on top of ``crawler_heap`` are removed.
+
+        Returns:
+            :obj:`webarchiver.server.base.Node`: The crawler server.
+        """
+        heap = self.crawler_heap
+        while len(heap) > 0:
+            s, version = heap[0][3], heap[0][2]
+            if s in self.crawlers and self.crawlers[s].version == version:
+                return s
+            heapq.heappop(heap)
+        return min(self.crawlers, key=lambda s: self.crawlers[s].drain_time)
+
+    def _push_crawler(self, s):
+        """Pushes the current expected drain time of a crawler server to
+        ``crawler_heap``.
+
+        Crawler servers that are not confirmed and started are not pushed. If
+        the heap contains too many outdated items, it is rebuild.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server.
+        """
+        crawler = self.crawlers[s]
+        if not crawler.confirmed or not crawler.started:
+            return None
+        heapq.heappush(self.crawler_heap, (crawler.drain_time,
+                                           next(self._heap_counter),
+                                           crawler.version, s))
+        if len(self.crawler_heap) > CRAWLER_HEAP_MAX_OUTDATED \
+                + len(self.crawlers):
+            self.crawler_heap = [
+                (c.drain_time, next(self._heap_counter), c.version, s_)
+                for s_, c in self.crawlers.items()
+                if c.confirmed and c.started
+            ]
+            heapq.heapify(self.crawler_heap)
+
     def add_url(self, urlconfig):
         """Adds an URL to the discovered URLs.
 
+        URLs that were seen before are not added, see :func:`seen_url`.
+
         Args:
             :obj:`webarchiver.url.UrlConfig`: The discovered URL to add.
+
+        Returns:
+            bool: True if the URL is added, False if it was seen before.
         """
+        if self.seen_url(urlconfig.url):
+            logger.debug('Discovered URL %s already seen on stager job %s.',
+                         urlconfig, self)
+            return False
         logger.debug('Adding discovered URL %s to stager job %s.', urlconfig,
                      self)
+        self._add_seen_url(urlconfig)
         self.discovered_urls[urlconfig.url] = urlconfig
         self.reset_finished()
+        return True
+
+    def seen_url(self, url):
+        """Checks if an URL was seen before.
+
+        The database is only checked if the filter possibly contains the URL.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            bool: True if the URL was seen before, else False.
+        """
+        if url not in self.seen_urls:
+            return False
+        return self._url_database.has_url(url)
+
+    def _add_seen_url(self, urlconfig):
+        """Adds an URL to the database and filter of seen URLs.
+
+        Args:
+            urlconfig (:obj:`webarchiver.url.UrlConfig`): The URL.
+        """
+        self._url_database.insert(urlconfig)
+        self.seen_urls.add(urlconfig.url)
+
+    def _load_url_filter(self):
+        """Loads the filter of seen URLs.
+
+        The saved filter is used if it contains as many URLs as the database,
+        else the filter is rebuild from the URLs in the database.
+
+        Returns:
+            :obj:`webarchiver.bloom.BloomFilter`: The filter.
+        """
+        url_filter = BloomFilter.load(self.url_filter_path)
+        count = self._url_database.count()
+        if url_filter is None or url_filter.count != count:
+            logger.debug('Building URL filter for stager job %s from %d '
+                         'URLs.', self, count)
+            url_filter = BloomFilter()
+            for url in self._url_database.urls():
+                url_filter.add(url)
+        return url_filter
+
+    def save(self):
+        """Saves the filter of seen URLs with the job.
+
+        The database is committed first, so the filter matches the database.
+        """
+        logger.debug('Saving URL filter for stager job %s.', self)
+        self._url_database.commit()
+        self.seen_urls.count = self._url_database.count()
+        self.seen_urls.save(self.url_filter_path)
 
     def finish_url(self, s, url, listener):
         """Finishes an URL.
@@ -246,6 +406,7 @@ class StagerServerJob:
                 return False
             del self.current_urls[url]
             self.crawlers[s].remove_url(url)
+            self._push_crawler(s)
         self.reset_finished()
         return True
 
@@ -286,6 +447,7 @@ class StagerServerJob:
         """
         logger.debug('Crawler %s for stager job %s started.', s, self)
         self.crawlers[s].started = True
+        self._push_crawler(s)
 
     def add_counter(self, s):
         """Sets a stager server as counter for the URL quota for the job.
@@ -297,16 +459,73 @@ class StagerServerJob:
         logger.debug('Setting stager %s as counter for stager job %s.', s,
                      self)
         self.counter = s
+        self.quota = QuotaLease(lease_size(self.rate))
 
     def set_as_counter(self):
         """Sets this stager server as counter.
 
-        The time in seconds is used as counter to keep track of the number of
-        URLs that can be allowed to be crawled since the last URL quota
-        request.
+        A :class:`webarchiver.quota.TokenBucket` filling at the rate of the
+        job is used as counter. The stager servers of the job lease their
+        tokens from it.
         """
         logger.debug('Setting as counter for stager job %s.', self)
-        self.counter = time.time()
+        self.counter = TokenBucket(self.rate, burst_size(self.rate))
+        self.quota = QuotaLease(lease_size(self.rate))
+
+    def grant_url_quota(self):
+        """Grants an URL quota to a crawler server from the leased tokens.
+
+        A lease is spread over the crawler servers of the job. If this stager
+        server is the counter, a new lease is taken from the bucket directly.
+
+        Returns:
+            int: The URL quota, 0 if no tokens are left or the counter is not
+                set yet.
+        """
+        if self.quota is None:
+            return 0
+        if self.is_counter:
+            self.request_url_quota_lease()
+        share = math.ceil(self.quota.size / max(1, len(self.crawlers)))
+        return self.quota.grant(share)
+
+    def request_url_quota_lease(self):
+        """Requests a new lease of tokens from the counter if needed.
+
+        Returns:
+            int: The number of tokens to request from the counter, or None if
+                no lease is needed or this stager server is the counter and
+                took the lease already.
+        """
+        if self.quota is None:
+            return None
+        count = self.quota.request()
+        if count is None or not self.is_counter:
+            return count
+        self.quota.add(self.lease_url_quota(count))
+
+    def lease_url_quota(self, count):
+        """Leases tokens to a stager server.
+
+        Args:
+            count (int): The number of tokens requested.
+
+        Returns:
+            int: The number of tokens leased, which can be less than `count`.
+        """
+        if not self.is_counter:
+            logger.error('Stager is not counter for stager job %s.', self)
+            return 0
+        return self.counter.take(count)
+
+    def add_url_quota_lease(self, count):
+        """Adds leased tokens from the counter.
+
+        Args:
+            count (int): The number of tokens leased.
+        """
+        logger.debug('Stager job %s leased %s URLs quota.', self, count)
+        self.quota.add(count)
 
     def reset_finished(self):
         """Resetting all nodes to not having finished.
@@ -344,6 +563,7 @@ class StagerServerJob:
         for n in self.crawlers.values():
             if not n.finished:
                 return False
+        return True
 
     @property
     def stagers_finished(self):
@@ -351,6 +571,7 @@ class StagerServerJob:
         for n in self.stagers.values():
             if not n.finished:
                 return False
+        return True
 
     @property
     def finished(self):
@@ -367,6 +588,11 @@ class StagerServerJob:
         """str: The job identifier."""
         return self.settings.identifier
 
+    @property
+    def url_filter_path(self):
+        """str: The path the filter of seen URLs is saved to."""
+        return 'stager_{}.bloom'.format(self.identifier)
+
     @property
     def initial_urls(self):
         """tuple of str: The set of the initial URLs of the job."""
@@ -400,26 +626,17 @@ class StagerServerJob:
                 return False
         return True
 
-    @property
-    def url_quota(self):
-        """int: The URL quota for the job."""
-        if not self.is_counter:
-            logger.error('Stager is not counter for stager job %s.', self)
-            return 0
-        old = self.counter
-        self.counter = time.time()
-        return int((self.counter-old)*self.rate)
-
     @property
     def is_counter(self):
         """bool: True if the current stager server is the URL quota counter,
         else False.
         """
-        return type(self.counter) == float
+        return type(self.counter) == TokenBucket
 
     @property
     def counter(self):
-        """:obj:`webarchiver.server.base.Node` or float: The URL quota counter
+        """:obj:`webarchiver.server.base.Node` or
+        :obj:`webarchiver.quota.TokenBucket`: The URL quota counter
         of this job.
         """
         if not hasattr(self, '_counter'):
@@ -428,7 +645,7 @@ class StagerServerJob:
 
     @counter.setter
     def counter(self, value):
-        assert type(value) in {float, Node}
+        assert type(value) in {TokenBucket, Node}
         self._counter = value
 
     def __repr__(self):
@@ -445,6 +662,10 @@ class StagerServerJobCrawler:
         finished (bool): Whether the crawler server is finished.
         started (bool): Whether the crawler server started the job.
         urls (set of str): The URLs assigned to the crawler server.
+        rate (float): The moving average of the number of URLs finished per
+            second by the crawler server.
+        version (int): The version of the load of the crawler server, which
+            is increased every time an URL is added or removed.
     """
 
     def __init__(self, s):
@@ -458,22 +679,51 @@ class StagerServerJobCrawler:
         self.finished = False
         self.started = False
         self.urls = set()
+        self.rate = CRAWLER_INITIAL_RATE
+        self.version = 0
+        self._window_start = time.time()
+        self._window_finished = 0
 
     def add_url(self, url):
         """Adds an URL to the crawler server.
 
+        If the crawler server had no URLs, a new window for measuring the
+        rate is started, so idle time is not counted.
+
         Args:
             url (str): The URL to add.
         """
+        if len(self.urls) == 0:
+            self._window_start = time.time()
+            self._window_finished = 0
         self.urls.add(url)
+        self.version += 1
 
     def remove_url(self, url):
-        """Removes an URL from the crawler server.
+        """Removes a finished URL from the crawler server.
+
+        The finished URLs are counted in windows of ``CRAWLER_RATE_WINDOW``
+        seconds. At the end of a window the rate is updated with an
+        exponentially weighted moving average.
 
         Args:
             url (str): The URL to removed.
         """
         self.urls.remove(url)
+        self.version += 1
+        self._window_finished += 1
+        elapsed = time.time() - self._window_start
+        if elapsed >= CRAWLER_RATE_WINDOW:
+            self.rate = CRAWLER_RATE_ALPHA * self._window_finished / elapsed \
+                + (1 - CRAWLER_RATE_ALPHA) * self.rate
+            self._window_start += elapsed
+            self._window_finished = 0
+
+    @property
+    def drain_time(self):
+        """float: The expected number of seconds until the crawler server
+        finished its URLs and one more URL."""
+        return (len(self.urls) + 1) / max(self.rate, CRAWLER_MIN_RATE)
 
 
 class StagerServerJobStager:
@@ -497,5 +747,33 @@ class StagerServerJobStager:
         self.finished = False
         self.started = False
 
-__all__ = ('StagerServerJob',)
 
+def ring_name(listener):
+    """Gets the name of a stager server on the ring.
+
+    Args:
+        listener (tuple): The listener (host, port) of the stager server.
+
+    Returns:
+        str: The name of the stager server.
+    """
+    if listener is None:
+        return ''
+    return '{}:{}'.format(*listener)
+
+
+def ring_key(url):
+    """Gets the key of an URL on the ring.
+
+    Args:
+        url (str): The URL.
+
+    Returns:
+        str: The host of the URL if ``HASH_RING_BY_HOST`` is set, else the
+            URL.
+    """
+    if HASH_RING_BY_HOST:
+        return urllib.parse.urlsplit(url).netloc.lower()
+    return url
+
+__all__ = ('StagerServerJob',)
@@ -0,0 +1,169 @@
+"""Tests for stager.py."""
+import os
+import unittest
+
+from webarchiver.config import *
+from webarchiver.job.settings import JobSettings
+from webarchiver.server.base import Node
+from webarchiver.server.job.stager import StagerServerJob, ring_key
+from webarchiver.url import UrlConfig
+
+
+def create_job(crawlers):
+    """Creates a job with confirmed and started crawler servers.
+
+    Args:
+        crawlers (list): The crawler servers to add.
+
+    Returns:
+        :obj:`webarchiver.server.job.stager.StagerServerJob`: The job.
+    """
+    settings = JobSettings.__new__(JobSettings)
+    settings.identifier = 'job_1'
+    job = StagerServerJob(settings, False, listener=('127.0.0.1', 3000))
+    for s in crawlers:
+        job.add_crawler(s)
+        job.crawler_confirmed(s)
+        job.started_crawl(s)
+    return job
+
+
+def add_url(job, i):
+    """Assigns a new URL of the job to a crawler server.
+
+    Args:
+        job (:obj:`webarchiver.server.job.stager.StagerServerJob`): The job.
+        i (int): The number of the URL.
+
+    Returns:
+        The crawler server the URL is assigned to.
+    """
+    return job.add_url_crawler(UrlConfig('job_1',
+                                         'https://example.com/{}'.format(i),
+                                         0, None))
+
+
+def remove_job_files():
+    """Removes the database and filter of seen URLs of the job."""
+    for path in ('job_1.db', 'job_1.db-wal', 'job_1.db-shm',
+                 'stager_job_1.bloom'):
+        if os.path.isfile(path):
+            os.remove(path)
+
+
+def tearDownModule():
+    remove_job_files()
+
+
+class TestAddUrlCrawler(unittest.TestCase):
+    """Tests for assigning URLs to crawler servers."""
+
+    def test_balanced(self):
+        job = create_job(['a', 'b', 'c'])
+        for i in range(30):
+            add_url(job, i)
+        self.assertListEqual([len(job.crawlers[s].urls) for s in 'abc'],
+                             [10, 10, 10])
+
+    def test_rate(self):
+        job = create_job(['a', 'b'])
+        job.crawlers['a'].rate = 3
+        for i in range(40):
+            add_url(job, i)
+        self.assertEqual(len(job.crawlers['a'].urls), 30)
+        self.assertEqual(len(job.crawlers['b'].urls), 10)
+
+    def test_finished(self):
+        job = create_job(['a', 'b'])
+        for i in range(10):
+            add_url(job, i)
+        for url in list(job.crawlers['a'].urls):
+            job.finish_url('a', url, ('127.0.0.1', 4000))
+        self.assertEqual(add_url(job, 10), 'a')
+
+    def test_not_started(self):
+        job = create_job(['a'])
+        job.add_crawler('b')
+        for i in range(5):
+            self.assertEqual(add_url(job, i), 'a')
+
+
+class TestUrlQuota(unittest.TestCase):
+    """Tests for granting URL quotas from leased tokens."""
+
+    def test_counter(self):
+        job = create_job(['a', 'b'])
+        self.assertEqual(job.grant_url_quota(), 0)
+        job.settings.rate = 10
+        job.set_as_counter()
+        self.assertEqual(job.grant_url_quota(), 5 * QUOTA_LEASE_TIME)
+        self.assertEqual(job.quota.leases, 1)
+        self.assertIsNone(job.request_url_quota_lease())
+
+    def test_lease(self):
+        job = create_job(['a'])
+        job.settings.rate = 10
+        job.add_counter(Node(None, ('127.0.0.1', 3001)))
+        self.assertEqual(job.request_url_quota_lease(), 10 * QUOTA_LEASE_TIME)
+        self.assertIsNone(job.request_url_quota_lease())
+        self.assertEqual(job.grant_url_quota(), 0)
+        job.add_url_quota_lease(20)
+        self.assertEqual(job.grant_url_quota(), 20)
+
+
+class TestSeenUrls(unittest.TestCase):
+    """Tests for dropping discovered URLs that were seen before."""
+
+    def setUp(self):
+        remove_job_files()
+
+    def test_seen(self):
+        job = create_job([])
+        urlconfig = UrlConfig('job_1', 'https://example.com/', 0, None)
+        self.assertTrue(job.add_url(urlconfig))
+        self.assertFalse(job.add_url(urlconfig))
+
+    def test_false_positive(self):
+        job = create_job([])
+        job.seen_urls.add('https://example.com/')
+        self.assertTrue(job.add_url(UrlConfig('job_1', 'https://example.com/',
+                                              0, None)))
+
+    def test_save(self):
+        job = create_job(['a'])
+        job.add_url(UrlConfig('job_1', 'https://example.com/', 0, None))
+        self.assertFalse(job.crawlers_finished)
+        job.set_crawler_finished('a')
+        self.assertTrue(job.crawlers_finished)
+        job.save()
+        job = create_job([])
+        self.assertEqual(job.seen_urls.count, 1)
+        self.assertTrue(job.seen_url('https://example.com/'))
+
+
+class TestRing(unittest.TestCase):
+    """Tests for assigning URLs to stager servers on the ring."""
+
+    def setUp(self):
+        remove_job_files()
+
+    def owners(self, job):
+        return [job.ring.get(ring_key('https://example.com/{}'.format(i)))
+                for i in range(100)]
+
+    def test_set_listener(self):
+        announced = create_job([])
+        announced_stager = Node(None, ('stager.example.com', 3001))
+        announced.add_stager(announced_stager)
+        dialed = create_job([])
+        dialed_stager = Node(None, ('localhost', 3001))
+        dialed.add_stager(dialed_stager)
+        self.assertNotEqual(self.owners(dialed), self.owners(announced))
+        dialed_stager.listener = announced_stager.listener
+        dialed.set_listener(dialed_stager, ('localhost', 3001))
+        self.assertListEqual(
+            [s and s.listener for s in self.owners(dialed)],
+            [s and s.listener for s in self.owners(announced)]
+        )
+        self.assertIn(announced_stager.listener, dialed.backup)
+        self.assertNotIn(('localhost', 3001), dialed.backup)
@@ -0,0 +1,163 @@
+"""Scheduling the tasks of a server loop.
+
+Tasks run in the loop of a server, either every interval, at a deadline, or
+when they are woken. The deadlines are kept in a heap, so the loop can wait
+on its sockets exactly until the next task is due. Tasks can be woken from
+other threads, after which the loop should be interrupted, see
+:func:`webarchiver.server.base.BaseServer.wake`.
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+    """A task run by a :class:`Scheduler`.
+
+    Attributes:
+        function (function): The function run by the task.
+        args (tuple): The arguments for the function.
+        interval (float): The number of seconds between runs, or None if the
+            task only runs at a deadline or when woken.
+        deadline (float): The :func:`time.monotonic` time the task is due, or
+            None if it is not scheduled.
+        runs (int): The number of times the task ran.
+    """
+
+    def __init__(self, function, args, interval):
+        """Inits the task.
+
+        Args:
+            function (function): The function run by the task.
+            args (tuple): The arguments for the function.
+            interval (float): The number of seconds between runs, or None.
+        """
+        self.function = function
+        self.args = args
+        self.interval = interval
+        self.deadline = None
+        self.runs = 0
+
+    def __repr__(self):
+        return '<{} at 0x{:x} function={}>'.format(__name__, id(self),
+                                                   self.function.__name__)
+
+
+class Scheduler:
+    """Runs tasks at their deadlines.
+
+    The heap holds an entry for each deadline set. Entries of tasks that were
+    rescheduled or cancelled are left in the heap and skipped when popped.
+    """
+
+    def __init__(self):
+        """Inits the scheduler without tasks."""
+        self._heap = []
+        self._counter = itertools.count()
+        self._woken = []
+        self._lock = threading.Lock()
+
+    def add(self, function, *args, interval=None, delay=None):
+        """Adds a task.
+
+        Args:
+            function (function): The function to run.
+            *args: The arguments for the function.
+            interval (float, optional): Run the task every `interval`
+                seconds. Default is None, which only runs the task at its
+                deadline or when woken.
+            delay (float, optional): The number of seconds until the first
+                run. Default is None, which runs a task with an interval at
+                once and does not schedule a task without an interval.
+
+        Returns:
+            :obj:`Task`: The task.
+        """
+        task = Task(function, args, interval)
+        if delay is None and interval is not None:
+            delay = 0
+        if delay is not None:
+            self.schedule(task, delay)
+        return task
+
+    def schedule(self, task, delay):
+        """Sets the deadline of a task.
+
+        An earlier deadline of the task is replaced.
+
+        Args:
+            task (:obj:`Task`): The task.
+            delay (float): The number of seconds until the task is due.
+        """
+        task.deadline = time.monotonic() + delay
+        heapq.heappush(self._heap, (task.deadline, next(self._counter), task))
+
+    def cancel(self, task):
+        """Stops running a task.
+
+        Args:
+            task (:obj:`Task`): The task.
+        """
+        task.deadline = None
+        task.interval = None
+
+    def wake(self, *tasks):
+        """Runs tasks in the next :func:`run`.
+
+        This can be called from any thread.
+
+        Args:
+            *tasks (:obj:`Task`): The tasks.
+        """
+        with self._lock:
+            self._woken.extend(tasks)
+
+    def timeout(self):
+        """Gets the time until the next task is due.
+
+        Returns:
+            float: The number of seconds until the next task is due, 0 if a
+                task is due or woken, or None if no task is scheduled.
+        """
+        if len(self._woken) > 0:
+            return 0
+        self._discard_stale()
+        if len(self._heap) == 0:
+            return None
+        return max(self._heap[0][0] - time.monotonic(), 0)
+
+    def run(self):
+        """Runs the woken tasks and the tasks that are due.
+
+        A task with an interval is scheduled again `interval` seconds after it
+        ran, also if it raised an exception.
+        """
+        with self._lock:
+            woken, self._woken = self._woken, []
+        now = time.monotonic()
+        for task in woken:
+            task.deadline = now
+            heapq.heappush(self._heap, (now, next(self._counter), task))
+        while True:
+            self._discard_stale()
+            if len(self._heap) == 0 or self._heap[0][0] > now:
+                break
+            task = heapq.heappop(self._heap)[2]
+            task.deadline = None
+            try:
+                task.function(*task.args)
+            finally:
+                task.runs += 1
+                if task.interval is not None and task.deadline is None:
+                    self.schedule(task, task.interval)
+
+    def _discard_stale(self):
+        """Removes entries of rescheduled and cancelled tasks from the top of
+        the heap."""
+        heap = self._heap
+        while len(heap) > 0 and heap[0][2].deadline != heap[0][0]:
+            heapq.heappop(heap)
@@ -0,0 +1,62 @@
+"""Tests for scheduler.py."""
+import threading
+import time
+import unittest
+
+from webarchiver.server.base import BaseServer
+from webarchiver.server.scheduler import Scheduler
+
+
+class TestScheduler(unittest.TestCase):
+    """Tests for running tasks at their deadlines."""
+
+    def test_interval(self):
+        scheduler = Scheduler()
+        runs = []
+        task = scheduler.add(runs.append, 'a', interval=0.05)
+        scheduler.add(runs.append, 'b', delay=0.02)
+        scheduler.run()
+        self.assertListEqual(runs, ['a'])
+        self.assertAlmostEqual(scheduler.timeout(), 0.02, delta=0.01)
+        time.sleep(scheduler.timeout())
+        scheduler.run()
+        self.assertListEqual(runs, ['a', 'b'])
+        time.sleep(scheduler.timeout())
+        scheduler.run()
+        self.assertListEqual(runs, ['a', 'b', 'a'])
+        scheduler.cancel(task)
+        self.assertIsNone(scheduler.timeout())
+
+    def test_wake(self):
+        scheduler = Scheduler()
+        runs = []
+        task = scheduler.add(runs.append, 'a', interval=60, delay=60)
+        scheduler.wake(task, task)
+        self.assertEqual(scheduler.timeout(), 0)
+        scheduler.run()
+        self.assertListEqual(runs, ['a'])
+        self.assertEqual(task.runs, 1)
+        self.assertAlmostEqual(scheduler.timeout(), 60, delta=1)
+
+    def test_exception(self):
+        scheduler = Scheduler()
+        task = scheduler.add(lambda: 1 / 0, interval=60)
+        self.assertRaises(ZeroDivisionError, scheduler.run)
+        self.assertIsNotNone(task.deadline)
+
+
+class TestServerWake(unittest.TestCase):
+    """Tests for waking the loop of a server from another thread."""
+
+    def test_wake(self):
+        server = BaseServer('127.0.0.1')
+        self.addCleanup(server._socket.close)
+        woken = []
+        task = server._scheduler.add(woken.append, True)
+        threading.Timer(0.05, server.wake, (task,)).start()
+        start = time.monotonic()
+        server._run_round()
+        if len(woken) == 0:
+            server._run_round()
+        self.assertListEqual(woken, [True])
+        self.assertLess(time.monotonic() - start, 1)
@@ -3,14 +3,14 @@ import logging
 import os
 import socket
 import threading
-import time
 
 from webarchiver.config import *
 from webarchiver.job import new_jobs
 from webarchiver.server.job import StagerServerJob
 from webarchiver.server.base import BaseServer, Node
 from webarchiver.server.node import StagerNodeCrawler, StagerNodeStager
-from webarchiver.utils import check_time, sample, write_file
+from webarchiver.server.transfer import FileReceiver, partial_size
+from webarchiver.utils import sample
 
 logger = logging.getLogger(__name__)
 
@@ -42,25 +42,30 @@ class StagerServer(BaseServer):
         if stager_host is not None and stager_port is not None:
             self.init_stager((stager_host, stager_port))
         self._jobs = {}
-        self._last_jobs_check = 0
-        self._last_finish_check = 0
         self._used_space = 0
         self._uploading = {}
+        self._offers = {}
         self.test = 0 #TODO TEMP
         self._job_checker = threading.Thread(target=self._get_jobs)
         self._job_checker.daemon = True
         self._job_checker.start()
+        self._add_tasks()
         logger.info('Created stager server.')
 
-    def _run_round(self):
-        """Runs the base server loop and functions specific for this server.
+    def _add_tasks(self):
+        """Adds the tasks of the server to the scheduler.
 
-        The :func:`webarchiver.server.base.BaseServer._run_round` function is
-        run, after which a few server specific function are run. The server
-        will ping, start jobs and share the newly discovered URLs of jobs.
+        The server pings, starts jobs, shares the newly discovered URLs of jobs
+        and checks for finished jobs every interval.
         """
-        super()._run_round()
-        self.ping()
+        add = self._scheduler.add
+        add(self.ping, interval=PING_TIME)
+        add(self._start_jobs, interval=JOBS_START_TIME)
+        add(self.check_jobs, interval=JOBS_CHECK_TIME)
+        add(self.finish_jobs, interval=FINISH_CHECK_TIME)
+
+    def _start_jobs(self):
+        """Starts the jobs created on this server once they are confirmed."""
         if os.path.isfile('starttest' + str(self._address[1])) and len(self._jobs) == 0:
             with open('starttest' + str(self._address[1]), 'r') as f:
                 self.create_job('testjob', [s.strip() for s in f.read().splitlines()])
@@ -73,8 +78,6 @@ class StagerServer(BaseServer):
                     and not self._jobs[job].started:
                 self.start_job(job)
                 self.test = 1
-        self.check_jobs()
-        self.finish_jobs()
 
     def _get_jobs(self):
         """Adds new jobs.
@@ -92,10 +95,12 @@ class StagerServer(BaseServer):
                 server the incoming message is from.
         """
         if s == self._socket:
-            server, address = self._socket.accept()
+            try:
+                server, address = self._socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return None
             server = Node(server)
-            self._read_list.append(server)
-            self._write_queue[server] = []
+            self._add_node(server)
         else:
             super()._read_socket(s)
 
@@ -103,11 +108,11 @@ class StagerServer(BaseServer):
         """Inits the connection to a stager server.
 
         Using the listener a connection is created to a stager server. The
-        stager server is added to the read list and write queue and is added to
+        stager server is registered with the selector and is added to
         this stager server. When connected a message is send to announce
         itself with its own listener::
 
-            ANNOUNCE_STAGER <listener>
+            ANNOUNCE_STAGER <listener> <offered codecs>
 
         Or in case the stager server is not the initial stager server
         ``ANNOUNCE_STAGER_EXTRA`` is used instead of ``ANNOUNCE_STAGER``.
@@ -134,85 +139,86 @@ class StagerServer(BaseServer):
         if listener in self._listeners:
             return None
         s = self._connect_socket(listener)
-        self._write_queue[s] = []
-        self._read_list.append(s)
+        self._add_node(s)
         #print(s)
         self.add_stager(s, listener)
         self._write_socket_message(s, 'ANNOUNCE_STAGER' \
                                    + ('_EXTRA' if extra else ''),
-                                   self._address)
+                                   self._address, *WIRE_CODECS)
         return True
 
     def ping(self):
         """Pings the connected servers.
 
-        The servers ping both the crawler and stager servers::
+        Every ``PING_TIME`` seconds the servers ping both the crawler and
+        stager servers::
 
             PING
 
         The pong variable for each server it set to False, so a pong is
         expected from the server.
         """
-        if check_time(self._last_ping, PING_TIME):
-            for s in self._stager:
-                self._stager[s].pong = False
-            self._write_socket_message(self._stager, 'PING')
-            for s in self._crawlers:
-                self._crawlers[s].pong = False
-            self._write_socket_message(self._crawlers, 'PING')
-            self._last_ping = time.time()
+        for s in self._stager:
+            self._stager[s].pong = False
+        self._write_socket_message(self._stager, 'PING')
+        for s in self._crawlers:
+            self._crawlers[s].pong = False
+        self._write_socket_message(self._crawlers, 'PING')
 
     def check_jobs(self):
         """Share the URLs of each job with other staging servers.
 
-        The initial or discovered URLs for each job need to be spread over
-        other stager servers to be archived. The ``share_urls`` function of a
+        Every ``JOBS_CHECK_TIME`` seconds the initial or discovered URLs for
+        each job are spread over other stager servers to be archived. The ``share_urls`` function of a
         job yields a list of URLs, assigned stager servers and backup location.
-        An URL is send to its assigned stager server::
+        URLs are batched and send to their assigned stager server::
 
-            JOB_URL :obj:`webarchiver.url.UrlConfig`
+            JOB_URL_BATCH <job identifier> :obj:`webarchiver.url.UrlConfig`
+                ...
 
-        and to the backup location the URL is send::
+        and to the backup location the URLs are send::
 
-            JOB_URL_BACKUP :obj:`webarchiver.url.UrlConfig`
-                <listener assigned server>
+            JOB_URL_BACKUP_BATCH <job identifier> <listener assigned server>
+                :obj:`webarchiver.url.UrlConfig` ...
 
         Note:
             If the server value of the yielded data is None, the current stager
             server has the URL assigned.
         """
-        if check_time(self._last_jobs_check, JOBS_CHECK_TIME):
-            for job in self._jobs.values():
-                for urlconfig, s, backups in job.share_urls():
-                    if s is None:
-                        logger.debug('Assigning URL %s to self.', urlconfig)
-                        s = self._socket
-                        self._command_job_url(None, [None, urlconfig])
-                    else:
-                        self._write_socket_message(s, 'JOB_URL', urlconfig)
-                    self._write_socket_message(backups, 'JOB_URL_BACKUP',
-                                               urlconfig, s.listener)
-            self._last_jobs_check = time.time()
+        for job in self._jobs.values():
+            for urlconfig, s, backups in job.share_urls():
+                if s is None:
+                    logger.debug('Assigning URL %s to self.', urlconfig)
+                    s = self._socket
+                    self._command_job_url(None, [None, urlconfig])
+                else:
+                    self._write_socket_batch(s, 'JOB_URL_BATCH',
+                                             (job.identifier,), urlconfig)
+                self._write_socket_batch(backups, 'JOB_URL_BACKUP_BATCH',
+                                         (job.identifier, s.listener),
+                                         urlconfig)
 
     def finish_jobs(self):
         """Checks running jobs for being finished.
 
+        Every ``FINISH_CHECK_TIME`` seconds, the batched messages are send.
         If a job is finished on this stager server, this is reported to other
         stager servers runnign this job::
 
             STAGER_JOB_FINISHED <job identifier>
 
+        The filter of seen URLs of a finished job is saved.
+
         Note:
             A finished job means that the job currently is not active. It can
             become active again if new URLs are send to it.
         """ #TODO what do if a job is fully job.finished?
-        if not check_time(self._last_finish_check, FINISH_CHECK_TIME):
-            return None
+        self._flush_batches(force=True)
         for identifier, job in self._jobs.items():
             if job.crawlers_finished:
+                job.save()
                 self._write_socket_message(job.stagers, 'STAGER_JOB_FINISHED',
                                            identifier)
-        self._last_finish_check = time.time()
 
     def create_job(self, settings, initial_stager=None, initial=True):
         """Creates a job.
@@ -245,7 +251,8 @@ class StagerServer(BaseServer):
             logger.debug('Stager %s is initial stager for job %s.',
                          initial_stager, settings)
         self._jobs[settings.identifier] = StagerServerJob(settings, initial,
-                                                          initial_stager)
+                                                          initial_stager,
+                                                          self._address)
         if initial:
             self.job_add_stager(settings.identifier)
         self.job_add_crawler(settings.identifier)
@@ -273,6 +280,8 @@ class StagerServer(BaseServer):
 
             JOB_SET_COUNTER <job identifier> <listener of counter>
 
+        A first lease of tokens for the URL quota is requested from it.
+
         If however this is not the initial stager server sharing the job, this
         functions is called with a command to add a number of stagers to a job.
         In that case the job is initially confirmed to the stager server::
@@ -320,6 +329,7 @@ class StagerServer(BaseServer):
             self._write_socket_message(job.stagers, 'JOB_SET_COUNTER',
                                        identifier, counter.listener)
             job.add_counter(counter)
+            self.request_url_quota_lease(identifier)
         else:
             self._write_socket_message(job.stagers, 'CONFIRMED_JOB', 0,
                                        identifier)
@@ -447,8 +457,6 @@ class StagerServer(BaseServer):
         d = self._stager if s in self._stager else self._crawlers
         if not d[s].pong:
             d[s].pong = True
-        else:
-            self.ping()
 
     def _command_job_crawl_confirmed(self, s, message):
         """Processes the ``JOB_CRAWL_CONFIRMED`` command.
@@ -548,7 +556,24 @@ class StagerServer(BaseServer):
         """
         crawler = self._jobs[message[1].job_identifier] \
             .add_url_crawler(message[1])
-        self._write_socket_message(crawler, 'JOB_URL_CRAWL', message[1])
+        self._write_socket_batch(crawler, 'JOB_URL_CRAWL_BATCH',
+                                 (message[1].job_identifier,), message[1])
+
+    def _command_job_url_batch(self, s, message):
+        """Processes the ``JOB_URL_BATCH`` command.
+
+        Every URL in the batch is processed like a ``JOB_URL`` command.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    JOB_URL_BATCH <job identifier>
+                        :obj:`webarchiver.url.UrlConfig` ...
+        """
+        for urlconfig in message[2:]:
+            self._command_job_url(s, [None, urlconfig])
 
     def _command_job_url_backup(self, s, message):
         """Processes the ``JOB_URL_BACKUP`` command.
@@ -567,6 +592,25 @@ class StagerServer(BaseServer):
         self._jobs[message[1].job_identifier] \
             .backup_url(self._listeners[message[2]], message[1])
 
+    def _command_job_url_backup_batch(self, s, message):
+        """Processes the ``JOB_URL_BACKUP_BATCH`` command.
+
+        Every URL in the batch is processed like a ``JOB_URL_BACKUP`` command.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    JOB_URL_BACKUP_BATCH <job identifier>
+                        <listener assigned server>
+                        :obj:`webarchiver.url.UrlConfig` ...
+        """
+        job = self._jobs[message[1]]
+        stager = self._listeners[message[2]]
+        for urlconfig in message[3:]:
+            job.backup_url(stager, urlconfig)
+
     def _command_job_url_finished(self, s, message):
         """Processes the ``JOB_URL_FINISHED`` command.
 
@@ -588,6 +632,24 @@ class StagerServer(BaseServer):
         """ #TODO: the crawler server is not connected to every stager server. should the URL first be send to the stager server that queued it, which sends it to all stager server?
         self._jobs[message[1]].finish_url(s, message[2], message[3])
 
+    def _command_job_url_finished_batch(self, s, message):
+        """Processes the ``JOB_URL_FINISHED_BATCH`` command.
+
+        Every URL in the batch is processed like a ``JOB_URL_FINISHED``
+        command.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
+                queued the command.
+            message (list): The command that was received::
+
+                    JOB_URL_FINISHED_BATCH <job_identifier>
+                        <listener that queued URL> <URL> ...
+        """
+        job = self._jobs[message[1]]
+        for url in message[3:]:
+            job.finish_url(s, url, message[2])
+
     def _command_job_url_discovered(self, s, message):
         """Processes the ``JOB_URL_DISCOVERED`` command.
 
@@ -601,15 +663,33 @@ class StagerServer(BaseServer):
 
                     JOB_URL_DISCOVERED :obj:`webarchiver.url.UrlConfig`
         """
-        # TODO check if URL should be crawled
         self._jobs[message[1].job_identifier].add_url(message[1])
 
+    def _command_job_url_discovered_batch(self, s, message):
+        """Processes the ``JOB_URL_DISCOVERED_BATCH`` command.
+
+        Every URL in the batch is processed like a ``JOB_URL_DISCOVERED``
+        command.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
+                queued the command.
+            message (list): The command that was received::
+
+                    JOB_URL_DISCOVERED_BATCH <job identifier>
+                        :obj:`webarchiver.url.UrlConfig` ...
+        """
+        job = self._jobs[message[1]]
+        for urlconfig in message[2:]:
+            job.add_url(urlconfig)
+
     def _command_job_set_counter(self, s, message):
         """Processes the ``JOB_SET_COUNTER`` command.
 
         Set the specified stager server as counter for the given job
         identifier. If the listener is that of this stager server, this stager
-        server makes itself the counter for the URL quota.
+        server makes itself the counter for the URL quota. A first lease of
+        tokens for the URL quota is requested right away.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
@@ -623,6 +703,7 @@ class StagerServer(BaseServer):
             job.set_as_counter()
         else:
             job.add_counter(self._listeners[message[2]])
+        self.request_url_quota_lease(message[1])
 
     def _command_request_stager(self, s, message):
         """Processes the ``REQUEST_STAGER`` command.
@@ -650,16 +731,13 @@ class StagerServer(BaseServer):
         """Processes the ``REQUEST_URL_QUOTA`` command.
 
         The crawler server has requested a quota for the number of URLs it is
-        allowed to archive. If this stager server is the counter for the quota,
-        this goes to function :func:`_command_assigned_url_quota_crawler`
-        belonging with command ``ASSIGNED_URL_QUOTA_CRAWLER``, where the quota
-        is send back.
+        allowed to archive. The quota is granted from the tokens this stager
+        server leased from the counter and send back::
 
-        If the stager server is not the counter a request for URL quota is send
-        to the stager server that is the counter::
+            ASSIGNED_URL_QUOTA <job identifier> <assigned quota>
 
-            REQUEST_URL_QUOTA_CRAWLER <job identifier>
-                <listener crawler server>
+        If few tokens are left, a new lease is requested with
+        :func:`request_url_quota_lease`.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The crawler server that
@@ -668,65 +746,68 @@ class StagerServer(BaseServer):
 
                     REQUEST_URL_QUOTA <job identifier>
         """
-        print(s.listener)
         job = self._jobs[message[1]]
-        if job.is_counter:
-            self._command_assigned_url_quota_crawler(None,
-                ['', message[1], job.url_quota, s.listener])
-        else:
-            self._write_socket_message(job.counter,
-                                       'REQUEST_URL_QUOTA_CRAWLER', message[1],
-                                       s.listener)
+        quota = job.grant_url_quota()
+        if quota > 0:
+            self._write_socket_message(s, 'ASSIGNED_URL_QUOTA', message[1],
+                                       quota)
+        self.request_url_quota_lease(message[1])
 
-    def _command_request_url_quota_crawler(self, s, message):
-        """Processes the ``REQUEST_URL_QUOTA_CRAWLER`` command.
+    def request_url_quota_lease(self, identifier):
+        """Requests a lease of tokens for the URL quota of a job if needed.
 
-        The stager server requests an URL quota for a crawler server. This
-        stager server is the counter for this URL quota. The URL quota is taken
-        and send back::
+        The lease is requested from the stager server that is the counter of
+        the job::
 
-            ASSIGNED_URL_QUOTA_CRAWLER <job identifier> <assigned quota>
-                <listener crawler server>
+            REQUEST_URL_QUOTA_LEASE <job identifier> <number of tokens>
 
-        Note:
-            This command can never be called from a crawler server. It is only
-            called from a stager server if it got a request for an URL quota,
-            but it is not the counter of the URL quota.
+        If this stager server is the counter the tokens are taken directly.
+
+        Args:
+            identifier (str): The job identifier.
+        """
+        job = self._jobs[identifier]
+        count = job.request_url_quota_lease()
+        if count is not None:
+            self._write_socket_message(job.counter, 'REQUEST_URL_QUOTA_LEASE',
+                                       identifier, count)
+
+    def _command_request_url_quota_lease(self, s, message):
+        """Processes the ``REQUEST_URL_QUOTA_LEASE`` command.
+
+        A stager server requests a lease of tokens for the URL quota. This
+        stager server is the counter of the job. The leased tokens, which can
+        be fewer than requested, are send back::
+
+            ASSIGNED_URL_QUOTA_LEASE <job identifier> <number of tokens>
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
                 queued the command.
             message (list): The command that was received::
 
-                    REQUEST_URL_QUOTA_CRAWLER <job identifier>
-                        <listener crawler server>
+                    REQUEST_URL_QUOTA_LEASE <job identifier>
+                        <number of tokens>
         """
-        quota = self._jobs[message[1]].url_quota
-        self._write_socket_message(s, 'ASSIGNED_URL_QUOTA_CRAWLER',
-                                   message[1], quota, *message[2:])
+        count = self._jobs[message[1]].lease_url_quota(message[2])
+        self._write_socket_message(s, 'ASSIGNED_URL_QUOTA_LEASE', message[1],
+                                   count)
 
-    def _command_assigned_url_quota_crawler(self, s, message):
-        """Processes the ``ASSIGNED_URL_QUOTA_CRAWLER`` command.
-
-        An URL quota is assigned to the crawler server. This is send back to
-        the crawler server::
-
-            ASSIGNED_URL_QUOTA <job identifier> <assigned quota>
+    def _command_assigned_url_quota_lease(self, s, message):
+        """Processes the ``ASSIGNED_URL_QUOTA_LEASE`` command.
 
-        Note:
-            This function can be called directly from this stager server if it
-            is the counter for the URL quota.
+        The counter leased tokens for the URL quota to this stager server.
+        They are granted to crawler servers requesting an URL quota.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
                 queued the command.
             message (list): The command that was received::
 
-                    ASSIGNED_URL_QUOTA_CRAWLER <job identifier>
-                        <assigned quota> <listener crawler server>
+                    ASSIGNED_URL_QUOTA_LEASE <job identifier>
+                        <number of tokens>
         """
-        self._write_socket_message(self._listeners[message[3]],
-                                   'ASSIGNED_URL_QUOTA', *message[1:3])
+        self._jobs[message[1]].add_url_quota_lease(message[2])
                                    
 
 #    def _command_stager_added(self, s, message):
@@ -799,21 +880,25 @@ class StagerServer(BaseServer):
         """Processes the ``ANNOUNCE_CRAWLER`` command.
 
         A crawler server announces itself using its listener. This stager
-        server creates a connection with the crawler. It sends back a
-        confirmation::
+        server creates a connection with the crawler. It chooses one of the
+        offered codecs and sends back a confirmation::
 
-            CONFIRMED 0
+            CONFIRMED 0 <chosen codec>
+
+        The chosen codec is used for the next messages to the crawler server.
 
         Args:
             s (:obj:`webarchiver.server.base.Node`): The crawler server that
                 queued the command.
             message (list): The command that was received::
 
-                    ANNOUNCE_CRAWLER <crawler listener>
+                    ANNOUNCE_CRAWLER <crawler listener> <offered codecs>
         """
         s.listener = message[1]
         self.add_crawler(s, message[1])
-        self._write_socket_message(s, 'CONFIRMED', 0)
+        identifier = self._choose_codec(message[2:])
+        self._write_socket_message(s, 'CONFIRMED', 0, identifier)
+        self._set_codec(s, identifier)
 
     def _command_announce_crawler_extra(self, s, message):
         """Processes the ``ANNOUNCE_CRAWLER_EXTRA`` command.
@@ -831,6 +916,7 @@ class StagerServer(BaseServer):
             message (list): The command that was received::
 
                     ANNOUNCE_CRAWLER_EXTRA <crawler listener>
+                        <offered codecs>
         """
         self._command_announce_crawler(s, message)
 
@@ -838,9 +924,10 @@ class StagerServer(BaseServer):
         """Processes the ``ANNOUNCE_STAGER`` command.
 
         A stager server announces itself using its listener. This stager server
-        creates a connection using the listener. It sends back a confirmation::
+        creates a connection using the listener. It chooses one of the offered
+        codecs and sends back a confirmation::
 
-            CONFIRMED 0
+            CONFIRMED 0 <chosen codec>
 
         If this is the first stager server the announcing stager server
         announces itself to, each stager server that is currently connected
@@ -848,12 +935,17 @@ class StagerServer(BaseServer):
 
             STAGER_NEW <stager listener>
 
+        The announcing stager server might know this stager server by another
+        host than this stager server uses, so its own listener is sent::
+
+            STAGER_LISTENER <listener>
+
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager server that
                 queued the command.
             message (list): The command that was received::
 
-                    ANNOUNCE_STAGER <stager listener>
+                    ANNOUNCE_STAGER <stager listener> <offered codecs>
         """
         s.listener = message[1]
         if self.add_stager(s, message[1]) and not extra:
@@ -861,7 +953,10 @@ class StagerServer(BaseServer):
                 if s_ == s:
                     continue
                 self._write_socket_message(s, 'STAGER_NEW', s_.listener)
-        self._write_socket_message(s, 'CONFIRMED', 0)
+        self._write_socket_message(s, 'STAGER_LISTENER', self._address)
+        identifier = self._choose_codec(message[2:])
+        self._write_socket_message(s, 'CONFIRMED', 0, identifier)
+        self._set_codec(s, identifier)
 
     def _command_announce_stager_extra(self, s, message):
         """Processes the ``ANNOUNCE_STAGER_EXTRA`` command.
@@ -880,6 +975,7 @@ class StagerServer(BaseServer):
             message (list): The command that was received::
 
                     ANNOUNCE_STAGER_EXTRA <stager listener>
+                        <offered codecs>
         """
         self._command_announce_stager(s, message, extra=True)
 
@@ -897,6 +993,34 @@ class StagerServer(BaseServer):
         """
         self.init_stager(message[1], extra=True)
 
+    def _command_stager_listener(self, s, message):
+        """Processes the ``STAGER_LISTENER`` command.
+
+        A stager server this stager server connected to announces its own
+        listener. The listener that was connected to might be another name of
+        the stager server, like ``localhost``. The announced listener is used
+        from now on, so every stager server places the stager server at the
+        same position on the rings of the jobs, see
+        :func:`webarchiver.server.job.stager.StagerServerJob.set_listener`.
+        The listener that was connected to is kept as another name.
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The stager server that
+                queued the command.
+            message (list): The command that was received::
+
+                    STAGER_LISTENER <listener>
+        """
+        if s.listener == message[1]:
+            return None
+        logger.debug('Stager %s announced listener %s.', s, message[1])
+        self._listeners[message[1]] = s
+        previous = s.listener
+        s.listener = message[1]
+        for job in self._jobs.values():
+            if s in job.stagers:
+                job.set_listener(s, previous)
+
     def _command_confirmed(self, s, message):
         """Processes the ``CONFIRMED`` command.
 
@@ -905,13 +1029,18 @@ class StagerServer(BaseServer):
 
             CONFIRMED 1
 
+        If the other server chose a codec, it is used for the next messages to
+        the server.
+
         Args:
             s (:obj:`webarchiver.server.base.Node`): The stager or crawler
                 server that queued the command.
             message (list): The command that was received::
 
-                    CONFIRMED <state>
+                    CONFIRMED <state> <chosen codec>
         """#TODO unconsistent behavior on initial confirmation and confirming back.
+        if len(message) > 2:
+            self._set_codec(s, message[2])
         d = self._stager if s in self._stager else self._crawlers
         if not d[s].confirmed:
             d[s].confirmed = True
@@ -968,26 +1097,140 @@ class StagerServer(BaseServer):
         self.free_space += self._uploading[message[2]]
         del self._uploading[message[2]]
 
-    def _command_warc_file(self, s, message):
-        """Processes the ``JOB_URL`` command.
+    def _command_warc_file_offer(self, s, message):
+        """Processes the ``WARC_FILE_OFFER`` command.
 
-        Saves a received WARC file to disk and confirms the file was received::
+        A crawler server offers a WARC file to upload. The number of bytes of
+        the file already received in an earlier attempt is send, so the
+        upload resumes from there::
 
-            WARC_FILE_RECEIVED <job identifier> <path>
+            WARC_FILE_RESUME <job identifier> <path> <offset>
+
+        A WARC file for an unknown job is denied, see :func:`_deny_warc_file`.
 
         Args:
-            s (:obj:`webarchiver.server.base.Node`): The stager server that
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
+                queued the command.
+            message (list): The command that was received::
+
+                    WARC_FILE_OFFER <job identifier> <path> <filesize>
+                        <SHA-256 digest>
+        """
+        if message[1] not in self._jobs:
+            logger.warning('Denying WARC file %s for unknown job %s.',
+                           message[2], message[1])
+            self._deny_warc_file(s, message[1], message[2])
+            return None
+        offset = partial_size(self._warc_path(message[1], message[2]))
+        if offset > message[3]:
+            offset = 0
+        self._offers[(message[1], message[2])] = message[3:5]
+        self._write_socket_message(s, 'WARC_FILE_RESUME', message[1],
+                                   message[2], offset)
+
+    def _command_warc_file_data(self, s, message):
+        """Processes the ``WARC_FILE_DATA`` command.
+
+        The raw bytes of an offered WARC file follow this command. They are
+        received into the partial file, see :func:`_stream_received`.
+
+        If the file was not offered, has a different size than offered or
+        can not be written, the bytes are discarded and the file is denied,
+        see :func:`_deny_warc_file`. If fewer bytes were received before than
+        the offset, the upload is resumed from the bytes received::
+
+            WARC_FILE_RESUME <job identifier> <path> <offset>
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
                 queued the command.
             message (list): The command that was received::
 
-                    WARC_FILE <path> <file> <job identifier>
+                    WARC_FILE_DATA <job identifier> <path> <offset> <length>
+        """
+        key = (message[1], message[2])
+        if key not in self._offers:
+            logger.warning('Discarding WARC file %s that was not offered.',
+                           message[2])
+            self._deny_warc_file(s, *key)
+            return None
+        size, digest = self._offers[key]
+        if message[3] + message[4] != size:
+            logger.warning('Discarding WARC file %s with wrong size.',
+                           message[2])
+            self._deny_warc_file(s, *key)
+            return None
+        try:
+            s.receiver = FileReceiver(self._warc_path(*key), message[3],
+                                      message[4], digest, key)
+        except ValueError as error:
+            logger.warning('Resuming WARC file %s: %s', message[2], error)
+            self._write_socket_message(s, 'WARC_FILE_RESUME', *key,
+                                       partial_size(self._warc_path(*key)))
+        except OSError as error:
+            logger.error('Could not receive WARC file %s: %s', message[2],
+                         error)
+            self._deny_warc_file(s, *key)
+
+    def _deny_warc_file(self, s, identifier, path):
+        """Denies the upload of a WARC file.
+
+        The offer of the WARC file is forgotten, the space reserved for it is
+        freed and the crawler server is told to request permission to upload
+        the WARC file again::
+
+            WARC_FILE_DENIED <job identifier> <path>
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
+                offered the WARC file.
+            identifier (str): The job identifier.
+            path (str): The path of the WARC file on the crawler server.
+        """
+        self._offers.pop((identifier, path), None)
+        if path in self._uploading:
+            self.free_space += self._uploading.pop(path)
+        self._write_socket_message(s, 'WARC_FILE_DENIED', identifier, path)
+
+    def _stream_received(self, s, receiver):
+        """Confirms a WARC file was received.
+
+        If the digest of the received file matches the offered digest, the
+        file is confirmed::
+
+            WARC_FILE_RECEIVED <job identifier> <path>
+
+        Otherwise the upload is restarted from the beginning::
+
+            WARC_FILE_RESUME <job identifier> <path> 0
+
+        Args:
+            s (:obj:`webarchiver.server.base.Node`): The crawler server that
+                send the file.
+            receiver (:obj:`webarchiver.server.transfer.StreamReceiver`): The
+                receiver of the file.
         """
-        if message[3] not in self._jobs:
+        if not isinstance(receiver, FileReceiver):
             return None
-        path = os.path.join('warc', message[3], os.path.basename(message[1]))
-        if write_file(path, message[2]):
-            self._write_socket_message(s, 'WARC_FILE_RECEIVED', message[3],
-                message[1])
+        if receiver.finish():
+            del self._offers[receiver.context]
+            self._write_socket_message(s, 'WARC_FILE_RECEIVED',
+                                       *receiver.context)
+        else:
+            self._write_socket_message(s, 'WARC_FILE_RESUME',
+                                       *receiver.context, 0)
+
+    def _warc_path(self, identifier, path):
+        """Gets the path to store a received WARC file at.
+
+        Args:
+            identifier (str): The job identifier.
+            path (str): The path of the WARC file on the crawler server.
+
+        Returns:
+            str: The path to store the WARC file at.
+        """
+        return os.path.join('warc', identifier, os.path.basename(path))
 
     def _command_crawler_job_finished(self, s, message):
         """Processes the ``CRAWLER_JOB_FINISHED`` command.
@@ -1,6 +1,8 @@
 """Tests for stager.py."""
+import os
 import random
 import socket
+import tempfile
 import threading
 import time
 import unittest
@@ -58,6 +60,19 @@ class TestStagerServer(unittest.TestCase):
         self.assertIn(s2_on_s1_node, s1._stager)
         self.assertIn(s2._address, s1._listeners)
 
+    def test_announced_listener(self):
+        s1 = StagerServer(host='127.0.0.1')
+        s2 = StagerServer(stager_host='localhost', stager_port=s1._address[1],
+                          host='127.0.0.1')
+        s1_on_s2_node = s2._listeners[('localhost', s1._address[1])]
+        run_server(s1)
+        run_server(s2)
+        time.sleep(0.1) # Wait for communication
+        self.assertTupleEqual(s1_on_s2_node.listener, s1._address)
+        self.assertIs(s2._listeners[s1._address], s1_on_s2_node)
+        s2_on_s1_node = s1._listeners[s2._address]
+        self.assertTupleEqual(s2_on_s1_node.listener, s2._address)
+
     def test_non_existing_initial_connection(self):
         pass
 
@@ -89,3 +104,81 @@ class TestStagerServer(unittest.TestCase):
     def ggg(self):
         pass
 
+
+class Node:
+    """A connection only holding a stream receiver."""
+
+    def __init__(self):
+        """Inits the connection without a receiver."""
+        self.receiver = None
+
+
+class TestWarcFileRejection(unittest.TestCase):
+    """Tests for replying to rejected WARC file uploads."""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = StagerServer(host='127.0.0.1')
+        self.server._warc_path = lambda identifier, path: \
+            os.path.join(self.directory.name, identifier,
+                         os.path.basename(path))
+        self.messages = []
+        self.server._write_socket_message = \
+            lambda s, *message: self.messages.append(message)
+        self.node = Node()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def offer(self, size):
+        self.server._offers[('job', 'a.warc.gz')] = [size, b'digest']
+        self.server._uploading['a.warc.gz'] = size
+        self.server.free_space -= size
+
+    def test_unknown_job(self):
+        self.server._command_warc_file_offer(
+            self.node, ['WARC_FILE_OFFER', 'job', 'a.warc.gz', 10, 'digest'])
+        self.assertListEqual(self.messages,
+                             [('WARC_FILE_DENIED', 'job', 'a.warc.gz')])
+        self.assertDictEqual(self.server._offers, {})
+
+    def test_not_offered(self):
+        self.server._command_warc_file_data(
+            self.node, ['WARC_FILE_DATA', 'job', 'a.warc.gz', 0, 10])
+        self.assertListEqual(self.messages,
+                             [('WARC_FILE_DENIED', 'job', 'a.warc.gz')])
+        self.assertIsNone(self.node.receiver)
+
+    def test_wrong_size(self):
+        free_space = self.server.free_space
+        self.offer(10)
+        self.server._command_warc_file_data(
+            self.node, ['WARC_FILE_DATA', 'job', 'a.warc.gz', 0, 20])
+        self.assertListEqual(self.messages,
+                             [('WARC_FILE_DENIED', 'job', 'a.warc.gz')])
+        self.assertDictEqual(self.server._offers, {})
+        self.assertDictEqual(self.server._uploading, {})
+        self.assertEqual(self.server.free_space, free_space)
+
+    def test_missing_partial_file(self):
+        self.offer(10)
+        self.server._command_warc_file_data(
+            self.node, ['WARC_FILE_DATA', 'job', 'a.warc.gz', 5, 5])
+        self.assertListEqual(self.messages,
+                             [('WARC_FILE_RESUME', 'job', 'a.warc.gz', 0)])
+        self.assertIn(('job', 'a.warc.gz'), self.server._offers)
+        self.assertIsNone(self.node.receiver)
+
+    def test_unwritable(self):
+        free_space = self.server.free_space
+        self.offer(10)
+        blocker = os.path.join(self.directory.name, 'job')
+        open(blocker, 'w').close()
+        self.server._command_warc_file_data(
+            self.node, ['WARC_FILE_DATA', 'job', 'a.warc.gz', 0, 10])
+        self.assertListEqual(self.messages,
+                             [('WARC_FILE_DENIED', 'job', 'a.warc.gz')])
+        self.assertDictEqual(self.server._offers, {})
+        self.assertEqual(self.server.free_space, free_space)
+        self.assertIsNone(self.node.receiver)
+
@@ -0,0 +1,238 @@
+"""Streaming of files between servers.
+
+A file is send as a stream command, followed by the raw bytes of the file
+outside of any frame. The last field of a stream command is the number of raw
+bytes that follow it. The bytes are send from the file to the socket with
+``os.sendfile`` where available, and received straight into a partial file on
+disk while a digest of the file is kept. A partially received file is kept, so
+a transfer can be resumed from the size of the partial file.
+"""
+import hashlib
+import logging
+import os
+
+from webarchiver.config import *
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path):
+    """Calculates the SHA-256 digest of a file.
+
+    The file is read in chunks of ``FILE_CHUNK_SIZE`` bytes.
+
+    Args:
+        path (str): The path to the file.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest of the file.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def partial_size(path):
+    """Gets the size of the partially received file for a path.
+
+    Args:
+        path (str): The path the file is received to.
+
+    Returns:
+        int: The number of bytes already received.
+    """
+    partial = path + '.partial'
+    if not os.path.isfile(partial):
+        return 0
+    return os.path.getsize(partial)
+
+
+class FileSender:
+    """Sends a part of a file to a socket.
+
+    Args:
+        path (str): The path to the file.
+        offset (int): The position in the file of the next byte to send.
+        remaining (int): The number of bytes still to send.
+    """
+
+    def __init__(self, path, offset):
+        """Inits the FileSender.
+
+        Args:
+            path (str): The path to the file to send.
+            offset (int): The position in the file to start sending from.
+        """
+        self.path = path
+        self.offset = offset
+        self._file = open(path, 'rb')
+        self.remaining = max(os.fstat(self._file.fileno()).st_size - offset,
+                             0)
+
+    def send(self, s):
+        """Sends the next chunk of the file.
+
+        At most ``FILE_CHUNK_SIZE`` bytes are send. The bytes are send with
+        ``os.sendfile`` without copying them into the process, or read and
+        send if ``os.sendfile`` is not available.
+
+        Args:
+            s (:obj:`socket.socket`): The socket to send the file to.
+
+        Returns:
+            int: The number of bytes send.
+
+        Raises:
+            BlockingIOError: If the socket would block.
+        """
+        count = min(self.remaining, FILE_CHUNK_SIZE)
+        if hasattr(os, 'sendfile'):
+            sent = os.sendfile(s.fileno(), self._file.fileno(), self.offset,
+                               count)
+        else:
+            self._file.seek(self.offset)
+            sent = s.send(self._file.read(count))
+        self.offset += sent
+        self.remaining -= sent
+        if sent == 0 and count > 0:
+            # The file shrunk while sending it.
+            self.remaining = 0
+        return sent
+
+    @property
+    def done(self):
+        """bool: Whether the whole file is send."""
+        return self.remaining == 0
+
+    def close(self):
+        """Closes the file."""
+        self._file.close()
+
+    def __repr__(self):
+        return '<FileSender {} at {}>'.format(self.path, self.offset)
+
+
+class StreamReceiver:
+    """Receives the raw bytes following a stream command and discards them.
+
+    Args:
+        remaining (int): The number of bytes still to receive.
+    """
+
+    def __init__(self, length):
+        """Inits the StreamReceiver.
+
+        Args:
+            length (int): The number of bytes to receive.
+        """
+        self.remaining = length
+
+    def write(self, data):
+        """Receives bytes of the stream.
+
+        Args:
+            data (bytes-like object): The received data, which may continue
+                past the end of the stream.
+
+        Returns:
+            int: The number of bytes of the data that belong to the stream.
+        """
+        length = min(len(data), self.remaining)
+        if length > 0:
+            self._write(data[:length])
+            self.remaining -= length
+        return length
+
+    def _write(self, data):
+        """Handles bytes of the stream.
+
+        Args:
+            data (bytes-like object): The bytes of the stream.
+        """
+        pass
+
+    @property
+    def done(self):
+        """bool: Whether the whole stream is received."""
+        return self.remaining == 0
+
+    def close(self):
+        """Stops receiving the stream."""
+        pass
+
+
+class FileReceiver(StreamReceiver):
+    """Receives a stream into a partial file while calculating its digest.
+
+    The bytes are written to the path with extension ``.partial``. When the
+    whole file is received and the digest matches, the partial file is moved
+    to the path.
+
+    Args:
+        path (str): The path the file is received to.
+        digest (str): The expected hexadecimal SHA-256 digest of the file.
+        context (tuple): Data identifying the transfer for the server.
+    """
+
+    def __init__(self, path, offset, length, digest, context=None):
+        """Inits the FileReceiver.
+
+        The partial file is truncated to the offset and the digest of the
+        bytes already received is calculated.
+
+        Args:
+            path (str): The path to receive the file to.
+            offset (int): The number of bytes of the file already received.
+            length (int): The number of bytes to receive.
+            digest (str): The expected hexadecimal SHA-256 digest of the
+                complete file.
+            context (tuple, optional): Data identifying the transfer.
+
+        Raises:
+            ValueError: If less than offset bytes were received before.
+        """
+        super().__init__(length)
+        self.path = path
+        self.digest = digest
+        self.context = context
+        if partial_size(path) < offset:
+            raise ValueError('Partial file for {} is smaller than {} bytes.'
+                             .format(path, offset))
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._file = open(path + '.partial', 'a+b')
+        self._file.truncate(offset)
+        self._file.seek(0)
+        self._digest = hashlib.sha256()
+        for chunk in iter(lambda: self._file.read(FILE_CHUNK_SIZE), b''):
+            self._digest.update(chunk)
+
+    def _write(self, data):
+        self._file.write(data)
+        self._digest.update(data)
+
+    def finish(self):
+        """Finishes receiving the file.
+
+        Returns:
+            bool: True if the digest matches and the file is moved to its
+                path, False if the digest does not match and the partial file
+                is removed.
+        """
+        self._file.close()
+        if self._digest.hexdigest() != self.digest:
+            logger.warning('Digest of received file %s does not match.',
+                           self.path)
+            os.remove(self.path + '.partial')
+            return False
+        os.replace(self.path + '.partial', self.path)
+        return True
+
+    def close(self):
+        """Closes the partial file, so the transfer can be resumed later."""
+        self._file.close()
+
+    def __repr__(self):
+        return '<FileReceiver {} remaining {}>'.format(self.path,
+                                                       self.remaining)
@@ -0,0 +1,90 @@
+"""Tests for transfer.py."""
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import unittest
+
+from webarchiver.server import transfer
+from webarchiver.server.base import BaseServer, Node
+
+
+class StreamServer(BaseServer):
+    """A server receiving streamed files into a directory."""
+
+    def __init__(self, directory):
+        super().__init__('127.0.0.1')
+        self.directory = directory
+        self.received = []
+
+    def _command_warc_file_data(self, s, message):
+        s.receiver = transfer.FileReceiver(
+            os.path.join(self.directory, 'received'), message[3], message[4],
+            hashlib.sha256(self.data).hexdigest())
+
+    def _stream_received(self, s, receiver):
+        self.received.append(receiver.finish())
+
+
+class TestTransfer(unittest.TestCase):
+    """Tests for streaming a file between two nodes."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'file.warc.gz')
+        self.data = os.urandom(3 * 1048576 + 17)
+        with open(self.path, 'wb') as f:
+            f.write(self.data)
+        self.server = StreamServer(self.directory)
+        self.server.data = self.data
+        a, b = socket.socketpair()
+        self.sender = Node(a)
+        self.receiver = Node(b)
+        self.server._add_node(self.sender)
+        self.server._add_node(self.receiver)
+
+    def tearDown(self):
+        self.server._remove_node(self.sender)
+        self.server._remove_node(self.receiver)
+        self.server._socket.close()
+        shutil.rmtree(self.directory)
+
+    def send(self, offset):
+        self.server._write_socket_file(self.sender, self.path, offset,
+                                       'WARC_FILE_DATA', 'job_1', self.path,
+                                       offset)
+        self.server._write_socket_message(self.sender, 'PING')
+        for i in range(1000):
+            if len(self.server.received) > 0:
+                break
+            self.server._run_round()
+
+    def test_stream(self):
+        self.send(0)
+        self.assertListEqual(self.server.received, [True])
+        with open(os.path.join(self.directory, 'received'), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertIsNone(self.receiver.receiver)
+
+    def test_resume(self):
+        with open(os.path.join(self.directory, 'received.partial'),
+                  'wb') as f:
+            f.write(self.data[:1000])
+        self.send(1000)
+        self.assertListEqual(self.server.received, [True])
+        with open(os.path.join(self.directory, 'received'), 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_digest_mismatch(self):
+        with open(os.path.join(self.directory, 'received.partial'),
+                  'wb') as f:
+            f.write(b'x' * 1000)
+        self.send(1000)
+        self.assertListEqual(self.server.received, [False])
+        self.assertEqual(transfer.partial_size(
+            os.path.join(self.directory, 'received')), 0)
+
+    def test_file_digest(self):
+        self.assertEqual(transfer.file_digest(self.path),
+                         hashlib.sha256(self.data).hexdigest())
@@ -12,6 +12,23 @@ def init_urls(job_identifier, urls):
     return {url: UrlConfig(job_identifier, url, 0, None) for url in urls}
 
 
+def group_by_job(urlconfigs):
+    """Groups :class:`UrlConfig` objects by their job identifier.
+
+    Args:
+        urlconfigs (iterable of :obj:`UrlConfig`): The URL configurations to
+            group.
+
+    Returns:
+        dict: A dict with the job identifier as key and a list of
+            :class:`UrlConfig` objects as value.
+    """
+    groups = {}
+    for urlconfig in urlconfigs:
+        groups.setdefault(urlconfig.job_identifier, []).append(urlconfig)
+    return groups
+
+
 class UrlConfig:
     """The configuration for an URL.
 
@@ -1,14 +1,20 @@
 """WARC processing."""
-import hashlib
+import collections
+import concurrent.futures
+import contextlib
+import datetime
 import logging
 import os
 import re
-import time
-import urllib
+import shutil
+import tempfile
+import threading
+import urllib.parse
 
 from webarchiver.config import *
+from webarchiver.database import PayloadDeduplicationDatabase, payload_key
 from webarchiver.request import get
-from webarchiver.extractor.simple import extract_urls
+from webarchiver.extractor.registry import extract_urls, registry
 from webarchiver.utils import strip_url_scheme, sha512
 
 import warcio
@@ -17,6 +23,135 @@ from warcio.warcwriter import WARCWriter
 
 logger = logging.getLogger(__name__)
 
+_databases = threading.local()
+
+
+def payload_database(path=DEDUPLICATION_DATABASE):
+    """Gets the payload deduplication database of the current thread.
+
+    A database connection can only be used in the thread that created it, so
+    each thread opens the database once.
+
+    Args:
+        path (str, optional): The path of the database file. Default is
+            ``DEDUPLICATION_DATABASE``.
+
+    Returns:
+        :obj:`webarchiver.database.PayloadDeduplicationDatabase`: The
+            database, or None if `path` is None.
+    """
+    if path is None:
+        return None
+    databases = _databases.__dict__
+    if path not in databases:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        databases[path] = PayloadDeduplicationDatabase(path, 'payloads')
+    return databases[path]
+
+
+def record_is_duplicate(url, digest, database=DEDUPLICATION_DATABASE,
+                        remote=True):
+    """Checks if a record is a duplicate.
+
+    The digest and the URL stripped from its scheme are looked up in the local
+    payload deduplication database. If they are not found and
+    ``DEDUPLICATION_SERVER`` is set, the server is asked with
+    :func:`remote_record_is_duplicate` and a duplicate found is added to the
+    local database. If a duplicate is found the data from the other record
+    will be returned.
+
+    Args:
+        url (str): The URL of the WARC record to be deduplicated.
+        digest (str): The digest of the payload of the record to be
+            deduplicated. This should be a SHA-1 digest and the string
+            should start with ``sha1:``.
+        database (str, optional): The path of the local database, see
+            :func:`payload_database`. Default is ``DEDUPLICATION_DATABASE``.
+        remote (bool, optional): Whether to ask the deduplication server.
+            Default is True.
+
+    Returns:
+        tuple of (str, str): The date and URL of the WARC record that is being
+            deduplicated against. The date is formatted as ``WARC-Date``.
+        bool: False if the record is not found to be a duplicate record.
+    """
+    assert digest.startswith('sha1:')
+    logger.debug('Checking if record %s %s is a duplicate.', url, digest)
+    local = payload_database(database)
+    if local is not None:
+        duplicate = local.lookup(digest, url)
+        if duplicate is not None:
+            return duplicate
+    if not remote or DEDUPLICATION_SERVER is None:
+        return False
+    duplicate = remote_record_is_duplicate(url, digest)
+    if duplicate and local is not None:
+        local.insert(digest, duplicate[1], duplicate[0])
+    return duplicate
+
+
+def remote_record_is_duplicate(url, digest):
+    """Checks if a record is a duplicate with ``DEDUPLICATION_SERVER``.
+
+    The SHA-512 hash of a combination of the digest and the URL stripped
+    from its scheme is checked against previous hashes.
+
+    Args:
+        url (str): The URL of the WARC record to be deduplicated.
+        digest (str): The SHA-1 digest of the payload of the record, starting
+            with ``sha1:``.
+
+    Returns:
+        tuple of (str, str): The date and URL of the WARC record that is being
+            deduplicated against. The date is formatted as ``WARC-Date``.
+        bool: False if the record is not found to be a duplicate record.
+    """
+    digest = digest.split(':', 1)[1]
+    hashed = sha512('{};{}'.format(digest, strip_url_scheme(url)))
+    response = get(urllib.parse.urljoin(DEDUPLICATION_SERVER, hashed))
+    if not response or ';' not in response.text:
+        return False
+    date, target = response.text.split(';', 1)
+    try:
+        date = datetime.datetime.strptime(date, '%Y%m%d%H%M%S')
+    except ValueError:
+        logger.warning('Bad date %s from deduplication server.', date)
+        return False
+    return date.strftime('%Y-%m-%dT%H:%M:%SZ'), target.strip()
+
+
+def add_payload(url, digest, date, database=DEDUPLICATION_DATABASE):
+    """Adds the payload of a record to the local deduplication database.
+
+    Args:
+        url (str): The URL of the WARC record.
+        digest (str): The digest of the payload of the record.
+        date (str): The ``WARC-Date`` of the record.
+        database (str, optional): The path of the local database, see
+            :func:`payload_database`. Default is ``DEDUPLICATION_DATABASE``.
+    """
+    local = payload_database(database)
+    if local is not None and digest is not None:
+        local.insert(digest, url, date)
+
+
+def _target_uri(record):
+    """Gets the target URI of a WARC record.
+
+    Args:
+        record (:obj:`warcio.recordloader.ArcWarcRecord`): The WARC record.
+
+    Returns:
+        str: The ``WARC-Target-URI`` header, without the brackets around it
+            if it is found between <...>.
+    """
+    url = record.rec_headers.get_header('WARC-Target-URI')
+    if url is not None and url.startswith('<'):
+        url = re.search('^<(.+)>$', url).group(1)
+    return url
+
 
 class WarcFile:
     """Class to load and process a WARC file.
@@ -25,20 +160,27 @@ class WarcFile:
         warc_path (str): The path of the WARC file.
         warc_path_processes (str): The path of the WARC that is created after
             processing.
+        database (str): The path of the local payload deduplication
+            database, or None to only use ``DEDUPLICATION_SERVER``.
     """
 
-    def __init__(self, warc_path):
+    def __init__(self, warc_path, database=DEDUPLICATION_DATABASE):
         """Inits the :class:`WarcFile` object.
 
         Initializes the filenames of the initial and deduplicated WARC files.
 
         Args:
             warc_path (str): The path to the WARC file.
+            database (str, optional): The path of the local payload
+                deduplication database, see
+                :func:`webarchiver.warc.payload_database`. Default is
+                ``DEDUPLICATION_DATABASE``.
 
         Raises:
             FileNotFoundError: When the WARC file is not found.
         """
         self.warc_path = warc_path
+        self.database = database
         self.warc_path_processed = self.warc_path.rsplit('.', 2)[0] + \
             '-processed.warc.gz'
         if not os.path.isfile(self.warc_path):
@@ -53,51 +195,236 @@ class WarcFile:
         <...>,  the brackets are removed from around the URL.
 
         If the WARC is set to be deduplicated by setting `deduplicate` to True,
-        each response WARC record is deduplicated using
-        function :func:`self._record_is_duplicate`. If a duplicate is found,
-        the record is converted to a revisit record and written to the
-        deduplicated WARC file. If no deduplicate is found the original record
-        is written to the deduplicated WARC file.
+        each response WARC record is deduplicated, see :func:`_lookups`. If a
+        duplicate is found, the record is converted to a revisit record and
+        written to the deduplicated WARC file. If no deduplicate is found the
+        original record is written to the deduplicated WARC file and its
+        payload is added to the local deduplication database, see
+        :func:`_add_payloads`.
+        """
+        for _ in self._process(False):
+            pass
+
+    def process_urls(self):
+        """Processes the WARC file and extracts URLs in a single pass.
+
+        The records are processed as in :func:`process`. URLs are extracted
+        from each response record that is not converted to a revisit record
+        while it is processed, so the processed WARC file does not need to be
+        read again by :func:`extract_urls`.
+
+        Yields:
+            tuple of (parent URL, URL): The discovered URLs and their parent
+                URLs. The URLs have type str.
+        """
+        yield from self._process(True)
+
+    def _process(self, extract):
+        """Processes the WARC file, optionally extracting URLs.
+
+        Args:
+            extract (bool): Whether to extract URLs from the response records.
+
+        Yields:
+            tuple of (parent URL, URL): The discovered URLs and their parent
+                URLs if `extract` is True.
         """
         logger.info('Processing WARC file %s into WARC file %s.',
                     self.warc_path, self.warc_path_processed)
         if self.deduplicate:
             logger.info('Deduplicating WARC file %s into WARC file %s.',
                         self.warc_path, self.warc_path_processed)
-        with open(self.warc_path, 'rb') as f_in, \
+        payloads = {}
+        counts = dict.fromkeys(('records', 'duplicates', 'remote'), 0)
+        local = payload_database(self.database) if self.deduplicate else None
+        cache = (local.hits, local.misses) if local is not None else (0, 0)
+        remote = None
+        if self.deduplicate and DEDUPLICATION_SERVER is not None:
+            remote = concurrent.futures.ThreadPoolExecutor(
+                DEDUPLICATION_REMOTE_CONNECTIONS
+            )
+        try:
+            yield from self._process_records(extract, payloads, remote,
+                                             counts)
+        finally:
+            if remote is not None:
+                remote.shutdown(wait=False, cancel_futures=True)
+            self._add_payloads(payloads)
+            if local is not None:
+                counts['hits'] = local.hits - cache[0]
+                counts['misses'] = local.misses - cache[1]
+            registry.count_payloads(counts)
+
+    def _process_records(self, extract, payloads, remote, counts):
+        """Processes the records of the WARC file.
+
+        See :func:`_process`.
+
+        Args:
+            extract (bool): Whether to extract URLs from the response records.
+            payloads (dict): The payloads that are not yet added to the local
+                deduplication database, see :func:`_add_payloads`.
+            remote (:obj:`concurrent.futures.Executor`): The executor asking
+                ``DEDUPLICATION_SERVER``, or None to not ask it.
+            counts (dict): The number of payloads looked up by ``records``,
+                of duplicates found by ``duplicates`` and of lookups with
+                ``DEDUPLICATION_SERVER`` by ``remote``.
+
+        Yields:
+            tuple of (parent URL, URL): The discovered URLs and their parent
+                URLs if `extract` is True.
+        """
+        with contextlib.closing(self._lookups(remote)) as lookups, \
+                open(self.warc_path, 'rb') as f_in, \
                 open(self.warc_path_processed, 'wb') as f_out:
             writer = WARCWriter(filebuf=f_out, gzip=True)
             for record in ArchiveIterator(f_in):
-                url = record.rec_headers.get_header('WARC-Target-URI')
-                if url is not None and url.startswith('<'):
-                    url = re.search('^<(.+)>$', url).group(1)
+                url = _target_uri(record)
+                if url != record.rec_headers.get_header('WARC-Target-URI'):
                     record.rec_headers.replace_header('WARC-Target-URI', url)
-                if record.rec_headers.get_header('WARC-Type') in 'response' \
-                        and self.deduplicate:
+                response = record.rec_headers.get_header('WARC-Type') \
+                    == 'response'
+                if response and self.deduplicate:
                     digest = record.rec_headers \
                         .get_header('WARC-Payload-Digest')
                     logger.debug('Deduplicating record %s %s.', url, digest)
-                    duplicate = self._record_is_duplicate(url, digest)
+                    duplicate = next(lookups)
+                    if isinstance(duplicate, concurrent.futures.Future):
+                        counts['remote'] += 1
+                        duplicate = duplicate.result()
+                        if duplicate:
+                            payloads[payload_key(digest, duplicate[1])] = \
+                                duplicate
+                    if digest is not None:
+                        counts['records'] += 1
+                        duplicate = payloads.get(payload_key(digest, url)) \
+                            or duplicate
                     if not duplicate:
                         logger.debug('Record %s %s is not a duplicate.',
                                      url, digest)
-                        writer.write_record(record)
                     else:
                         logger.debug('Record %s %s is a duplicate.', url,
                                      digest)
+                        counts['duplicates'] += 1
                         writer.write_record(
                             self._record_response_to_revisit(writer, record,
                                                              duplicate)
                         )
-                else:
+                        continue
+                    if digest is not None:
+                        payloads[payload_key(digest, url)] = \
+                            record.rec_headers.get_header('WARC-Date'), url
+                    if len(payloads) >= DEDUPLICATION_BATCH_SIZE:
+                        self._add_payloads(payloads)
+                if not extract or not response:
+                    writer.write_record(record)
+                    continue
+                raw_stream = record.raw_stream
+                with tempfile.SpooledTemporaryFile(WARC_SPOOL_SIZE) as f_tmp:
+                    shutil.copyfileobj(raw_stream, f_tmp)
+                    f_tmp.seek(0)
+                    record.raw_stream = f_tmp
                     writer.write_record(record)
+                    f_tmp.seek(0)
+                    urls = extract_urls(url, record)
+                record.raw_stream = raw_stream
+                for s in urls:
+                    yield url, s
+
+    def _lookups(self, remote):
+        """Looks up the payloads of the response records of the WARC file.
+
+        The headers of the WARC file are read ahead of the records being
+        processed. The payloads of each ``DEDUPLICATION_BATCH_SIZE`` response
+        records are looked up in the local deduplication database with a
+        single query. Payloads not found are looked up with
+        ``DEDUPLICATION_SERVER`` by `remote` while the records before them are
+        processed, see :func:`remote_record_is_duplicate`.
+
+        Args:
+            remote (:obj:`concurrent.futures.Executor`): The executor asking
+                ``DEDUPLICATION_SERVER``, or None to not ask it.
+
+        Yields:
+            The date and URL of the record deduplicated against as tuple of
+                (str, str), None if the payload is not found or a
+                :obj:`concurrent.futures.Future` of the lookup with
+                ``DEDUPLICATION_SERVER``, for each response record in order.
+        """
+        lookups = collections.deque()
+        batch = []
+        with open(self.warc_path, 'rb') as f:
+            for record in ArchiveIterator(f):
+                if record.rec_headers.get_header('WARC-Type') != 'response':
+                    continue
+                batch.append((record.rec_headers
+                              .get_header('WARC-Payload-Digest'),
+                              _target_uri(record)))
+                if len(batch) < DEDUPLICATION_BATCH_SIZE:
+                    continue
+                lookups.extend(self._lookup_batch(batch, remote))
+                batch = []
+                while len(lookups) > DEDUPLICATION_BATCH_SIZE:
+                    yield lookups.popleft()
+        lookups.extend(self._lookup_batch(batch, remote))
+        yield from lookups
+
+    def _lookup_batch(self, batch, remote):
+        """Looks up a batch of payloads, see :func:`_lookups`.
+
+        Args:
+            batch (list of tuples): The digest and URL of each payload. The
+                digest is None if the record has no payload digest.
+            remote (:obj:`concurrent.futures.Executor`): The executor asking
+                ``DEDUPLICATION_SERVER``, or None to not ask it.
+
+        Returns:
+            list: The result of the lookup of each payload.
+        """
+        found = {}
+        local = payload_database(self.database)
+        if local is not None:
+            found = local.lookup_many((digest, url) for digest, url in batch
+                                      if digest is not None)
+        results = []
+        for digest, url in batch:
+            duplicate = None
+            if digest is not None:
+                duplicate = found.get(payload_key(digest, url))
+                if duplicate is None and remote is not None:
+                    duplicate = remote.submit(remote_record_is_duplicate,
+                                              url, digest)
+            results.append(duplicate)
+        return results
+
+    def _add_payloads(self, payloads):
+        """Adds payloads to the local deduplication database.
+
+        The payloads are inserted in one short transaction, so the other
+        processes using the database are not locked out while the WARC file is
+        processed. The payloads are removed from `payloads`.
+
+        Args:
+            payloads (dict): The date and URL of the record of each payload
+                by the key of the payload, see
+                :func:`webarchiver.database.payload_key`.
+        """
+        if len(payloads) == 0 or self.database is None:
+            payloads.clear()
+            return None
+        payload_database(self.database).insert_many(
+            (digest, url, date)
+            for (digest, _), (date, url) in payloads.items()
+        )
+        payloads.clear()
 
     def extract_urls(self):
         """Extracts URLs from the WARC file.
 
         The processed WARC file will be used if it exists, else the original
         WARC file is used. From each response record in the WARC file the URLs
-        are extracted.
+        are extracted with the extractor for its type, see
+        :mod:`webarchiver.extractor.registry`.
 
         Yields:
             tuple of (parent URL, URL): The discovered URLs and their parent
@@ -113,33 +440,6 @@ class WarcFile:
                     for s in extract_urls(url, record):
                         yield url, s
 
-    def _record_is_duplicate(self, url, digest):
-        """Checks if a record is a duplicate.
-
-        The SHA-512 hash of a combination of the digest and the URL stripped
-        from its scheme is checked against previous hashes. If a duplicate is
-        found the data from the other record will be returned.
-
-        Args:
-            url (str): The URL of the WARC record to be deduplicated.
-            digest (str): The digest of the payload of the record to be
-                deduplicated. This should be a SHA-1 digest and the string
-                should start with ``sha1:``.
-
-        Returns:
-            list: The data of WARC record that is being deduplicated against.
-            bool: False if the record is not found to be a duplicate record.
-        """ #TODO fix deduplication server #TODO add info on returned data
-        assert digest.startswith('sha1:')
-        logger.debug('Checking if record %s %s is a duplicate.', url, digest)
-        digest = digest.split(':', 1)[1]
-        hashed = sha512('{};{}'.format(digest, strip_url_scheme(url)))
-        response = get(urllib.parse.urljoin(DEDUPLICATION_SERVER,
-                                            hashed))
-        if not response or ';' not in response.text:
-            return False
-        return response.text.split(';', 1)
-
     def _record_response_to_revisit(self, writer, record, duplicate):
         """Converts a resonse WARC record to a revisit WARC record.
 
@@ -156,17 +456,14 @@ class WarcFile:
                 deduplicated WARC file.
             record (:obj:`warcio.recordloader.ArcWarcRecord`): The record that
                 should be converted to a revisit record.
-            duplicate (list): The data of the record that is being deduplicated
-                against.
+            duplicate (tuple of (str, str)): The date and URL of the record
+                that is being deduplicated against.
 
         Returns:
             :obj:`warcio.recordloader.ArcWarcRecord`: The revisit record.
         """ #TODO better logging. all header changes?
         warc_headers = record.rec_headers
-        warc_headers.replace_header('WARC-Refers-To-Date',
-                                    datetime.strptime(duplicate,
-                                                      '%Y%m%d%H%M%S') \
-                                            .strftime('%Y-%m-%DT%H:%M:%SZ'))
+        warc_headers.replace_header('WARC-Refers-To-Date', duplicate[0])
         warc_headers.replace_header('WARC-Refers-To-Target-URI', duplicate[1])
         warc_headers.replace_header('WARC-Type', 'revisit')
         warc_headers.replace_header('WARC-Truncated', 'length')
@@ -178,7 +475,7 @@ class WarcFile:
         return writer.create_warc_record(record.rec_headers \
                                                .get_header('WARC-Target-URI'),
                                          'revisit', warc_headers=warc_headers,
-                                         http_header=record.http_headers)
+                                         http_headers=record.http_headers)
 
     @property
     def deduplicate(self):
@@ -0,0 +1,200 @@
+"""Tests for warc.py."""
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from warcio.archiveiterator import ArchiveIterator
+from warcio.statusandheaders import StatusAndHeaders
+from warcio.warcwriter import WARCWriter
+
+from webarchiver import warc
+from webarchiver.config import *
+from webarchiver.database import PayloadDeduplicationDatabase
+from webarchiver.extractor.registry import registry
+from webarchiver.warc import WarcFile, payload_database
+
+PAGES = (
+    ('<http://example.com/>', b'<a href="/one">\n"http://example.org/two"'),
+    ('http://example.com/other', b'<a href="/three">'),
+)
+
+
+def write_warc(path, pages=PAGES):
+    """Writes a WARC file with a request and response record for each page.
+
+    Args:
+        path (str): The path of the WARC file.
+        pages (iterable of tuples, optional): The URL and body of each page.
+            Default is ``PAGES``.
+    """
+    with open(path, 'wb') as f:
+        writer = WARCWriter(filebuf=f, gzip=True)
+        for url, body in pages:
+            writer.write_record(writer.create_warc_record(
+                url, 'request', http_headers=StatusAndHeaders(
+                    'GET / HTTP/1.1', [('Host', 'example.com')],
+                    is_http_request=True
+                )
+            ))
+            writer.write_record(writer.create_warc_record(
+                url, 'response', payload=io.BytesIO(body), length=len(body),
+                http_headers=StatusAndHeaders('200 OK', [
+                    ('Content-Type', 'text/html'),
+                    ('Content-Length', str(len(body)))
+                ], protocol='HTTP/1.1')
+            ))
+
+
+def read_warc(path):
+    """Reads the records of a WARC file.
+
+    Args:
+        path (str): The path of the WARC file.
+
+    Returns:
+        list of tuples: The type, target URI and content of each record.
+    """
+    with open(path, 'rb') as f:
+        return [(record.rec_type,
+                 record.rec_headers.get_header('WARC-Target-URI'),
+                 record.content_stream().read())
+                for record in ArchiveIterator(f)]
+
+
+class TestWarcFile(unittest.TestCase):
+    """Tests for processing WARC files."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def warc_file(self, name, pages=PAGES):
+        """Creates a WARC file with the test pages.
+
+        Args:
+            name (str): The name of the WARC file.
+            pages (iterable of tuples, optional): The URL and body of each
+                page. Default is ``PAGES``.
+
+        Returns:
+            :obj:`webarchiver.warc.WarcFile`: The WARC file.
+        """
+        path = os.path.join(self.directory, name + '.warc.gz')
+        write_warc(path, pages)
+        return WarcFile(path, os.path.join(self.directory, 'payloads'))
+
+    def test_process_urls(self):
+        separate = self.warc_file('separate')
+        separate.process()
+        single = self.warc_file('single')
+        found = set(single.process_urls())
+        self.assertSetEqual(found, set(separate.extract_urls()))
+        self.assertIn(('http://example.com/', 'http://example.com/one'), found)
+        self.assertIn(('http://example.com/other', 'http://example.com/three'),
+                      found)
+        self.assertListEqual(read_warc(single.warc_path_processed),
+                             read_warc(separate.warc_path_processed))
+
+    def test_process(self):
+        warc_file = self.warc_file('test')
+        warc_file.process()
+        records = read_warc(warc_file.warc_path_processed)
+        self.assertListEqual([(type_, url) for type_, url, _ in records], [
+            ('request', 'http://example.com/'),
+            ('response', 'http://example.com/'),
+            ('request', 'http://example.com/other'),
+            ('response', 'http://example.com/other'),
+        ])
+        self.assertEqual(records[1][2], PAGES[0][1])
+
+    def test_deduplicate(self):
+        first = self.warc_file('first')
+        first.deduplicate = True
+        self.assertEqual(len(set(first.process_urls())), 3)
+        second = self.warc_file('second')
+        second.deduplicate = True
+        self.assertSetEqual(set(second.process_urls()), set())
+        records = read_warc(second.warc_path_processed)
+        self.assertListEqual([type_ for type_, _, _ in records],
+                             ['request', 'revisit', 'request', 'revisit'])
+
+    def test_deduplicate_unlocked(self):
+        warc_file = self.warc_file('first')
+        warc_file.deduplicate = True
+        urls = warc_file.process_urls()
+        next(urls)
+        con = sqlite3.connect(warc_file.database + '.db', timeout=0)
+        con.execute('INSERT INTO payloads VALUES (0, "", "", "", "")')
+        con.commit()
+        con.close()
+        self.assertEqual(len(set(urls)), 2)
+        database = PayloadDeduplicationDatabase(warc_file.database,
+                                                'payloads')
+        with open(warc_file.warc_path, 'rb') as f:
+            payloads = [(record.rec_headers.get_header('WARC-Payload-Digest'),
+                         record.rec_headers.get_header('WARC-Target-URI'))
+                        for record in ArchiveIterator(f)
+                        if record.rec_type == 'response']
+        self.assertEqual(len(database.lookup_many(payloads)), 2)
+        database.stop()
+
+    def test_batched_lookups(self):
+        pages = [('http://example.com/{}'.format(i),
+                  'page {}'.format(i).encode()) for i in range(250)]
+        first = self.warc_file('first', pages)
+        database = payload_database(first.database)
+        batches = []
+        lookup_many = database.lookup_many
+        database.lookup_many = lambda payloads: \
+            batches.append(list(payloads)) or lookup_many(batches[-1])
+        first.deduplicate = True
+        first.process()
+        second = self.warc_file('second', pages)
+        second.deduplicate = True
+        before = registry.counters()
+        second.process()
+        counts = registry.counters_since(before)['payloads']
+        size = DEDUPLICATION_BATCH_SIZE
+        self.assertListEqual([len(batch) for batch in batches],
+                             [size, size, 250 - 2 * size] * 2)
+        self.assertEqual(counts['records'], 250)
+        self.assertEqual(counts['duplicates'], 250)
+        self.assertEqual(counts['misses'], 250)
+        del database.lookup_many
+
+    def test_remote(self):
+        asked = []
+
+        def remote_record_is_duplicate(url, digest):
+            asked.append(url)
+            if url == 'http://example.com/':
+                return '2018-01-01T00:00:00Z', 'https://example.com/'
+            return False
+
+        server = warc.DEDUPLICATION_SERVER
+        remote = warc.remote_record_is_duplicate
+        warc.DEDUPLICATION_SERVER = 'http://deduplication.example.com/'
+        warc.remote_record_is_duplicate = remote_record_is_duplicate
+        try:
+            warc_file = self.warc_file('first')
+            warc_file.deduplicate = True
+            warc_file.process()
+        finally:
+            warc.DEDUPLICATION_SERVER = server
+            warc.remote_record_is_duplicate = remote
+        self.assertListEqual(sorted(asked), ['http://example.com/',
+                                             'http://example.com/other'])
+        records = read_warc(warc_file.warc_path_processed)
+        self.assertListEqual([type_ for type_, _, _ in records],
+                             ['request', 'revisit', 'request', 'response'])
+        with open(warc_file.warc_path, 'rb') as f:
+            digest = next(record.rec_headers.get_header('WARC-Payload-Digest')
+                          for record in ArchiveIterator(f)
+                          if record.rec_type == 'response')
+        self.assertIsNotNone(payload_database(warc_file.database)
+                             .lookup(digest, 'https://example.com/'))